@@ -1,7 +1,5 @@
 #!/usr/local/bin/python3
 from nmigen import *
-from nmigen.cli import main
-from nmigen.back import pysim, verilog
 
 class CMAG(Elaboratable):
     def __init__(self):
@@ -140,24 +138,21 @@ class BCD1_32(Elaboratable):
         return m
 
 if __name__ == "__main__":
-    bcd = BCD1_32()
-    print(verilog.convert(bcd, ports=[bcd.i_val, bcd.o_digit, bcd.o_rem]))
-    with pysim.Simulator(bcd,
-                         vcd_file=open("bcd.vcd", "w"),
-                         gtkw_file=open("bcd.gtkw", "w"),
-                         traces=[bcd.i_val, bcd.o_digit, bcd.o_rem]) as sim:
-        sim.add_clock(20e-9)
-        def bcd_proc():
-            yield
-            n = 9111222333
-            nbits = len(Const(n))
-            print(len(Const(n))) # 34 bits
-            yield bcd.mag.eq(9) # 1000000000
-            yield bcd.i_val.eq(Signal(nbits, reset=n))
-            yield
-            d=yield bcd.o_digit; r=yield bcd.o_rem
-            print('%s %s' % (d,r))
-            assert (d,r) == (9,111222333)
-        sim.add_sync_process(bcd_proc())
-        sim.run_until(1e-6, run_passive=True)
-        print('passed.')
+    import argparse
+    import random
+    import sys
+    from nmigen.back import verilog
+    import regression
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vcd", action="store_true",
+                        help="write bcd.vcd/bcd.gtkw for the edge cases (0, 10**mag, 10**(mag+1)-1)")
+    parser.add_argument("--verilog", action="store_true",
+                        help="print the Verilog of BCD1_32 (needs yosys)")
+    args = parser.parse_args()
+
+    if args.verilog:
+        bcd = BCD1_32()
+        print(verilog.convert(bcd, ports=[bcd.i_val, bcd.o_digit, bcd.o_rem]))
+    if args.vcd:
+        regression.sim_bcd((), regression.bcd_vectors((), 30, random.Random(0)), vcd="bcd")
+    sys.exit(1 if regression.main(['bcd'], workers=0) else 0)
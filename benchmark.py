@@ -0,0 +1,302 @@
+import json
+import sys
+import time
+
+import numpy as np
+from nmigen import *
+from nmigen.back import pysim
+
+from collatz import Collatz
+from collatz_model import CollatzModel
+from collatz_ref import delay, scan
+from collatz_np import delays
+from sim_trace import deep_memories, state_name
+
+# Cycle level numbers for the Collatz core and for Top.
+#
+# core: each variant is simulated on CORE_SEEDS, driven like Top drives it
+#       (start strobe, then wait for done); its cycles per seed have to
+#       equal collatz_ref's, which then projects them over REF_SEEDS. The
+#       same again with glide (Top's 'G' scan).
+# top:  Top with the real UART bit timing, over its first top_seeds seeds
+#       of the scan. Collatz is replaced by CollatzModel (same cycles, much
+#       faster to simulate). Reported are the cycles per seed beyond the
+#       core's (INC, CALC_START, ...) and the cycles per printed record.
+# burst: the same Top, sending the 'T' trajectory of BURST_SEED (about 2 KB,
+#       twice the UART FIFO). Reported is the fraction of cycles Top waits
+#       for the printer (printer input fifo full) and the printer waits for
+#       w_fifo (UART too slow). A scan never gets there, its records are
+#       too rare to fill the FIFOs.
+#
+# results() is a flat dict, compare() checks it against a baseline (e.g.
+# benchmark_baseline.json); any metric worse by more than 'tolerance'
+# (relative) is a regression, and so is a metric missing on either side. A
+# missing baseline is an error, unless one is being saved.
+
+CLOCK = 12e6
+CORE_SEEDS = range(1, 33)
+REF_SEEDS = (1, 1 << 16)
+CONFIGS = [(34, 12), (24, 10), (16, 8)]
+BURST_SEED = 77031 # 221 steps, a "%08x " each
+
+# core variants: name -> class with the Collatz interface
+VARIANTS = {
+    'collatz': Collatz,
+}
+
+# metric suffix -> +1 if larger is worse, -1 if smaller is worse
+METRICS = {
+    'cycles_per_seed': +1,
+    'seeds_per_second': -1,
+    'overhead_cycles': +1,
+    'cycles_per_record': +1,
+    'stall_fraction': +1,
+}
+
+def sim_core(core, seeds, glide=False):
+    # [(seed, out, err_x, err_n, cycles)], cycles counted like collatz_ref
+    res = []
+    deep_memories()
+    with pysim.Simulator(core) as sim:
+        sim.add_clock(1/CLOCK)
+        def proc():
+            yield core.glide.eq(glide)
+            for x in seeds:
+                yield core.ld_x.eq(x)
+                yield core.start.eq(1)
+                yield
+                yield core.start.eq(0)
+                cycles = 0
+                while True:
+                    yield
+                    cycles += 1
+                    if (yield core.done):
+                        break
+                # done is seen one cycle after the core got there
+                res.append((x, (yield core.out), (yield core.err_x), (yield core.err_n), cycles - 1))
+        sim.add_sync_process(proc())
+        sim.run()
+    return res
+
+def bench_core(variant, xwidth, nwidth):
+    key = 'core.%s.%d_%d.' % (variant, xwidth, nwidth)
+    t0 = time.time()
+    res = sim_core(VARIANTS[variant](xwidth, nwidth), CORE_SEEDS)
+    res_glide = sim_core(VARIANTS[variant](xwidth, nwidth), CORE_SEEDS, glide=True)
+    wall = time.time() - t0
+    exact = (all(r[1:] == delay(r[0], xwidth, nwidth) for r in res) and
+             all(r[1:] == delay(r[0], xwidth, nwidth, glide=True) for r in res_glide))
+    sim_cycles = sum(r[4] for r in res) / len(res)
+    seeds = np.arange(*REF_SEEDS, dtype=np.uint64)
+    ref_cycles = float(delays(seeds, xwidth, nwidth)[3].mean())
+    glide_cycles = float(delays(seeds, xwidth, nwidth, glide=True)[3].mean())
+    out = {
+        key + 'sim_cycles_per_seed': sim_cycles,
+        key + 'sim_matches_ref': exact,
+        key + 'sim_wall_seconds': wall,
+    }
+    if exact:
+        out[key + 'cycles_per_seed'] = ref_cycles
+        out[key + 'seeds_per_second'] = CLOCK / ref_cycles
+        out[key + 'glide_cycles_per_seed'] = glide_cycles
+        out[key + 'glide_seeds_per_second'] = CLOCK / glide_cycles
+    return out
+
+def bench_top(top_seeds, xwidth=34, nwidth=12):
+    # only Top needs collatz_driver and the UART modules
+    from collatz_driver import Top
+    from uart_wrapper_nmigen import DIVISOR
+    from uart_wrapper_sim import nmigen_cycles
+
+    collatz = CollatzModel(xwidth, nwidth)
+    top = Top(sim=True, sim_tx_cycle_accurate=True, xwidth=xwidth, nwidth=nwidth,
+              sim_tx_cycles=nmigen_cycles(DIVISOR), collatz=collatz)
+    fragment = Fragment.get(top, platform=None)
+    uart = top.uartfifo.uart
+    starts = [] # (cycle, seed) of every collatz.start
+
+    def host_proc():
+        yield uart.rx_data.eq(ord('A'))
+        yield uart.rx_rdy.eq(1)
+        yield
+        yield uart.rx_rdy.eq(0)
+
+    def monitor_proc():
+        cycle = 0
+        while len(starts) <= top_seeds:
+            if (yield collatz.start):
+                starts.append((cycle, (yield top.x)))
+            cycle += 1
+            yield
+
+    t0 = time.time()
+    deep_memories()
+    with pysim.Simulator(fragment) as sim:
+        sim.add_clock(1/CLOCK)
+        sim.add_sync_process(host_proc())
+        sim.add_sync_process(monitor_proc())
+        sim.add_sync_process(collatz.process())
+        # the model and the UART never finish, run until the monitor did
+        deadline = 0
+        while len(starts) <= top_seeds:
+            deadline += 1000/CLOCK
+            sim.run_until(deadline, run_passive=True)
+    wall = time.time() - t0
+
+    seeds = [x for (_, x) in starts[:-1]]
+    printed = {ev[-1] for ev in scan(seeds[0], seeds[-1] + 1, xwidth, nwidth)}
+    plain = []
+    records = []
+    for ((c0, x), (c1, _)) in zip(starts, starts[1:]):
+        extra = (c1 - c0) - delay(x, xwidth, nwidth)[3]
+        (records if x in printed else plain).append(extra)
+    key = 'top.%d_%d.' % (xwidth, nwidth)
+    out = {
+        key + 'seeds': len(seeds),
+        key + 'sim_wall_seconds': wall,
+    }
+    if plain:
+        out[key + 'overhead_cycles'] = sum(plain) / len(plain)
+    if records:
+        out[key + 'cycles_per_record'] = sum(records) / len(records)
+    return out
+
+def bench_burst(seed=BURST_SEED, xwidth=34, nwidth=12):
+    from collatz_client import encode
+    from collatz_driver import Top
+    from uart_wrapper_nmigen import DIVISOR
+    from uart_wrapper_sim import nmigen_cycles
+
+    collatz = CollatzModel(xwidth, nwidth)
+    top = Top(sim=True, sim_tx_cycle_accurate=True, xwidth=xwidth, nwidth=nwidth,
+              sim_tx_cycles=nmigen_cycles(DIVISOR), collatz=collatz)
+    fragment = Fragment.get(top, platform=None)
+    uart = top.uartfifo.uart
+    printer = top.uart_printer
+    # from the first byte of the line until Top is back in AWAIT_START and
+    # the printer has nothing left, i.e. all of it is in w_fifo
+    counts = {'cycles': 0, 'top_stall': 0, 'printer_stall': 0}
+    done = []
+
+    def host_proc():
+        for b in b'T' + encode(seed):
+            yield uart.rx_data.eq(b)
+            yield uart.rx_rdy.eq(1)
+            yield
+        yield uart.rx_rdy.eq(0)
+
+    def monitor_proc():
+        while True:
+            state = state_name(top.fsm.state, (yield top.fsm.state))
+            if state == 'T_1' or counts['cycles']:
+                pstate = state_name(printer.fsm.state, (yield printer.fsm.state))
+                if state == 'AWAIT_START' and pstate == 'READY' and not (yield printer.inputfifo.r_rdy):
+                    break
+                counts['cycles'] += 1
+                if state not in ('Q_START', 'Q_CALC') and not (yield printer.writable):
+                    counts['top_stall'] += 1
+                if pstate != 'READY' and not (yield printer.uartfifo.w_rdy):
+                    counts['printer_stall'] += 1
+            yield
+        done.append(True)
+
+    t0 = time.time()
+    deep_memories()
+    with pysim.Simulator(fragment) as sim:
+        sim.add_clock(1/CLOCK)
+        sim.add_sync_process(host_proc())
+        sim.add_sync_process(monitor_proc())
+        sim.add_sync_process(collatz.process())
+        deadline = 0
+        while not done:
+            deadline += 10000/CLOCK
+            sim.run_until(deadline, run_passive=True)
+    wall = time.time() - t0
+
+    key = 'top.%d_%d.burst_' % (xwidth, nwidth)
+    return {
+        key + 'cycles': counts['cycles'],
+        key + 'sim_wall_seconds': wall,
+        key + 'top_stall_fraction': counts['top_stall'] / counts['cycles'],
+        key + 'printer_stall_fraction': counts['printer_stall'] / counts['cycles'],
+    }
+
+def results(variants=None, configs=CONFIGS, top_seeds=8):
+    res = {}
+    for variant in variants or sorted(VARIANTS):
+        for (xwidth, nwidth) in configs:
+            res.update(bench_core(variant, xwidth, nwidth))
+    if top_seeds:
+        res.update(bench_top(top_seeds))
+        res.update(bench_burst())
+        # at scale records are rare: the core's cycles plus Top's per seed
+        base = res.get('core.collatz.34_12.cycles_per_seed')
+        over = res.get('top.34_12.overhead_cycles')
+        if base is not None and over is not None:
+            res['top.34_12.seeds_per_second'] = CLOCK / (base + over)
+    return res
+
+def _sign(key):
+    # METRICS sign of a compared key, None if it is only reported
+    if key.endswith('wall_seconds'):
+        return None
+    return next((s for (m, s) in METRICS.items() if key.endswith(m)), None)
+
+def compare(res, baseline, tolerance=0.01):
+    # list of regression messages, empty if none; a compared metric on one
+    # side only is one too (of the baseline only those of the variants and
+    # configurations that were measured, e.g. not 'top.' with top_seeds=0)
+    bad = []
+    for (key, value) in sorted(res.items()):
+        if key.endswith('sim_matches_ref') and value is not True:
+            bad.append('%s: simulated core disagrees with collatz_ref' % key)
+            continue
+        sign = _sign(key)
+        if sign is None:
+            continue
+        old = baseline.get(key)
+        if old is None:
+            bad.append('%s: %.4g, not in the baseline' % (key, value))
+        elif sign * (value - old) > tolerance * abs(old):
+            bad.append('%s: %.4g, baseline %.4g' % (key, value, old))
+    measured = {key.rsplit('.', 1)[0] for key in res}
+    for key in sorted(baseline):
+        if _sign(key) is not None and key not in res and key.rsplit('.', 1)[0] in measured:
+            bad.append('%s: not measured, baseline %.4g' % (key, baseline[key]))
+    return bad
+
+def report(res, baseline=None, file=sys.stdout):
+    for (key, value) in sorted(res.items()):
+        old = '' if baseline is None or key not in baseline else '  (baseline %.6g)' % baseline[key]
+        if isinstance(value, float):
+            print('%-44s %14.6g%s' % (key, value, old), file=file)
+        else:
+            print('%-44s %14s%s' % (key, value, old), file=file)
+
+def main(out="benchmark.json", baseline="benchmark_baseline.json", save_baseline=False,
+         variants=None, top_seeds=8, tolerance=0.01):
+    import os
+    if not save_baseline and not (baseline and os.path.exists(baseline)):
+        # fail before the simulations, not after
+        print('no baseline %s (in %s), write one with --save-baseline' % (baseline, os.getcwd()),
+              file=sys.stderr)
+        return 1
+    res = results(variants, top_seeds=top_seeds)
+    with open(out, 'w') as f:
+        json.dump(res, f, indent=1, sort_keys=True)
+    old = None
+    if not save_baseline:
+        with open(baseline) as f:
+            old = json.load(f)
+    report(res, old)
+    if save_baseline:
+        # wall times depend on the machine, they are not compared
+        with open(baseline, 'w') as f:
+            json.dump({k: v for (k, v) in res.items() if not k.endswith('wall_seconds')},
+                      f, indent=1, sort_keys=True)
+        print('baseline written to %s' % baseline)
+        return 0
+    bad = compare(res, old, tolerance)
+    for msg in bad:
+        print('REGRESSION ' + msg, file=sys.stderr)
+    return 1 if bad else 0
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+from nmigen._toolchain import require_tool
+from nmigen.back import rtlil, verilog
+from nmigen.build.run import BuildProducts
+
+# Content addressed cache of what synthesis produces, so that 'program' and
+# 'generate' of an unchanged design skip yosys/nextpnr/icepack.
+#
+# Entries live in root/<key>/, key being a hash of everything the toolchain
+# would see: for bitstreams the files of the nMigen build plan (RTLIL of the
+# elaborated design, pin constraints, toolchain scripts and options, nMigen
+# version), for Verilog the RTLIL alone; plus the design parameters
+# (xwidth, nwidth, ...) the caller passes in, which are also kept in the
+# entry's meta.json for 'list'. The RTLIL's src attributes (Python file and
+# line of every signal, also in the plan's debug Verilog) are left out of the
+# bitstream key, they do not reach the bitstream and would make every edit
+# of a comment a miss.
+#
+# When the entries together exceed max_bytes, the least recently used ones
+# are removed.
+
+ROOT = "build_cache"
+MAX_BYTES = 256 << 20
+
+# src attributes in RTLIL and in the debug Verilog of the build plan
+_SRC = re.compile(rb'^\s*attribute \\src .*\n|\(\* src = "[^"]*" \*\)\s*', re.MULTILINE)
+
+def _hash(files, params):
+    # files: {name: str or bytes}
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps(params, sort_keys=True).encode())
+    for name in sorted(files):
+        content = files[name]
+        if isinstance(content, str):
+            content = content.encode()
+        if name.endswith(('.il', '.v')):
+            content = _SRC.sub(b'', content)
+        h.update(name.encode() + b'\0')
+        h.update(hashlib.blake2b(content).digest())
+    return h.hexdigest()
+
+class CachedProducts(BuildProducts):
+    # build products from a cache entry, for Platform.toolchain_program()
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, filename, mode="b"):
+        super().get(filename, mode)
+        with open(os.path.join(self.path, filename), "r" + mode) as f:
+            return f.read()
+
+class BuildCache:
+    def __init__(self, root=ROOT, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        # CachedProducts of the entry, or None; marks the entry as used
+        path = self._path(key)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        os.utime(path)
+        return CachedProducts(path)
+
+    def put(self, key, files, params):
+        # files: {name: bytes}; written to a temporary directory first, so
+        # an interrupted put leaves no half entry
+        tmp = self._path(key + ".tmp%d" % os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        for (name, content) in files.items():
+            with open(os.path.join(tmp, name), "wb") as f:
+                f.write(content)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({'params': params, 'files': sorted(files), 'created': time.time()}, f)
+        if os.path.exists(self._path(key)):
+            shutil.rmtree(self._path(key))
+        os.replace(tmp, self._path(key))
+        self.evict(keep=key)
+        return CachedProducts(self._path(key))
+
+    def entries(self):
+        # [(key, bytes, last use, params)], most recently used first
+        res = []
+        if not os.path.isdir(self.root):
+            return res
+        for key in os.listdir(self.root):
+            path = self._path(key)
+            try:
+                with open(os.path.join(path, "meta.json")) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, n)) for n in os.listdir(path))
+            res.append((key, size, os.path.getmtime(path), meta['params']))
+        res.sort(key=lambda e: -e[2])
+        return res
+
+    def evict(self, keep=None):
+        total = 0
+        for (key, size, _, _) in self.entries():
+            total += size
+            if total > self.max_bytes and key != keep:
+                shutil.rmtree(self._path(key))
+                total -= size
+
+    def clear(self):
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+def build(platform, top, params, cache, name="top", build_dir="build", do_program=False):
+    # like platform.build(top, name, do_program=...), but the bitstream comes
+    # from the cache if this design was built before; returns (products, hit)
+    plan = platform.prepare(top, name)
+    params = dict(params, output="bitstream")
+    key = _hash(plan.files, params)
+    products = cache.get(key)
+    hit = products is not None
+    if not hit:
+        if not platform.has_required_tools():
+            for tool in platform.required_tools:
+                require_tool(tool)
+        products = plan.execute_local(build_dir)
+        files = {}
+        for ext in (".bin", ".il", ".rpt", ".tim"):
+            try:
+                files[name + ext] = products.get(name + ext)
+            except OSError:
+                pass
+        products = cache.put(key, files, params)
+    if do_program:
+        platform.toolchain_program(products, name)
+    return (products, hit)
+
+def convert(top, ports, platform, params, cache):
+    # like verilog.convert(top, ports=ports, platform=platform), cached;
+    # returns (verilog text, hit)
+    rtlil_text = rtlil.convert(top, ports=ports, platform=platform)
+    params = dict(params, output="verilog")
+    key = _hash({"rtlil": rtlil_text}, params)
+    products = cache.get(key)
+    hit = products is not None
+    if not hit:
+        text = verilog._convert_rtlil_text(rtlil_text)
+        products = cache.put(key, {"top.v": text.encode(), "top.il": rtlil_text.encode()}, params)
+    return (products.get("top.v", "t"), hit)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=ROOT,
+                        help="cache directory (default: %(default)s)")
+    p_action = parser.add_subparsers(dest="action")
+    p_action.add_parser("list")
+    p_action.add_parser("clear")
+    args = parser.parse_args()
+    cache = BuildCache(args.root)
+    if args.action == "list":
+        for (key, size, used, params) in cache.entries():
+            print('%s %8d %s %s' % (key, size, time.strftime('%Y-%m-%d %H:%M', time.localtime(used)),
+                                    ' '.join('%s=%s' % kv for kv in sorted(params.items()))))
+    elif args.action == "clear":
+        cache.clear()
@@ -1,9 +1,7 @@
 #!/usr/local/bin/python3
 from nmigen import *
-from nmigen.cli import main
-from nmigen.back import pysim, verilog
 
-from nmigen_boards.icebreaker import ICEBreakerPlatform
+from spram import SPRAM
 
 # N   X [cond]    start  rdy  avail | next_N  next_X  || notes
 # ----------------------------------+-----------------++---------------------------------
@@ -46,6 +44,15 @@ class Collatz(Elaboratable):
         # interface, input
         self.ld_x    = Signal(xwidth)
         self.start   = Signal()
+        self.glide   = Signal() # stop as soon as x < seed, out is the glide
+
+        # seed being computed, for glide
+        self.seed    = Signal(xwidth)
+
+        # interface, trajectory readout while rdy: mem[rd_addr] on rd_data
+        # one cycle later, the x (low xwidth bits) of the step at n = rd_addr
+        self.rd_addr = Signal(nwidth)
+        self.rd_data = Signal(xwidth)
 
         # current state
         self.x      = Signal(2*xwidth)
@@ -56,17 +63,23 @@ class Collatz(Elaboratable):
         self.next_n = Signal(nwidth)
 
         # internal, helpers
-        self.mem = Memory(width=xwidth, depth=(1 << nwidth))
+        # trajectory, single port: written while computing, read while rdy
+        self.mem = SPRAM(width=xwidth, depth=(1 << nwidth))
         self.nmax = (1 << nwidth) - 1 # e.g. 4 bit -> nmax = 15
         
     def elaborate(self, platform):
         m = Module()
-        m.submodules.wrport = wrport = self.mem.write_port()
+        m.submodules.mem = mem = self.mem
+        m.d.comb += [
+            mem.addr.eq(self.rd_addr),
+            self.rd_data.eq(mem.r_data),
+        ]
         
         # load
         with m.If(self.start):
             m.d.sync += [
                 self.x.eq(self.ld_x),
+                self.seed.eq(self.ld_x),
                 self.n.eq(0),
                 self.err_x.eq(0),
                 self.err_n.eq(0)
@@ -78,17 +91,22 @@ class Collatz(Elaboratable):
                     self.x.eq(self.next_x),
                     self.n.eq(self.next_n)
                 ]
+                with m.If(self.glide & (self.next_x < self.seed)):
+                    # fell below the seed: done, n is the glide
+                    m.d.sync += [
+                        self.x.eq(1)
+                    ]
+                m.d.comb += [
+                    # record x in RAM, every step but the final 1
+                    mem.addr.eq(self.n),
+                    mem.w_data.eq(self.x),
+                    mem.w_en.eq(1)
+                ]
             with m.Else():
                 m.d.comb += [
                     # output
                     self.out.eq(self.n),
                 ]
-            m.d.comb += [
-                # record x in RAM (last entry to record 1 itself, optional?)
-                wrport.addr.eq(self.n),
-                wrport.data.eq(self.x),
-                wrport.en.eq(1)                    
-            ]
                 
         # rdy, is 1 upon reset and after computations
         with m.If( (self.x == 0) | (self.x == 1) ):
@@ -144,271 +162,34 @@ class Collatz(Elaboratable):
             m.d.comb += [
                 self.next_x.eq(1), # stop sequence, will lead to done!
             ]
-            m.d.sync += [
-                self.err_n.eq(1)
-            ]
+            # only while computing: a sequence that ends at exactly n = nmax-1
+            # is not exhausted, and must not leave err_n set for the next load
+            with m.If(~self.start & (self.x > 1)):
+                m.d.sync += [
+                    self.err_n.eq(1)
+                ]
         return m
 
 if __name__ == "__main__":
-    collatz = Collatz(32, 10)
-    print(verilog.convert(collatz, ports=[collatz.ld_x, collatz.start, collatz.rdy]))
-    #print(verilog.convert(collatz, ports=[]))
-
-    with pysim.Simulator(collatz,
-                         vcd_file=open("collatz.vcd", "w"),
-                         gtkw_file=open("collatz.gtkw", "w"),
-                         traces=[collatz.ld_x, collatz.start, collatz.rdy]) as sim:
-        sim.add_clock(100e-9)
-
-        def collatz_proc():
-            # ---------
-            yield collatz.ld_x.eq(1)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (0)
-
-            # ---------
-            yield collatz.ld_x.eq(2)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (1)
-            
-            # ---------
-            yield collatz.ld_x.eq(3)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (7)
-
-            yield collatz.ld_x.eq(5)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (5)
-
-            yield collatz.ld_x.eq(11)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (14)
-
-
-            yield collatz.ld_x.eq(27)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (111)
-
-
-            yield collatz.ld_x.eq(97)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (118)
-
-
-            yield collatz.ld_x.eq(871)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (178)
-
-            yield collatz.ld_x.eq(6171)
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            print('%s %s %s' % (r,x,n))
-            assert (n) == (261)
-            
-        sim.add_sync_process(collatz_proc())
-        sim.run_until(100e-6, run_passive=True)
-        print('* Passed positive test cases.')
-
-    collatz = Collatz(32,6) # nwidth too small (6), expect err_n to be raised
-    with pysim.Simulator(collatz,
-                         traces=[collatz.ld_x, collatz.start, collatz.rdy]) as sim:
-        sim.add_clock(100e-9)
-
-        def collatz_proc():
-            # ---------
-            yield collatz.ld_x.eq(6176) # sequence length is 261, need 9 bits, giving it only 6
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            err_n=yield collatz.err_n
-            print('%s %s %s %s' % (r,x,n,err_n))
-            assert (err_n) == (1)
-        sim.add_sync_process(collatz_proc())
-        sim.run_until(100e-6, run_passive=True)
-        print('* Passed err_n test.')
-
-    collatz = Collatz(13,10) # 13 bit xwidth too small (needs 14), expect err_x to be raised
-    with pysim.Simulator(collatz,
-                         traces=[collatz.ld_x, collatz.start, collatz.rdy]) as sim:
-        sim.add_clock(100e-9)
-
-        def collatz_proc():
-            # ---------
-            yield collatz.ld_x.eq(27) # higest x in sequence would be 9232, needs 14 bits
-            yield collatz.start.eq(True)
-            yield
-            yield collatz.start.eq(False)
-            yield
-
-            r = yield collatz.rdy
-            cnt = 0
-            while not r == 1:
-                yield
-                r = yield collatz.rdy
-                cnt = cnt + 1
-            print('cycle counter = %d' % cnt)
-
-            r=yield collatz.rdy
-            x=yield collatz.x
-            n=yield collatz.n
-            err_x=yield collatz.err_x
-            print('%s %s %s %s' % (r,x,n,err_x))
-            assert (err_x) == (1)
-        sim.add_sync_process(collatz_proc())
-        sim.run_until(100e-6, run_passive=True)
-        print('* Passed err_x test.')
+    import argparse
+    import random
+    import sys
+    from nmigen.back import verilog
+    import regression
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vcd", action="store_true",
+                        help="write collatz.vcd/collatz.gtkw for the original test cases")
+    parser.add_argument("--verilog", action="store_true",
+                        help="print the Verilog of Collatz(32, 10) (needs yosys)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, 0: run here (default: one per core)")
+    args = parser.parse_args()
+
+    if args.verilog:
+        collatz = Collatz(32, 10)
+        print(verilog.convert(collatz, ports=[collatz.ld_x, collatz.start, collatz.rdy]))
+    if args.vcd:
+        vectors = regression.collatz_vectors((32, 10), len(regression.KNOWN_SEEDS), random.Random(0))
+        regression.sim_collatz((32, 10), vectors, vcd="collatz")
+    # all Collatz configurations of the regression suite
+    sys.exit(1 if regression.main(['collatz'], args.workers) else 0)
@@ -0,0 +1,248 @@
+import asyncio
+import collections
+import os
+
+from transcript import Transcript
+
+# asyncio client for the board's command mode (see collatz_driver.Top).
+#
+# Commands are a letter followed by numbers, each number sent as 5 bytes of
+# 7 bits, least significant first, with the top bit set (35 bits cover the
+# 34 bit seeds, and no data byte can be taken for a command, XON or XOFF):
+#
+#   'A'                start the endless scan (the board stops listening)
+#   'G'                the same for the glide (x below the seed) instead
+#                      of the delay: "G <index> <glide> <seed>" records,
+#                      N/X lines and a heartbeat "V <seed>" every 2**20
+#                      seeds (see transcript.py)
+#   'Q' seed           delay of one seed      -> "Q <out> <seed> <flags>"
+#   'R' start stop     scan start..stop-1     -> record and N/X lines, in
+#                                                the format of the scan but
+#                                                with the record state reset,
+#                                                then "E <length> <seed>"
+#
+#   'S'                status                 -> "S <seeds> <length> <seed>"
+#   'T' seed           trajectory of a seed   -> "T <out> <seed> <x> ...", the
+#                                                low 32 bits of the x before
+#                                                every step, in hex
+#   'P' seed           its parity vector      -> "P <out> <seed> <word> ...",
+#                                                a bit per step (1: odd x),
+#                                                32 to a hex word, LSB first
+#
+# The seeds the core gives up on (err_x, err_n) are finished by the
+# fallback unit in the background of 'A', 'G' and 'R' and come late: an
+# "F <index> <length> <seed>" line if a record (see transcript.py), N/X
+# lines only for the seeds the fallback gave up on as well. Only 'Q', 'T'
+# and 'P' answer from the core alone.
+#
+# Seed 0 never completes; 'Q', 'T', 'P' and 'R' of seed 0, and an 'R'
+# ending above 2**xwidth, are answered "? <command>" instead.
+#
+# The board works through the commands in the order they arrive and answers
+# each one in full before the next, so replies are matched to requests by
+# order alone. The client keeps up to 'window' requests in flight, so the
+# link carries the next requests while the board computes.
+
+NBYTES = 5 # bytes per number
+
+def encode(v):
+    assert 0 <= v < 1 << (7*NBYTES)
+    return bytes(0x80 | ((v >> (7*i)) & 0x7f) for i in range(NBYTES))
+
+def command(c, *numbers):
+    return c.encode('ascii') + b''.join(encode(v) for v in numbers)
+
+class ProtocolError(Exception):
+    pass
+
+class Client:
+    def __init__(self, reader, writer, window=64):
+        self.reader = reader
+        self.writer = writer
+        self.window = asyncio.Semaphore(window)
+        self.pending = collections.deque() # (cmd, future, collected lines)
+        self.unsolicited = asyncio.Queue() # lines no request waits for (scan output)
+        self.transcript = Transcript()
+        self._task = asyncio.ensure_future(self._read())
+
+    async def _request(self, cmd):
+        await self.window.acquire()
+        fut = asyncio.get_event_loop().create_future()
+        self.pending.append((cmd[0:1], fut, []))
+        self.writer.write(cmd)
+        await self.writer.drain()
+        try:
+            return await fut
+        finally:
+            self.window.release()
+
+    async def query(self, seed):
+        # (out, err_x, err_n) like collatz_ref.delay, without the cycles
+        if seed <= 0:
+            # the board rejects it, it would never finish (see collatz_ref.delay)
+            raise ValueError("seed must be > 0")
+        (_, out, _, flags) = await self._request(command('Q', seed))
+        return (out, flags >> 1 & 1, flags & 1)
+
+    async def query_many(self, seeds):
+        return await asyncio.gather(*(self.query(x) for x in seeds))
+
+    async def range(self, start, stop):
+        # (events, length, seed): the record ('R', index, length, seed) and
+        # error ('N'/'X', out, seed) events of the range in seed order (the
+        # fallback's F lines merged, see collatz_ref.in_order), counting
+        # records from an empty record state, and its longest delay and seed
+        from collatz_ref import in_order
+        if start <= 0:
+            raise ValueError("start must be > 0")
+        if stop <= start:
+            raise ValueError("stop must be > start")
+        (events, end) = await self._request(command('R', start, stop))
+        return (list(in_order(events)), end[1], end[2])
+
+    async def trajectory(self, seed, parity=True):
+        # (out, xs), xs the x before every step of seed, read back from the
+        # core's memory: parity, the full values rebuilt from the parity
+        # bits (checked against the seed); else the low 32 bits as sent
+        if seed <= 0:
+            raise ValueError("seed must be > 0")
+        (_, out, seed, values) = await self._request(command('P' if parity else 'T', seed))
+        if parity:
+            from collatz_ref import decode_parity
+            try:
+                return (out, decode_parity(seed, out, values))
+            except ValueError as e:
+                raise ProtocolError(str(e))
+        return (out, list(values))
+
+    async def status(self):
+        # (seeds computed since reset, longest delay, its seed)
+        return (await self._request(command('S')))[1:]
+
+    def start_scan(self, glide=False):
+        # from here on all output goes to self.unsolicited
+        self.writer.write(command('G' if glide else 'A'))
+
+    async def _read(self):
+        while True:
+            data = await self.reader.read(1 << 16)
+            if not data:
+                break
+            self.transcript.feed(data)
+            for ev in self.transcript.drain():
+                self._dispatch(ev)
+        self._fail(ProtocolError("connection closed"))
+
+    def _fail(self, err):
+        while self.pending:
+            (_, fut, _) = self.pending.popleft()
+            if not fut.done():
+                fut.set_exception(err)
+
+    def _dispatch(self, ev):
+        if not self.pending:
+            self.unsolicited.put_nowait(ev)
+            return
+        (cmd, fut, lines) = self.pending[0]
+        kind = ev[0]
+        if kind == '?' and ev[1].encode() == cmd:
+            # seed 0 or a range past 2**xwidth, see transcript.py
+            self.pending.popleft()
+            if not fut.cancelled():
+                fut.set_exception(ProtocolError("board rejected %r" % cmd))
+            return
+        if cmd == b'R' and kind in ('R', 'N', 'X', 'F'):
+            lines.append(ev)
+            return
+        if (cmd, kind) in ((b'Q', 'Q'), (b'S', 'S'), (b'T', 'T'), (b'P', 'P')):
+            result = ev
+        elif (cmd, kind) == (b'R', 'E'):
+            result = (lines, ev)
+        else:
+            self.unsolicited.put_nowait(ev)
+            self.pending.popleft()
+            if not fut.cancelled():
+                fut.set_exception(ProtocolError("unexpected %r for %r" % (ev, cmd)))
+            return
+        self.pending.popleft()
+        if not fut.cancelled():
+            fut.set_result(result)
+
+    async def close(self):
+        self.writer.close()
+        self._task.cancel()
+        self._fail(ProtocolError("client closed"))
+
+async def open_serial(port, baud=3000000, window=64):
+    # Client on a serial port; pyserial configures the tty (XON/XOFF is then
+    # handled by the driver) and asyncio reads and writes its file descriptor
+    import serial
+    ser = serial.Serial(port, baud, xonxoff=True, timeout=0)
+    loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                 os.fdopen(os.dup(ser.fileno()), 'rb', buffering=0))
+    (transport, protocol) = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(os.dup(ser.fileno()), 'wb', buffering=0))
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return Client(reader, writer, window)
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from collatz_ref import format_event
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", required=True, help="serial port of the board, e.g. /dev/ttyUSB1")
+    parser.add_argument("--baud", type=int, default=3000000)
+    parser.add_argument("--window", type=int, default=64,
+                        help="requests in flight (default: %(default)s)")
+    parser.add_argument("--cache", default=None,
+                        help="answer repeated queries from this result cache file")
+    parser.add_argument("--cache-size", type=int, default=1 << 20,
+                        help="seeds kept in the cache (default: %(default)s)")
+    p_action = parser.add_subparsers(dest="action")
+    p_query = p_action.add_parser("query", help="delays of single seeds")
+    p_query.add_argument("seeds", type=int, nargs="+")
+    p_range = p_action.add_parser("range", help="records of a seed range")
+    p_range.add_argument("start", type=int)
+    p_range.add_argument("stop", type=int)
+    p_action.add_parser("status")
+    p_traj = p_action.add_parser("trajectory", help="the steps of one seed, from the core's memory")
+    p_traj.add_argument("seed", type=int)
+    p_traj.add_argument("--raw", action="store_true",
+                        help="read the values (low 32 bits) instead of the parity vector")
+    args = parser.parse_args()
+
+    async def main():
+        client = await open_serial(args.port, args.baud, args.window)
+        t0 = time.time()
+        if args.action == "query":
+            queries = client
+            if args.cache:
+                from result_cache import ResultCache, CachedClient
+                cache = ResultCache(args.cache, args.cache_size)
+                queries = CachedClient(client, cache)
+            for (x, (out, err_x, err_n)) in zip(args.seeds, await queries.query_many(args.seeds)):
+                print('%d %d%s' % (x, out, ' N' if err_n else ' X' if err_x else ''))
+            if args.cache:
+                cache.save()
+                print('cache: %d hits, %d misses (%.1f%%), %d seeds' %
+                      (cache.hits, cache.misses, 100*cache.hit_rate(), len(cache)))
+        elif args.action == "range":
+            (events, length, seed) = await client.range(args.start, args.stop)
+            for ev in events:
+                print(format_event(ev))
+            print('longest %d %d' % (length, seed))
+        elif args.action == "trajectory":
+            (out, xs) = await client.trajectory(args.seed, parity=not args.raw)
+            print('%d %d' % (args.seed, out))
+            for x in xs:
+                print(('%08x' if args.raw else '%d') % x)
+        elif args.action == "status":
+            print('%d seeds, longest %d %d' % await client.status())
+        print('%.3f s' % (time.time() - t0))
+        await client.close()
+
+    asyncio.get_event_loop().run_until_complete(main())
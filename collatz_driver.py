@@ -1,18 +1,39 @@
 from nmigen import *
-from nmigen.cli import main
-from nmigen_boards.icebreaker import ICEBreakerPlatform
-from nmigen.back import pysim, verilog
 
 from collatz import Collatz
+from collatz_serial import SerialCollatz
 from uart_fifo import UART_FIFO
-from uart_printer import UART_Printer
+from uart_printer import UART_Printer, INPUT_FIFO_DEPTH
+import spram
+from uart_wrapper_nmigen import DIVISOR
 
 import argparse
+import contextlib
+import sys
+
+# the board files, the backends and the simulation helpers are imported by
+# the actions that use them, so e.g. 'search' or 'simulate' start without
+# loading nmigen_boards or yosys support
 
 (maxn,_) = Signal(range(0, 9999999999)).shape() # single digit billions, needs 34 bits
 
+UART_FIFO_DEPTH = 1024 # each direction
+HEARTBEAT = 20 # 'G' prints "V <seed>" every 2**HEARTBEAT seeds
+FALLBACK = (64, 16) # xwidth, nwidth of the fallback unit for the err_x/err_n seeds
+
+# Top.mode, where END goes next
+MODE_SCAN  = 0 # 'A', 'G', endless
+MODE_RANGE = 1 # 'R', until stop
+MODE_CMD   = 2 # 'Q', 'S', 'T', 'P', end of 'R': back to AWAIT_START
+
+def max_backlog(xwidth, nwidth):
+    # bytes of w_fifo that fit in the SPRAMs Collatz.mem leaves free
+    return (spram.BLOCKS - spram.blocks(xwidth, 1 << nwidth)) * spram.BLOCK_DEPTH
+
 class Top(Elaboratable):
-    def __init__(self, sim, sim_tx_cycle_accurate, xwidth, nwidth):
+    def __init__(self, sim, sim_tx_cycle_accurate, xwidth, nwidth, sim_tx_cycles=None,
+                 collatz=None, fifo_depth=UART_FIFO_DEPTH, printer_depth=INPUT_FIFO_DEPTH,
+                 divisor=DIVISOR, backlog=None, heartbeat=HEARTBEAT, fallback=FALLBACK):
         self.clk  = Signal()
         self.tx = Signal()
         self.rx = Signal()
@@ -26,11 +47,51 @@ class Top(Elaboratable):
         # sim helper
         self.sim = sim
         self.sim_tx_cycle_accurate = sim_tx_cycle_accurate
+        self.sim_tx_cycles = sim_tx_cycles
+        # None: the Collatz core, or a stand-in with the same interface
+        # (e.g. collatz_model.CollatzModel in simulation)
+        self.collatz = collatz
+        # build parameters, see sweep.py
+        self.fifo_depth = fifo_depth
+        self.printer_depth = printer_depth
+        self.divisor = divisor
+        self.backlog = backlog # bytes of w_fifo in SPRAM, None: block RAM, fifo_depth
+        if backlog is not None:
+            assert 0 < backlog <= max_backlog(xwidth, nwidth), \
+                "backlog of %d bytes, at most %d fit next to Collatz.mem" % (backlog, max_backlog(xwidth, nwidth))
+        self.heartbeat = heartbeat # log2 of the seeds per "V" line of 'G'
+        # (xwidth, nwidth) of a collatz_serial.SerialCollatz that finishes
+        # the seeds Collatz gives up on, None: print them as N and X lines
+        self.fallback = fallback
+        if fallback is not None:
+            assert fallback[0] >= xwidth and fallback[1] >= nwidth, "fallback narrower than Collatz"
 
         self.xmax = Signal(xwidth)
-        self.nmax = Signal(nwidth)
+        self.nmax = Signal(max(nwidth, fallback[1]) if fallback else nwidth)
         self.nmaxcnt = Signal(nwidth)
 
+        # command mode, see collatz_client.py for the protocol
+        self.mode = Signal(2) # what END returns to, MODE_*
+        self.cmd = Signal(8) # command whose numbers are being read
+        self.num = Signal(7*5) # number being read, 7 bits per byte, LSB first
+        self.numcnt = Signal(3) # bytes of num read so far
+        self.stop = Signal(xwidth+1) # end of the 'R' range (exclusive)
+        self.seeds = Signal(xwidth) # seeds computed since reset, for 'S'
+        self.glide = Signal() # 'G': Collatz stops below the seed, glide records
+        self.beat = Signal() # 'G': "V <x>" printed, x not incremented yet
+
+        # trajectory export ('T', 'P'), read back from Collatz.mem
+        self.taddr = Signal(nwidth) # n of the step being read
+        self.pvec = Signal(32) # 'P': parity bits of the word being filled, LSB first
+        self.pcnt = Signal(5) # 'P': bits in pvec
+
+        # fallback: one seed at a time, in the background of the scan
+        self.fb_pending = Signal() # a seed is in the fallback unit, not merged yet
+        self.fb_seed = Signal(xwidth) # that seed
+        self.fb_nmax = Signal(len(self.nmax)) # nmax of the seeds before it
+        self.fb_ret = Signal() # F_MERGE returns to FB_HAND, else INC
+        self.fb_kind = Signal(8) # line F_MERGE prints, 'F', 'N' or 'X'
+
     def elaborate(self, platform):
         m = Module()
         m.domains.sync = ClockDomain()
@@ -45,15 +106,26 @@ class Top(Elaboratable):
 
         self.uartfifo = uartfifo = UART_FIFO(sim=self.sim,
                                              sim_tx_cycle_accurate=self.sim_tx_cycle_accurate,
+                                             sim_tx_cycles=self.sim_tx_cycles,
                                              width=8,
-                                             depth=1024,
+                                             depth=self.fifo_depth,
+                                             divisor=self.divisor,
+                                             backlog=self.backlog,
                                              clk=clk12,
                                              board_uart=board_uart)
-        self.collatz = collatz = Collatz(xwidth, nwidth)
-        self.uart_printer = uart_printer = UART_Printer(uartfifo.w_fifo)
+        if self.collatz is None:
+            self.collatz = Collatz(self.xwidth, self.nwidth)
+        collatz = self.collatz
+        self.uart_printer = uart_printer = UART_Printer(uartfifo.w_fifo, self.printer_depth)
         m.submodules.uartfifo = uartfifo
         m.submodules.collatz = collatz
         m.submodules.uart_printer = uart_printer
+        if self.fallback is not None:
+            m.submodules.fallback = fallback = SerialCollatz(*self.fallback)
+            m.d.comb += [
+                fallback.ld_x.eq(self.x),
+                fallback.glide.eq(self.glide),
+            ]
 
         m.d.comb += [
             self.tx.eq(uartfifo.tx),
@@ -62,27 +134,131 @@ class Top(Elaboratable):
 
         m.d.comb += [
             self.collatz.ld_x.eq(self.x),
+            self.collatz.rd_addr.eq(self.taddr),
+            self.collatz.glide.eq(self.glide),
         ]
         with m.FSM(reset='AWAIT_START') as fsm:
+            self.fsm = fsm # for sim_trace.EventLog
             with m.State('AWAIT_START'):
                 with m.If(uartfifo.r_fifo.r_rdy):
-                    with m.If(uartfifo.r_fifo.r_data == 65):
-                        # A is the start character
+                    m.d.comb += [
+                        uartfifo.r_fifo.r_en.eq(1),
+                    ]
+                    m.d.sync += [
+                        self.cmd.eq(uartfifo.r_fifo.r_data),
+                        self.numcnt.eq(0)
+                    ]
+                    with m.Switch(uartfifo.r_fifo.r_data):
+                        with m.Case(ord('A')):
+                            # A is the start character, scan forever
+                            m.d.sync += [
+                                self.mode.eq(MODE_SCAN)
+                            ]
+                            m.next = 'INC'
+                        with m.Case(ord('G')):
+                            # G: scan forever, for the glide (stopping time)
+                            # of every seed, with a fresh record state
+                            m.d.sync += [
+                                self.mode.eq(MODE_SCAN),
+                                self.glide.eq(1),
+                                self.nmax.eq(0),
+                                self.nmaxcnt.eq(0),
+                                self.xmax.eq(0)
+                            ]
+                            m.next = 'INC'
+                        with m.Case(ord('Q'), ord('R'), ord('T'), ord('P')):
+                            m.next = 'NUM'
+                        with m.Case(ord('S')):
+                            m.d.sync += [
+                                self.mode.eq(MODE_CMD)
+                            ]
+                            m.next = 'S_1'
+                        with m.Default():
+                            # swallow and ignore
+                            m.next = 'AWAIT_START'
+
+            # numbers of Q and R: 5 bytes with the top bit set, LSB first
+            with m.State('NUM'):
+                with m.If(uartfifo.r_fifo.r_rdy):
+                    with m.If(uartfifo.r_fifo.r_data[7]):
                         m.d.comb += [
                             uartfifo.r_fifo.r_en.eq(1),
                         ]
-                        m.next = 'INC'
-                    with m.Else():
-                        # swallow and ignore
-                        m.d.comb += [
-                            uartfifo.r_fifo.r_en.eq(1)
+                        m.d.sync += [
+                            self.num.eq(Cat(self.num[7:], uartfifo.r_fifo.r_data[0:7])),
+                            self.numcnt.eq(self.numcnt + 1)
                         ]
+                        with m.If(self.numcnt == 4):
+                            m.next = 'NUM_DONE'
+                    with m.Else():
+                        # a command byte, the number was cut short; drop it
                         m.next = 'AWAIT_START'
+            with m.State('NUM_DONE'):
+                # seed 0 would never complete (Collatz: done stays low),
+                # neither would a range wrapping around to it; rejected
+                with m.If((self.num[:self.xwidth] == 0) & (self.cmd != ord('r')) |
+                          (self.num > (1 << self.xwidth)) & (self.cmd == ord('r'))):
+                    m.d.sync += [
+                        self.mode.eq(MODE_CMD)
+                    ]
+                    m.next = 'REJ_1'
+                with m.Elif((self.cmd == ord('Q')) | (self.cmd == ord('T')) | (self.cmd == ord('P'))):
+                    m.d.sync += [
+                        self.x.eq(self.num),
+                        self.mode.eq(MODE_CMD)
+                    ]
+                    m.next = 'Q_START'
+                with m.Elif(self.cmd == ord('R')):
+                    # R, first number: start of the range, fresh record state
+                    m.d.sync += [
+                        self.x.eq(self.num - 1),
+                        self.nmax.eq(0),
+                        self.nmaxcnt.eq(0),
+                        self.xmax.eq(0),
+                        self.numcnt.eq(0),
+                        self.cmd.eq(ord('r'))
+                    ]
+                    m.next = 'NUM'
+                with m.Else():
+                    # R (now 'r'), second number: end of the range
+                    m.d.sync += [
+                        self.stop.eq(self.num),
+                        self.mode.eq(MODE_RANGE)
+                    ]
+                    m.next = 'INC'
+
             with m.State('INC'):
-                m.d.sync += [
-                    self.x.eq(self.x + 1)
-                ]
-                m.next = 'CALC_START'
+                hb = (1 << self.heartbeat) - 1
+                with m.If(self.fb_pending & ((self.x[:self.heartbeat] == hb) |
+                                             ((self.mode == MODE_RANGE) & (self.x + 1 >= self.stop)))):
+                    # the fallback's seed is merged before a heartbeat and
+                    # the end of a range, so they cover it
+                    m.d.sync += [
+                        self.fb_ret.eq(0)
+                    ]
+                    m.next = 'F_MERGE'
+                with m.Elif(self.glide & (self.x[:self.heartbeat] == hb) & ~self.beat):
+                    # G: all seeds up to x fell below themselves (but for
+                    # the N and X lines), once every 2**heartbeat seeds
+                    m.d.sync += [
+                        self.beat.eq(1)
+                    ]
+                    m.next = 'V_1'
+                with m.Else():
+                    m.d.sync += [
+                        self.beat.eq(0)
+                    ]
+                    with m.If((self.mode == MODE_RANGE) & (self.x + 1 >= self.stop)):
+                        # x stays at the last seed, a scan goes on after it
+                        m.d.sync += [
+                            self.mode.eq(MODE_CMD)
+                        ]
+                        m.next = 'E_1'
+                    with m.Else():
+                        m.d.sync += [
+                            self.x.eq(self.x + 1)
+                        ]
+                        m.next = 'CALC_START'
             with m.State('CALC_START'):
                 m.d.comb += [
                     self.collatz.start.eq(1)
@@ -90,6 +266,9 @@ class Top(Elaboratable):
                 m.next = 'CALC'
             with m.State('CALC'):
                 with m.If(self.collatz.done):
+                    m.d.sync += [
+                        self.seeds.eq(self.seeds + 1)
+                    ]
                     with m.If(self.collatz.out > self.nmax):
                         m.d.sync += [
                             self.nmax.eq(self.collatz.out),
@@ -97,7 +276,13 @@ class Top(Elaboratable):
                             self.xmax.eq(self.x),
                         ]
                         # was a new record, print to terminal
-                        m.next = 'R_1'
+                        with m.If(self.glide):
+                            m.next = 'G_1'
+                        with m.Else():
+                            m.next = 'R_1'
+                    if self.fallback is not None:
+                        with m.Elif(self.collatz.err_n | self.collatz.err_x):
+                            m.next = 'FB_HAND'
                     with m.Elif(self.collatz.err_n):
                         m.next = 'ERR_N_1'
                     with m.Elif(self.collatz.err_x):
@@ -106,10 +291,118 @@ class Top(Elaboratable):
                         # not a new record sequence length, and neither an error
                         m.next = 'INC'
 
+            if self.fallback is not None:
+                # the seed Collatz gave up on goes to the fallback unit, once
+                # the one before it is merged; the scan goes on meanwhile
+                with m.State('FB_HAND'):
+                    with m.If(~self.fb_pending):
+                        m.d.comb += [
+                            fallback.start.eq(1)
+                        ]
+                        m.d.sync += [
+                            self.fb_pending.eq(1),
+                            self.fb_seed.eq(self.x),
+                            self.fb_nmax.eq(self.nmax)
+                        ]
+                        m.next = 'INC'
+                    with m.Else():
+                        m.d.sync += [
+                            self.fb_ret.eq(1)
+                        ]
+                        m.next = 'F_MERGE'
+                # the fallback's result into the record state, as if it had
+                # come in seed order: a record if it beats the seeds before
+                # fb_seed, "F <index> <length> <seed>" (the records printed
+                # since may not be any, see collatz_ref.in_order); N and X if
+                # the fallback gave up as well
+                with m.State('F_MERGE'):
+                    with m.If(fallback.done):
+                        m.d.sync += [
+                            self.fb_pending.eq(0)
+                        ]
+                        with m.If(fallback.out > self.fb_nmax):
+                            m.d.sync += [
+                                self.nmaxcnt.eq(self.nmaxcnt + 1),
+                                self.fb_kind.eq(ord('F'))
+                            ]
+                            with m.If(fallback.out >= self.nmax):
+                                m.d.sync += [
+                                    self.nmax.eq(fallback.out),
+                                    self.xmax.eq(self.fb_seed)
+                                ]
+                            m.next = 'F_1'
+                        with m.Elif(fallback.err_n):
+                            m.d.sync += [
+                                self.fb_kind.eq(ord('N'))
+                            ]
+                            m.next = 'F_1'
+                        with m.Elif(fallback.err_x):
+                            m.d.sync += [
+                                self.fb_kind.eq(ord('X'))
+                            ]
+                            m.next = 'F_1'
+                        with m.Elif(self.fb_ret):
+                            m.next = 'FB_HAND'
+                        with m.Else():
+                            m.next = 'INC'
+                with m.State('F_1'):
+                    with m.If(uart_printer.writable):
+                        p = Cat(self.fb_kind, Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                        m.d.comb += [
+                            uart_printer.din.eq(p),
+                            uart_printer.we.eq(1)
+                        ]
+                        with m.If(self.fb_kind == ord('F')):
+                            m.next = 'F_2'
+                        with m.Else():
+                            m.next = 'F_3'
+                with m.State('F_2'):
+                    with m.If(uart_printer.writable):
+                        m.d.comb += [
+                            uart_printer.din.eq( Cat(self.nmaxcnt, Signal(34-self.nwidth), Const(0x5)) ),
+                            uart_printer.we.eq(1)
+                        ]
+                        m.next = 'F_3'
+                with m.State('F_3'):
+                    with m.If(uart_printer.writable):
+                        m.d.comb += [
+                            uart_printer.din.eq( Cat(fallback.out, Signal(34-len(fallback.out)), Const(0x5)) ),
+                            uart_printer.we.eq(1)
+                        ]
+                        m.next = 'F_4'
+                with m.State('F_4'):
+                    with m.If(uart_printer.writable):
+                        m.d.comb += [
+                            uart_printer.din.eq( Cat(self.fb_seed, Const(0x5)) ),
+                            uart_printer.we.eq(1)
+                        ]
+                        m.next = 'F_END'
+                with m.State('F_END'):
+                    with m.If(uart_printer.writable):
+                        p = Cat(Signal(8,reset=13), Signal(8,reset=10), Signal(8,reset=7), Signal(8), Signal(2), Const(4))
+                        m.d.comb += [
+                            uart_printer.din.eq(p),
+                            uart_printer.we.eq(1)
+                        ]
+                        with m.If(self.fb_ret):
+                            m.next = 'FB_HAND'
+                        with m.Else():
+                            m.next = 'INC'
+
+            # G: "G <index> <glide> <seed>", otherwise like a record
+            with m.State('G_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(Signal(8,reset=ord('G')), Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'R_1'
+
             with m.State('R_1'):
                 with m.If(uart_printer.writable):
                     m.d.comb += [
-                        uart_printer.din.eq( Cat(self.nmaxcnt, Signal(34-nwidth), Const(0x5)) ),
+                        uart_printer.din.eq( Cat(self.nmaxcnt, Signal(34-self.nwidth), Const(0x5)) ),
                         uart_printer.we.eq(1)
                     ]
                     m.next = 'N_1'
@@ -117,7 +410,7 @@ class Top(Elaboratable):
             with m.State('N_1'):
                 with m.If(uart_printer.writable):
                     m.d.comb += [
-                        uart_printer.din.eq( Cat(self.nmax, Signal(34-nwidth), Const(0x5)) ),
+                        uart_printer.din.eq( Cat(self.nmax, Signal(34-len(self.nmax)), Const(0x5)) ),
                         uart_printer.we.eq(1)
                     ]
                     m.next = 'X_1'
@@ -152,7 +445,7 @@ class Top(Elaboratable):
             with m.State('ERR_N_2'):
                 with m.If(uart_printer.writable):
                     m.d.comb += [
-                        uart_printer.din.eq( Cat(self.collatz.out, Signal(34-nwidth), Const(0x5)) ),
+                        uart_printer.din.eq( Cat(self.collatz.out[:self.nwidth], Signal(34-self.nwidth), Const(0x5)) ),
                         uart_printer.we.eq(1)
                     ]
                     m.next = 'ERR_N_3'
@@ -177,7 +470,7 @@ class Top(Elaboratable):
             with m.State('ERR_X_2'):
                 with m.If(uart_printer.writable):
                     m.d.comb += [
-                        uart_printer.din.eq( Cat(self.collatz.out, Signal(34-nwidth), Const(0x5)) ),
+                        uart_printer.din.eq( Cat(self.collatz.out[:self.nwidth], Signal(34-self.nwidth), Const(0x5)) ),
                         uart_printer.we.eq(1)
                     ]
                     m.next = 'ERR_X_3'
@@ -198,54 +491,501 @@ class Top(Elaboratable):
                         uart_printer.din.eq(p),
                         uart_printer.we.eq(1)
                     ]
-                    m.next = 'INC'
+                    with m.If(self.mode == MODE_CMD):
+                        m.next = 'AWAIT_START'
+                    with m.Else():
+                        m.next = 'INC'
+
+            # rejected command: "? <command>", for Q/T/P 0, R 0 ... or an R
+            # range ending above 2**xwidth
+            with m.State('REJ_1'):
+                with m.If(uart_printer.writable):
+                    c = Mux(self.cmd == ord('r'), ord('R'), self.cmd)
+                    p = Cat(Signal(8,reset=ord('?')), Signal(8,reset=ord(' ')), c[:8], Signal(8,reset=ord(' ')), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'END'
+
+            # G heartbeat: "V <seed>"
+            with m.State('V_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(Signal(8,reset=ord('V')), Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'V_2'
+            with m.State('V_2'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.x, Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'END'
+
+            # Q: "Q <out> <seed> <flags>", flags is err_n + 2*err_x
+            with m.State('Q_START'):
+                m.d.comb += [
+                    self.collatz.start.eq(1)
+                ]
+                m.next = 'Q_CALC'
+            with m.State('Q_CALC'):
+                with m.If(self.collatz.done):
+                    m.d.sync += [
+                        self.seeds.eq(self.seeds + 1)
+                    ]
+                    with m.If(self.cmd == ord('Q')):
+                        m.next = 'Q_1'
+                    with m.Else():
+                        m.next = 'T_1'
+            with m.State('Q_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(Signal(8,reset=ord('Q')), Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'Q_2'
+            with m.State('Q_2'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.collatz.out[:self.nwidth], Signal(34-self.nwidth), Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'Q_3'
+            with m.State('Q_3'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.x, Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'Q_4'
+            with m.State('Q_4'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.collatz.err_n, self.collatz.err_x, Signal(32), Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'END'
+
+            # T: "T <out> <seed> <x> ...", the x before every step (the
+            # final 1 not included) in hex, their low 32 bits
+            # P: "P <out> <seed> <word> ...", one bit per step, 1 for an
+            # odd x, i.e. a (3x+1)/2 step (n + 2), in hex words of 32 steps,
+            # the first step in the LSB
+            # both walk the steps in Collatz.mem by n, until n reaches out
+            with m.State('T_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(self.cmd, Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'T_2'
+            with m.State('T_2'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.collatz.out[:self.nwidth], Signal(34-self.nwidth), Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'T_3'
+            with m.State('T_3'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.x, Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.d.sync += [
+                        self.taddr.eq(0),
+                        self.pvec.eq(0),
+                        self.pcnt.eq(0)
+                    ]
+                    m.next = 'T_ADDR'
+            # mem[taddr] is on rd_data from the next cycle on
+            with m.State('T_ADDR'):
+                with m.If(self.taddr < self.collatz.out[:self.nwidth]):
+                    m.next = 'T_DATA'
+                with m.Elif((self.cmd == ord('P')) & (self.pcnt != 0)):
+                    m.next = 'T_WORD'
+                with m.Else():
+                    m.next = 'END'
+            with m.State('T_DATA'):
+                with m.If(self.cmd == ord('P')):
+                    m.d.sync += [
+                        self.taddr.eq(self.taddr + 1 + self.collatz.rd_data[0]),
+                        self.pvec.eq(self.pvec | (self.collatz.rd_data[0] << self.pcnt)),
+                        self.pcnt.eq(self.pcnt + 1)
+                    ]
+                    with m.If(self.pcnt == 31):
+                        m.next = 'T_WORD'
+                    with m.Else():
+                        m.next = 'T_ADDR'
+                with m.Elif(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.collatz.rd_data[:32], Signal(2), Const(0x6)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.d.sync += [
+                        self.taddr.eq(self.taddr + 1 + self.collatz.rd_data[0])
+                    ]
+                    m.next = 'T_ADDR'
+            with m.State('T_WORD'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.pvec, Signal(2), Const(0x6)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.d.sync += [
+                        self.pvec.eq(0),
+                        self.pcnt.eq(0)
+                    ]
+                    m.next = 'T_ADDR'
+
+            # end of R: "E <length> <seed>", the longest in the range
+            with m.State('E_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(Signal(8,reset=ord('E')), Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'E_2'
+            with m.State('E_2'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.nmax, Signal(34-len(self.nmax)), Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'E_3'
+            with m.State('E_3'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.xmax, Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'END'
+
+            # S: "S <seeds> <length> <seed>", the record state is the one
+            # of the scan or of the last R
+            with m.State('S_1'):
+                with m.If(uart_printer.writable):
+                    p = Cat(Signal(8,reset=ord('S')), Signal(8,reset=ord(' ')), Signal(8), Signal(8), Signal(2), Const(4))
+                    m.d.comb += [
+                        uart_printer.din.eq(p),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'S_2'
+            with m.State('S_2'):
+                with m.If(uart_printer.writable):
+                    m.d.comb += [
+                        uart_printer.din.eq( Cat(self.seeds, Const(0x5)) ),
+                        uart_printer.we.eq(1)
+                    ]
+                    m.next = 'E_2'
         return m
 
 xwidth = 34 # to represent max decimal 9'999'999'999 (single digit trillion)
 nwidth = 12 # max sequence length = 2048
 
-def p():
+def build_params(top):
+    # what the build cache records (and keys on) besides the design itself
+    return dict(design="collatz_driver.Top", xwidth=top.xwidth, nwidth=top.nwidth, divisor=top.divisor,
+                uart_fifo_depth=top.fifo_depth, printer_fifo_depth=top.printer_depth,
+                collatz=type(top.collatz).__name__ if top.collatz is not None else "Collatz",
+                backlog=top.backlog, heartbeat=top.heartbeat, fallback=top.fallback)
+
+def p(cache=None, backlog=None):
+    from nmigen_boards.icebreaker import ICEBreakerPlatform
+    import build_cache
     # depth >4 leads to use of memory (4k primitive, see build/top.rpt)
-    top = Top(sim=False, sim_tx_cycle_accurate=False, xwidth=xwidth, nwidth=nwidth)
+    top = Top(sim=False, sim_tx_cycle_accurate=False, xwidth=xwidth, nwidth=nwidth, backlog=backlog)
     platform = ICEBreakerPlatform()
-    platform.build(top, do_program=True)
+    if cache is None:
+        platform.build(top, do_program=True)
+        return
+    (products, hit) = build_cache.build(platform, top, build_params(top), cache, do_program=True)
+    print('bitstream %s %s' % ('from' if hit else 'built, added to', products.path), file=sys.stderr)
 
-def g():
-    top = Top(sim=False, sim_tx_cycle_accurate=False, xwidth=xwidth, nwidth=nwidth)
+def g(cache=None, backlog=None):
+    from nmigen_boards.icebreaker import ICEBreakerPlatform
+    from nmigen.back import verilog
+    import build_cache
+    top = Top(sim=False, sim_tx_cycle_accurate=False, xwidth=xwidth, nwidth=nwidth, backlog=backlog)
     platform = ICEBreakerPlatform()
-    print(verilog.convert(top, ports=[top.tx, top.rx], platform=platform))
+    if cache is None:
+        print(verilog.convert(top, ports=[top.tx, top.rx], platform=platform))
+        return
+    (text, hit) = build_cache.convert(top, [top.tx, top.rx], platform, build_params(top), cache)
+    print(text)
 
-def s(tx_cycle_accurate=False):
-    top = Top(sim=True, sim_tx_cycle_accurate=tx_cycle_accurate, xwidth=xwidth, nwidth=nwidth)
+def s(tx_cycle_accurate=False, tx_cycles=1, duration=100*1e-6, out="top",
+      trace="all", signals=(), trace_start=0.0, trace_stop=None, trace_from_record=None,
+      events=None, model=False, latency=None, host=b'A', backend="pysim", backlog=None,
+      heartbeat=HEARTBEAT):
+    # the UART model drains w_fifo in both modes; 'simulate' completes a byte
+    # every tx_cycles cycles (transaction level), 'timing' matches the bit
+    # timing of UART_NMIGEN at the real (3 Mbaud) divisor.
+    #
+    # trace: "all" has pysim write every signal to top.vcd, "signals" only
+    # the named signals (e.g. "collatz.x") inside the trace_start/trace_stop
+    # window and from record trace_from_record on, "none" writes no vcd.
+    # events is the file name for a compact FSM transition/UART byte log.
+    #
+    # model replaces the Collatz core by collatz_model.CollatzModel, with
+    # results after 'latency' cycles (None: as many as the core would take).
+    #
+    # host are the bytes the host sends, one per cycle (default: start the
+    # scan), e.g. collatz_client.command('Q', 27).
+    #
+    # backend "verilator" or "icarus" simulates the Verilog of top instead
+    # (see sim_compiled.py), for trace "all" or "none" and without model.
+    #
+    # backlog: w_fifo as on the board with --backlog, the SPRAM model.
+    #
+    # heartbeat: log2 of the seeds per "V" line of a glide scan ('G'),
+    # e.g. 4 to see some in a short simulation.
+    from nmigen.back import pysim
+    from collatz_model import CollatzModel
+    from uart_wrapper_sim import nmigen_cycles
+    from transcript import Transcript, sim_collect
+    from sim_trace import SignalTracer, EventLog, resolve, fsm_states, deep_memories
+    if tx_cycle_accurate:
+        tx_cycles = nmigen_cycles(DIVISOR)
+    collatz = None
+    if model:
+        collatz = CollatzModel(xwidth, nwidth, latency=latency)
+    top = Top(sim=True, sim_tx_cycle_accurate=True, xwidth=xwidth, nwidth=nwidth,
+              sim_tx_cycles=tx_cycles, collatz=collatz, backlog=backlog, heartbeat=heartbeat)
+    period = 83e-9
+    transcript = Transcript()
+    if backend != "pysim":
+        import sim_compiled
+        sim_compiled.run(top, backend, int(round(duration/period)), host, transcript,
+                         vcd="top.vcd" if trace == "all" else None)
+        summary(transcript, duration, out)
+        return
     # in simulation we set the platform to None
     platform = None # ICEBreakerPlatform()
     fragment = Fragment.get(top, platform=platform)
-    with open("top.vcd", "w") as vcd_file:
-        with pysim.Simulator(fragment, vcd_file=vcd_file) as sim:
-            sim.add_clock(83e-9)
-            def driver_proc():
-                # ---------
-                yield top.uartfifo.uart.rx_data.eq(65)
+    vcd_file = None
+    tracer = None
+    event_file = None
+    if trace == "all":
+        vcd_file = open("top.vcd", "w")
+    elif trace == "signals":
+        trigger = None
+        if trace_from_record is not None:
+            trigger = (top.nmaxcnt, trace_from_record)
+        tracer = SignalTracer(open("top.vcd", "w"),
+                              [(name, resolve(top, name)) for name in signals],
+                              period, start=trace_start, stop=trace_stop, trigger=trigger)
+    deep_memories()
+    with pysim.Simulator(fragment, vcd_file=vcd_file) as sim:
+        sim.add_clock(period)
+        def driver_proc():
+            # ---------
+            for b in host:
+                yield top.uartfifo.uart.rx_data.eq(b)
                 yield top.uartfifo.uart.rx_rdy.eq(1)
                 yield
-                yield top.uartfifo.uart.rx_rdy.eq(0)
-            sim.add_sync_process(driver_proc())
-            sim.run_until(100*1e-6, run_passive=True)
-            # sim.run_until(30*1000*1e-6, run_passive=True)
+            yield top.uartfifo.uart.rx_rdy.eq(0)
+        sim.add_sync_process(driver_proc())
+        sim.add_sync_process(sim_collect(transcript, top.uartfifo.uart))
+        if model:
+            sim.add_sync_process(collatz.process())
+        if tracer:
+            sim.add_sync_process(tracer.process())
+        if events:
+            event_file = open(events, "w")
+            sim.add_sync_process(EventLog(event_file, fsm_states(top), top.uartfifo.uart, period).process())
+        sim.run_until(duration, run_passive=True)
+        # sim.run_until(30*1000*1e-6, run_passive=True)
+    if vcd_file:
+        vcd_file.close()
+    if tracer:
+        tracer.close()
+        tracer.vcd_file.close()
+    if event_file:
+        event_file.close()
+    summary(transcript, duration, out)
+
+def summary(transcript, duration, out):
+    # what the terminal would have shown, and the records parsed from it
+    transcript.write(out + ".txt", out + ".records")
+    st = transcript.stats(duration)
+    print('%d bytes, %d records, %d errors in %g s simulated time' %
+          (st['bytes'], st['records'], st['errors'], duration))
+    print('%.1f records/s (simulated), %.1f bytes/record' %
+          (st['records_per_second'], st['bytes_per_record']))
+    print('transcript: %s.txt, records: %s.records' % (out, out))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true",
+                        help="report the elaboration time per submodule, lowering, compilation and peak memory on stderr")
     p_action = parser.add_subparsers(dest="action")
-    p_action.add_parser("simulate")
-    p_action.add_parser("timing")
-    p_action.add_parser("generate")
-    p_action.add_parser("program")
+    p_simulate = p_action.add_parser("simulate")
+    p_simulate.add_argument("--tx-cycles", type=int, default=1,
+                            help="cycles per UART byte (default: %(default)s)")
+    p_timing = p_action.add_parser("timing")
+    for p_sim in (p_simulate, p_timing):
+        p_sim.add_argument("--us", type=float, default=100,
+                           help="simulated time in microseconds (default: %(default)s)")
+        p_sim.add_argument("--out", default="top",
+                           help="basename of the .txt transcript and .records files (default: %(default)s)")
+        p_sim.add_argument("--trace", choices=["all", "signals", "none"], default="all",
+                           help="what to write to top.vcd (default: %(default)s)")
+        p_sim.add_argument("--signals", default="",
+                           help="comma separated signals for --trace signals, e.g. collatz.x,nmax,uart_printer.fsm.state")
+        p_sim.add_argument("--trace-from-us", type=float, default=0.0,
+                           help="--trace signals: start of the trace window")
+        p_sim.add_argument("--trace-until-us", type=float, default=None,
+                           help="--trace signals: end of the trace window")
+        p_sim.add_argument("--trace-from-record", type=int, default=None,
+                           help="--trace signals: open the window at the N-th record")
+        p_sim.add_argument("--events", default=None,
+                           help="write FSM state transitions and UART bytes to this file")
+        p_sim.add_argument("--model", action="store_true",
+                           help="replace the Collatz core by its Python functional model")
+        p_sim.add_argument("--latency", type=int, default=None,
+                           help="--model: cycles per seed (default: as many as the core)")
+        p_sim.add_argument("--commands", nargs="+", default=None,
+                           help="send these commands instead of A, e.g. 'Q 27' 'R 1 1000' S 'P 27'")
+        p_sim.add_argument("--backend", choices=["auto", "pysim", "verilator", "icarus"], default="auto",
+                           help="simulator; auto: verilator or icarus if installed and the options allow, "
+                                "else pysim (default: %(default)s)")
+        p_sim.add_argument("--backlog", type=int, default=None,
+                           help="UART output FIFO in (modelled) SPRAM, like generate/program --backlog")
+        p_sim.add_argument("--heartbeat", type=int, default=HEARTBEAT,
+                           help="G: a \"V <seed>\" line every 2**N seeds (default: %(default)s)")
+    p_generate = p_action.add_parser("generate")
+    p_program = p_action.add_parser("program")
+    for p_build in (p_generate, p_program):
+        p_build.add_argument("--no-cache", action="store_true",
+                             help="always run the toolchain, bypassing build_cache")
+        p_build.add_argument("--cache-dir", default=None,
+                             help="build cache directory (default: build_cache.ROOT)")
+        p_build.add_argument("--cache-mb", type=int, default=None,
+                             help="evict the least recently used builds above this size (default: build_cache.MAX_BYTES)")
+        p_build.add_argument("--backlog", type=int, default=None,
+                             help="bytes of the UART output FIFO, in SPRAM (up to %d, next to Collatz.mem; "
+                                  "default: %d in block RAM)" % (max_backlog(xwidth, nwidth), UART_FIFO_DEPTH))
+    p_search = p_action.add_parser("search", help="scan a seed range in software, on all cores "
+                                                     "(with the board's fallback for err_x/err_n seeds)")
+    p_search.add_argument("--start", type=int, default=1)
+    p_search.add_argument("--stop", type=int, default=1 << 24)
+    p_search.add_argument("--workers", type=int, default=None,
+                          help="worker processes (default: one per core)")
+    p_search.add_argument("--chunk", type=int, default=1 << 20,
+                          help="seeds per work item (default: %(default)s)")
+    p_search.add_argument("--cache-bits", type=int, default=22,
+                          help="share the delays of all seeds below 2**N (default: %(default)s)")
+    p_bench = p_action.add_parser("benchmark", help="cycle level numbers of the core and Top, against a baseline")
+    p_bench.add_argument("--out", default="benchmark.json",
+                         help="write the results here (default: %(default)s)")
+    p_bench.add_argument("--baseline", default="benchmark_baseline.json",
+                         help="compare against this file if it exists (default: %(default)s)")
+    p_bench.add_argument("--save-baseline", action="store_true",
+                         help="write the results to --baseline instead of comparing")
+    p_bench.add_argument("--variant", action="append", default=None,
+                         help="core variant to measure, repeat for more (default: all of benchmark.VARIANTS)")
+    p_bench.add_argument("--top-seeds", type=int, default=8,
+                         help="seeds of the Top simulation, 0: skip it and the T burst (default: %(default)s)")
+    p_bench.add_argument("--tolerance", type=float, default=0.01,
+                         help="relative change that counts as a regression (default: %(default)s)")
+    p_sweep = p_action.add_parser("sweep", help="build Top over a parameter grid, resources and seeds/s")
+    p_sweep.add_argument("--variant", nargs="+", default=None,
+                         help="core variants (default: all of benchmark.VARIANTS)")
+    p_sweep.add_argument("--xwidth", type=int, nargs="+", default=None)
+    p_sweep.add_argument("--nwidth", type=int, nargs="+", default=None)
+    p_sweep.add_argument("--fifo-depth", type=int, nargs="+", default=None,
+                         help="UART FIFO depths (default: see sweep.GRID)")
+    p_sweep.add_argument("--printer-depth", type=int, nargs="+", default=None,
+                         help="printer command FIFO depths (default: see sweep.GRID)")
+    p_sweep.add_argument("--divisor", type=int, nargs="+", default=None,
+                         help="UART clock cycles per bit (default: see sweep.GRID)")
+    p_sweep.add_argument("--workers", type=int, default=None,
+                         help="worker processes (default: one per core)")
+    p_sweep.add_argument("--no-build", action="store_true",
+                         help="only the cycles, do not run the toolchain")
+    p_sweep.add_argument("--json", default=None,
+                         help="also write the results to this file")
     args = parser.parse_args()
-    if args.action == "generate":
-        g()
-    elif args.action == "simulate":
-        s(tx_cycle_accurate=False)
-    elif args.action == "timing":
-        s(tx_cycle_accurate=True)
-    elif args.action == "program":
-        p()
+    if getattr(args, "backlog", None) is not None and not 0 < args.backlog <= max_backlog(xwidth, nwidth):
+        parser.error("--backlog must be 1..%d, the SPRAMs next to Collatz.mem" % max_backlog(xwidth, nwidth))
+    if args.action in ("simulate", "timing"):
+        if args.trace == "signals" and not args.signals:
+            parser.error("--trace signals needs --signals")
+        trace_stop = None
+        if args.trace_until_us is not None:
+            trace_stop = args.trace_until_us*1e-6
+        trace_args = dict(out=args.out, trace=args.trace,
+                          signals=[n for n in args.signals.split(",") if n],
+                          trace_start=args.trace_from_us*1e-6, trace_stop=trace_stop,
+                          trace_from_record=args.trace_from_record, events=args.events,
+                          model=args.model, latency=args.latency, backlog=args.backlog,
+                          heartbeat=args.heartbeat)
+        if args.commands:
+            from collatz_client import command
+            cmds = [c.split() for c in args.commands]
+            trace_args['host'] = b''.join(command(c[0], *map(int, c[1:])) for c in cmds)
+        # the compiled simulators only see the Verilog
+        pysim_only = args.trace == "signals" or args.events or args.model
+        backend = "pysim"
+        if args.backend not in ("auto", "pysim"):
+            if pysim_only:
+                parser.error("--trace signals, --events and --model need --backend pysim")
+        if args.backend != "pysim" and not pysim_only:
+            import sim_compiled
+            backend = sim_compiled.available(None if args.backend == "auto" else args.backend)
+            if backend is None:
+                if args.backend != "auto":
+                    print("%s (or yosys) not found, simulating with pysim" % args.backend, file=sys.stderr)
+                backend = "pysim"
+        if backend != "pysim":
+            print("simulating with %s" % backend, file=sys.stderr)
+        trace_args['backend'] = backend
+    if args.action in ("generate", "program") and not args.no_cache:
+        import build_cache
+        cache = build_cache.BuildCache(args.cache_dir or build_cache.ROOT,
+                                       build_cache.MAX_BYTES if args.cache_mb is None else args.cache_mb << 20)
+    else:
+        cache = None
+    if args.profile:
+        import elab_profile
+        profile = elab_profile.Profile()
+    else:
+        profile = contextlib.nullcontext()
+    with profile:
+        if args.action == "generate":
+            g(cache, args.backlog)
+        elif args.action == "simulate":
+            s(tx_cycle_accurate=False, tx_cycles=args.tx_cycles, duration=args.us*1e-6, **trace_args)
+        elif args.action == "timing":
+            s(tx_cycle_accurate=True, duration=args.us*1e-6, **trace_args)
+        elif args.action == "program":
+            p(cache, args.backlog)
+        elif args.action == "search":
+            from collatz_search import search
+            from collatz_ref import format_event
+            for ev in search(args.start, args.stop, xwidth, nwidth, workers=args.workers,
+                             chunk=args.chunk, cache_size=1 << args.cache_bits, fallback=FALLBACK):
+                print(format_event(ev), flush=True)
+        elif args.action == "benchmark":
+            import benchmark
+            sys.exit(benchmark.main(out=args.out, baseline=args.baseline, save_baseline=args.save_baseline,
+                                    variants=args.variant, top_seeds=args.top_seeds, tolerance=args.tolerance))
+        elif args.action == "sweep":
+            import json
+            import sweep
+            grid = dict(sweep.GRID)
+            for key in grid:
+                if getattr(args, key) is not None:
+                    grid[key] = getattr(args, key)
+            results = sweep.sweep(grid, args.workers, build=False if args.no_build else None)
+            sweep.report(results)
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump([dict(config, **res) for (config, res) in results], f, indent=1)
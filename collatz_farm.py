@@ -0,0 +1,132 @@
+import asyncio
+import sys
+
+from collatz_client import ProtocolError
+
+# Runs one seed range on several boards (collatz_client.Client each, real or
+# soft_board) at once.
+#
+# The range is cut into chunks, every board works on up to 'depth' chunks
+# at a time ('R' commands, pipelined), taking the next chunk from a shared
+# queue as soon as one is answered, so faster boards get more. A board that
+# does not answer a chunk within 'timeout' seconds (which includes waiting
+# behind its other depth-1 chunks) or whose link fails is dropped, and its
+# unanswered chunks go back to the queue for the others. The chunks' local
+# records are merged in seed order into the global record sequence, the
+# same events as collatz_ref.scan() / collatz_search.search().
+
+class Board:
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.chunks = 0
+        self.seeds = 0
+        self.dead = False
+
+async def run(boards, start, stop, chunk=1 << 16, timeout=None, depth=2):
+    # async generator of ('R', index, length, seed), ('N'/'X', out, seed)
+    assert start >= 1
+    bounds = [(lo, min(lo + chunk, stop)) for lo in range(start, stop, chunk)]
+    todo = asyncio.Queue()
+    for i in range(len(bounds)):
+        todo.put_nowait(i)
+    done = {} # chunk number -> events
+    progress = asyncio.Event()
+
+    async def worker(board):
+        while not board.dead:
+            i = await todo.get()
+            if board.dead:
+                # dropped while this worker waited
+                todo.put_nowait(i)
+                return
+            (lo, hi) = bounds[i]
+            try:
+                (events, _, _) = await asyncio.wait_for(board.client.range(lo, hi), timeout)
+            except (asyncio.TimeoutError, ProtocolError, ConnectionError) as e:
+                todo.put_nowait(i)
+                if not board.dead:
+                    board.dead = True
+                    print('%s: dropped (%s), chunk %d..%d goes back to the queue' %
+                          (board.name, type(e).__name__, lo, hi), file=sys.stderr)
+                    await board.client.close()
+                progress.set()
+                return
+            board.chunks += 1
+            board.seeds += hi - lo
+            done[i] = events
+            progress.set()
+
+    workers = [asyncio.ensure_future(worker(b)) for b in boards for _ in range(depth)]
+    try:
+        nmax = 0
+        nmaxcnt = 0
+        for i in range(len(bounds)):
+            while i not in done:
+                if all(b.dead for b in boards):
+                    raise RuntimeError("all boards failed, chunk %d..%d not done" % bounds[i])
+                progress.clear()
+                await progress.wait()
+            for ev in done.pop(i):
+                if ev[0] != 'R':
+                    yield ev
+                elif ev[2] > nmax:
+                    nmax = ev[2]
+                    nmaxcnt += 1
+                    yield ('R', nmaxcnt, ev[2], ev[3])
+    finally:
+        for w in workers:
+            w.cancel()
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from collatz_client import open_serial
+    from collatz_ref import format_event
+    from soft_board import open_soft, wait_closed
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", action="append", default=[],
+                        help="serial port of a board, repeat for more boards")
+    parser.add_argument("--baud", type=int, default=3000000)
+    parser.add_argument("--soft", type=int, default=0,
+                        help="add this many soft_board stand-ins")
+    parser.add_argument("--soft-clock", type=float, default=12e6,
+                        help="clock the stand-ins pretend to run at, 0: no pacing (default: %(default)s)")
+    parser.add_argument("--soft-stall", type=int, default=None,
+                        help="the first stand-in stops answering after this many chunks")
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--stop", type=int, default=1 << 20)
+    parser.add_argument("--chunk", type=int, default=1 << 16,
+                        help="seeds per chunk (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="chunks in flight per board (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds until a board that did not answer a chunk is dropped")
+    args = parser.parse_args()
+    if not args.port and not args.soft:
+        parser.error("no boards, use --port and/or --soft")
+
+    async def main():
+        boards = []
+        for port in args.port:
+            boards.append(Board(port, await open_serial(port, args.baud)))
+        for i in range(args.soft):
+            stall = args.soft_stall if i == 0 else None
+            boards.append(Board('soft%d' % i, await open_soft(clock=args.soft_clock or None,
+                                                               stall_after=stall)))
+        t0 = time.time()
+        async for ev in run(boards, args.start, args.stop, args.chunk, args.timeout, args.depth):
+            print(format_event(ev), flush=True)
+        dt = time.time() - t0
+        for b in boards:
+            if not b.dead:
+                await b.client.close()
+        await wait_closed()
+        for b in boards:
+            print('%s: %d chunks, %d seeds%s' % (b.name, b.chunks, b.seeds, ' (dropped)' if b.dead else ''),
+                  file=sys.stderr)
+        print('%d seeds in %.2f s' % (args.stop - args.start, dt), file=sys.stderr)
+
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,113 @@
+# Inverse-tree enumeration: "which seeds below N have delay exactly L",
+# without a forward scan.
+#
+# Level k of the Collatz predecessor tree holds exactly the numbers with
+# delay k (the length the device prints, every 3x+1 and every x/2 counted):
+#   y <- 2y              always
+#   y <- (y - 1) / 3     if y % 6 == 4 (the predecessor is odd and > 1)
+# The walk goes level by level from 1. After a /3 step the next one has to
+# be a doubling, so with r levels to go and c = ceil(r/2), a node y can at
+# best shrink to (y - 2*(3/2)**c) * 2**(r-c) / 3**c; nodes that cannot reach
+# below N any more are pruned. Frontiers are expanded in slices of at most
+# max_frontier nodes, depth-first across slices, which bounds memory by
+# max_frontier times the depth.
+#
+# The work grows with the number of tree nodes that pass the bound, not
+# with N: e.g. all 688191 seeds below 10**12 with delay 60 take seconds,
+# while long delays (L >~ 120) below small N get slow, as the trajectories
+# climb far above N before they come down.
+#
+# These are exact delays, they equal the device's unless a seed would hit
+# err_x/err_n on the device (see collatz_ref.delay).
+#
+# "Smallest seed with delay >= L" is a forward scan instead: the tree gives
+# no bound on how deep a seed below N can sit, and the answer is small
+# (703 for L = 150) where the tree walk for delay L is slow.
+
+from collatz_ref import delay
+
+def predecessors(y):
+    yield 2*y
+    if y % 6 == 4 and y > 4:
+        yield (y - 1) // 3
+
+def _reachable(y, r, n):
+    # can a node y, r levels above the target level, have a descendant < n?
+    # (the bound from above, times 2**c to stay in integers)
+    c = (r + 1) // 2
+    f = r - c
+    return (y * 2**c - 2 * 3**c) * 2**f < n * 6**c
+
+def _walk(frontier, level, target, n, max_frontier, found):
+    if level == target:
+        found.extend(y for y in frontier if y < n)
+        return
+    r = target - level - 1
+    for i in range(0, len(frontier), max_frontier):
+        nxt = [p for y in frontier[i:i + max_frontier]
+                 for p in predecessors(y) if _reachable(p, r, n)]
+        while len(nxt) > max_frontier:
+            # too wide, go depth first on the first slice
+            _walk(nxt[:max_frontier], level + 1, target, n, max_frontier, found)
+            nxt = nxt[max_frontier:]
+        if nxt:
+            _walk(nxt, level + 1, target, n, max_frontier, found)
+
+def with_delay(length, below, max_frontier=1 << 16):
+    # sorted list of all seeds < below with delay exactly 'length'
+    found = []
+    if _reachable(1, length, below):
+        _walk([1], 0, length, below, max_frontier, found)
+    return sorted(found)
+
+def smallest_with_delay(length, max_frontier=1 << 16):
+    # smallest seed with delay exactly 'length'; 2**length always has it,
+    # so search below bounds growing by 4x from 2 up to 2**length + 1
+    bound = 2
+    while True:
+        bound = min(bound, (1 << length) + 1)
+        found = with_delay(length, bound, max_frontier)
+        if found:
+            return found[0]
+        bound = bound * 4
+
+def exact_delay(x):
+    # collatz_ref.delay, widened until it neither overflows nor runs out of
+    # counter
+    (xwidth, nwidth) = (max(32, x.bit_length()), 16)
+    while True:
+        (out, err_x, err_n, _) = delay(x, xwidth, nwidth)
+        if not (err_x or err_n):
+            return out
+        if err_x:
+            xwidth *= 2
+        if err_n:
+            nwidth += 8
+
+def smallest_with_delay_at_least(length):
+    # smallest seed with delay >= length, returns (seed, delay); ends at
+    # 2**length at the latest
+    x = 1
+    while True:
+        n = exact_delay(x)
+        if n >= length:
+            return (x, n)
+        x += 1
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_exact = p_action.add_parser("exact", help="all seeds below N with delay L")
+    p_exact.add_argument("length", type=int)
+    p_exact.add_argument("below", type=int)
+    p_smallest = p_action.add_parser("smallest", help="smallest seed with delay >= L")
+    p_smallest.add_argument("length", type=int)
+    p_exact.add_argument("--max-frontier", type=int, default=1 << 16)
+    args = parser.parse_args()
+    if args.action == "exact":
+        for x in with_delay(args.length, args.below, args.max_frontier):
+            print(x)
+    elif args.action == "smallest":
+        (x, n) = smallest_with_delay_at_least(args.length)
+        print('%d %d' % (n, x))
@@ -0,0 +1,84 @@
+from nmigen import *
+
+from collatz_ref import delay, trajectory
+
+# Cycle-approximate stand-in for collatz.Collatz in system level simulation.
+#
+# The real core costs one pysim cycle per Collatz step, this one computes the
+# result in Python (collatz_ref.delay, same truncation and error rules) and
+# presents it on done/out/err_x/err_n after 'latency' cycles, or after the
+# number of cycles the real core would take (latency=None). A dict of the
+# seed's steps (collatz_ref.trajectory) stands in for Collatz.mem; rd_data
+# follows rd_addr a cycle late (pysim reads rd_addr before it settles),
+# which is in time for Top's walk (T_ADDR waits a cycle).
+#
+# Usage (simulation only):
+#   collatz = CollatzModel(xwidth, nwidth)
+#   top = Top(..., collatz=collatz)
+#   sim.add_sync_process(collatz.process())
+class CollatzModel(Elaboratable):
+    def __init__(self, xwidth, nwidth, latency=None):
+        self.xwidth = xwidth
+        self.nwidth = nwidth
+        self.latency = latency
+
+        # interface, same as Collatz
+        self.rdy    = Signal()
+        self.done   = Signal()
+        self.out    = Signal(2*xwidth)
+        self.err_x  = Signal() # overflow
+        self.err_n  = Signal() # counter exhausted
+
+        self.ld_x    = Signal(xwidth)
+        self.start   = Signal()
+        self.glide   = Signal()
+
+        self.rd_addr = Signal(nwidth)
+        self.rd_data = Signal(xwidth)
+
+        # internal, set by process()
+        self.busy   = Signal()
+
+    def elaborate(self, platform):
+        # no logic, the outputs are driven by process()
+        m = Module()
+        m.d.comb += [
+            self.rdy.eq(~self.busy)
+        ]
+        return m
+
+    def process(self):
+        mem = {}
+        while True:
+            if (yield self.start):
+                x = yield self.ld_x
+                # load cycle, like Collatz: x = ld_x, n = 0, errors cleared
+                yield self.done.eq(0)
+                yield self.busy.eq(1)
+                yield self.out.eq(0)
+                yield self.err_x.eq(0)
+                yield self.err_n.eq(0)
+                if x == 0:
+                    # x = 0 never completes, rdy but not done
+                    yield self.busy.eq(0)
+                else:
+                    glide = yield self.glide
+                    (n, err_x, err_n, cycles) = delay(x, self.xwidth, self.nwidth, glide)
+                    mem = {}
+                    addr = 0
+                    # Top never reads it back in a glide scan
+                    for v in [] if glide else trajectory(x, self.xwidth, self.nwidth)[1]:
+                        mem[addr] = v & ((1 << self.xwidth) - 1)
+                        addr += 1 + (v & 1)
+                    latency = cycles if self.latency is None else self.latency
+                    # the writes above and below take effect with the load cycle
+                    for _ in range(latency):
+                        yield
+                    yield self.out.eq(n)
+                    yield self.err_x.eq(err_x)
+                    yield self.err_n.eq(err_n)
+                    yield self.done.eq(1)
+                    yield self.busy.eq(0)
+            else:
+                yield self.rd_data.eq(mem.get((yield self.rd_addr), 0))
+            yield
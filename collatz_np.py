@@ -0,0 +1,136 @@
+import numpy as np
+
+from collatz_ref import delay, finish, format_event
+
+# Vectorized (NumPy) version of collatz_ref, same hardware semantics.
+#
+# All active lanes of a batch advance one Collatz(xwidth, nwidth) cycle at a
+# time, finished lanes are compacted out after every step. x is kept in
+# uint64; the rare odd lane whose 3x+1 would not fit (only possible if
+# 2*xwidth > 64) is finished by collatz_ref.finish() with Python integers.
+
+U1 = np.uint64(1)
+U3 = np.uint64(3)
+LIMIT = np.uint64((2**64 - 2) // 3) # largest odd x with 3x+1 < 2**64
+
+def delays(seeds, xwidth, nwidth, glide=False):
+    # seeds: array like of seeds (ld_x), returns the arrays
+    # (out, err_x, err_n, cycles), element-wise like collatz_ref.delay
+    seeds = np.asarray(seeds, dtype=np.uint64)
+    if xwidth < 64:
+        seeds = seeds & np.uint64((1 << xwidth) - 1)
+    if (seeds == 0).any():
+        raise ValueError("x = 0 never completes (done stays low)")
+    nmax = (1 << nwidth) - 1
+    top2 = np.uint64((3 << (2*xwidth - 2)) & (2**64 - 1))
+
+    size = len(seeds)
+    out = np.zeros(size, dtype=np.int64)
+    err_x = np.zeros(size, dtype=bool)
+    err_n = np.zeros(size, dtype=bool)
+    cycles = np.zeros(size, dtype=np.int64)
+
+    idx = np.arange(size)
+    x = seeds.copy()
+    below = seeds.copy() if glide else np.zeros(size, dtype=np.uint64)
+    n = np.zeros(size, dtype=np.int64)
+    c = 0
+    while idx.size:
+        # compact out finished lanes
+        live = x > U1
+        if not live.all():
+            fin = ~live
+            out[idx[fin]] = n[fin]
+            cycles[idx[fin]] = c
+            idx, x, n, below = idx[live], x[live], n[live], below[live]
+            if not idx.size:
+                break
+        c += 1
+        exhausted = n >= nmax - 1
+        odd = ((x & U1) == U1) & ~exhausted
+        ovf = odd & ((x & top2) != 0)
+        big = odd & ~ovf & (x > LIMIT)
+        stop = exhausted | ovf
+        if stop.any():
+            err_n[idx[exhausted]] = True
+            err_x[idx[ovf]] = True
+            cycles[idx[stop]] = c # out stays 0
+        if big.any():
+            for i in np.nonzero(big)[0]:
+                (o, ex, en, cy) = finish(int(x[i]), int(n[i]), c - 1, xwidth, nwidth, int(below[i]))
+                out[idx[i]] = o
+                err_x[idx[i]] = ex
+                err_n[idx[i]] = en
+                cycles[idx[i]] = cy
+        if stop.any() or big.any():
+            keep = ~(stop | big)
+            idx, x, n, odd, below = idx[keep], x[keep], n[keep], odd[keep], below[keep]
+        # one step of all remaining lanes, with glide those that fell below
+        # their seed are done
+        x = np.where(odd, (x * U3 + U1) >> U1, x >> U1)
+        n = n + 1 + odd
+        if glide:
+            x = np.where(x < below, U1, x)
+    return (out, err_x, err_n, cycles)
+
+def batches(start, stop, xwidth, nwidth, batch=1 << 16):
+    # yields (first seed, out, err_x, err_n, cycles) per batch of seeds
+    for lo in range(start, stop, batch):
+        hi = min(lo + batch, stop)
+        seeds = np.arange(lo, hi, dtype=np.uint64)
+        yield (lo,) + delays(seeds, xwidth, nwidth)
+
+def scan(start, stop, xwidth, nwidth, nmax=0, nmaxcnt=0, batch=1 << 16):
+    # same events, in the same order, as collatz_ref.scan()
+    for (lo, out, err_x, err_n, _) in batches(start, stop, xwidth, nwidth, batch):
+        run = np.maximum.accumulate(np.maximum(out, nmax))
+        prev = np.empty_like(run)
+        prev[0] = nmax
+        prev[1:] = run[:-1]
+        rec = out > prev
+        for i in np.nonzero(rec | err_x | err_n)[0]:
+            x = lo + int(i)
+            if rec[i]:
+                nmaxcnt += 1
+                yield ('R', nmaxcnt, int(out[i]), x)
+            elif err_n[i]:
+                yield ('N', int(out[i]), x)
+            else:
+                yield ('X', int(out[i]), x)
+        nmax = int(run[-1])
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--stop", type=int, default=1 << 20)
+    parser.add_argument("--xwidth", type=int, default=34)
+    parser.add_argument("--nwidth", type=int, default=12)
+    parser.add_argument("--batch", type=int, default=1 << 16)
+    parser.add_argument("--check", type=int, default=1000,
+                        help="compare this many random seeds against collatz_ref")
+    parser.add_argument("--quiet", action="store_true", help="do not print the record lines")
+    args = parser.parse_args()
+
+    # the known values, and a random sample against the scalar reference
+    (out, _, _, _) = delays([1, 2, 3, 5, 11, 27, 97, 871, 6171], 32, 10)
+    assert list(out) == [0, 1, 7, 5, 14, 111, 118, 178, 261], out
+    seeds = [random.randrange(max(args.start, 1), args.stop) for _ in range(args.check)]
+    got = delays(seeds, args.xwidth, args.nwidth)
+    for (i, x) in enumerate(seeds):
+        exp = delay(x, args.xwidth, args.nwidth)
+        assert tuple(int(v[i]) for v in got) == exp, (x, exp)
+    got = delays(seeds, args.xwidth, args.nwidth, glide=True)
+    for (i, x) in enumerate(seeds):
+        exp = delay(x, args.xwidth, args.nwidth, glide=True)
+        assert tuple(int(v[i]) for v in got) == exp, (x, exp)
+
+    t0 = time.time()
+    for ev in scan(args.start, args.stop, args.xwidth, args.nwidth, batch=args.batch):
+        if not args.quiet:
+            print(format_event(ev))
+    dt = time.time() - t0
+    print('%d seeds in %.2f s, %.0f seeds/s' % (args.stop - args.start, dt, (args.stop - args.start) / dt))
@@ -0,0 +1,167 @@
+# Host side reference of what the hardware computes, with the same width
+# truncation rules as collatz.Collatz(xwidth, nwidth) and the same record
+# logic as collatz_driver.Top. Plain Python, no nMigen needed.
+
+def delay(x, xwidth, nwidth, glide=False):
+    # Mirrors Collatz(xwidth, nwidth) loaded with ld_x = x.
+    # Returns (out, err_x, err_n, cycles), cycles being the number of clock
+    # cycles after the load until done. Like the hardware:
+    #   - ld_x is xwidth bits, x itself 2*xwidth bits
+    #   - odd steps are (3x+1)/2 in one cycle and count n + 2
+    #   - an odd x with either of its two top bits set is an overflow (err_x)
+    #   - n >= nmax - 1 with x still > 1 exhausts the counter (err_n)
+    #   - on either error, x is forced to 1 and n (hence out) reads 0
+    #   - glide (Collatz.glide): the core stops after the first step that
+    #     takes x below the seed, out is that n (the stopping time)
+    x &= (1 << xwidth) - 1
+    if x == 0:
+        raise ValueError("x = 0 never completes (done stays low)")
+    return finish(x, 0, 0, xwidth, nwidth, x if glide else 0)
+
+def finish(x, n, cycles, xwidth, nwidth, below=0):
+    # continues delay() from the state (x, n) reached after 'cycles' cycles;
+    # below: the seed with glide, else 0
+    nmax = (1 << nwidth) - 1
+    top2 = 3 << (2*xwidth - 2)
+    err_x = 0
+    err_n = 0
+    while x > 1 and x >= below:
+        cycles += 1
+        if n < nmax - 1:
+            if x & 1:
+                if x & top2:
+                    err_x = 1
+                    x = 1
+                    n = 0
+                else:
+                    x = (3*x + 1) >> 1
+                    n = n + 2
+            else:
+                x = x >> 1
+                n = n + 1
+        else:
+            err_n = 1
+            x = 1
+            n = 0
+    return (n, err_x, err_n, cycles)
+
+def trajectory(x, xwidth, nwidth):
+    # Mirrors Collatz.mem after delay(x, ...) as Top's 'T'/'P' read it back:
+    # (out, xs), xs the x before every step (the final 1 not included),
+    # full width, in order. After an error out is 0 and xs empty.
+    (out, _, _, _) = delay(x, xwidth, nwidth)
+    x &= (1 << xwidth) - 1
+    xs = []
+    n = 0
+    while n < out:
+        xs.append(x)
+        if x & 1:
+            x = (3*x + 1) >> 1
+            n = n + 2
+        else:
+            x = x >> 1
+            n = n + 1
+    return (out, xs)
+
+def parity_words(xs):
+    # what 'P' prints for the steps xs: one bit per step, 1 for an odd x,
+    # 32 steps per word, the first step in the LSB
+    words = [0] * ((len(xs) + 31) // 32)
+    for (i, x) in enumerate(xs):
+        words[i // 32] |= (x & 1) << (i % 32)
+    return words
+
+def decode_parity(seed, out, words):
+    # the steps xs of a 'P' reply, rebuilt from the seed; raises ValueError
+    # if the parity bits do not belong to seed's trajectory
+    xs = []
+    x = seed
+    n = 0
+    while n < out:
+        i = len(xs)
+        if i // 32 >= len(words):
+            raise ValueError("%d parity words end before n = %d" % (len(words), out))
+        if (words[i // 32] >> (i % 32) & 1) != (x & 1):
+            raise ValueError("parity of step %d (x = %d) disagrees" % (i, x))
+        xs.append(x)
+        if x & 1:
+            x = (3*x + 1) >> 1
+            n = n + 2
+        else:
+            x = x >> 1
+            n = n + 1
+    return xs
+
+def serial_cycles(cycles, err, xwidth, word=16):
+    # cycles of collatz_serial.SerialCollatz(xwidth, ..., word) for a seed
+    # delay() takes 'cycles' for (err: err_x or err_n, found in the first
+    # cycle of its step)
+    words = (2*xwidth + word - 1) // word
+    return words * (cycles - err) + err
+
+def result(x, xwidth, nwidth, fallback=None, glide=False):
+    # delay(), and with fallback ((xwidth, nwidth) of Top's fallback unit,
+    # collatz_serial.SerialCollatz) the fallback's result where the core
+    # gives up (err_x, err_n)
+    r = delay(x, xwidth, nwidth, glide)
+    if fallback and (r[1] or r[2]):
+        r = delay(x, fallback[0], fallback[1], glide)
+    return r
+
+def scan(start, stop, xwidth, nwidth, nmax=0, nmaxcnt=0, fallback=None):
+    # Mirrors Top's scan over seeds start..stop-1, yields what Top prints:
+    #   ('R', index, length, seed) for a new record
+    #   ('N', out, seed) / ('X', out, seed) for err_n / err_x
+    # nmax, nmaxcnt: record state to continue from
+    # fallback: in seed order, i.e. what in_order() makes of Top's output
+    for x in range(start, stop):
+        (out, err_x, err_n, _) = result(x, xwidth, nwidth, fallback)
+        if out > nmax:
+            nmax = out
+            nmaxcnt = nmaxcnt + 1
+            yield ('R', nmaxcnt, out, x)
+        elif err_n:
+            yield ('N', out, x)
+        elif err_x:
+            yield ('X', out, x)
+
+def glide_scan(start, stop, xwidth, nwidth, heartbeat, nmax=0, nmaxcnt=0, fallback=None):
+    # Mirrors Top's glide scan ('G') over seeds start..stop-1:
+    #   ('G', index, glide, seed) for a new glide record
+    #   ('N', out, seed) / ('X', out, seed) for err_n / err_x
+    #   ('V', seed) after every seed + 1 that is a multiple of 2**heartbeat:
+    #               all seeds up to it fell below themselves, but for the
+    #               N and X seeds
+    # fallback: as for scan()
+    for x in range(start, stop):
+        (out, err_x, err_n, _) = result(x, xwidth, nwidth, fallback, glide=True)
+        if out > nmax:
+            nmax = out
+            nmaxcnt = nmaxcnt + 1
+            yield ('G', nmaxcnt, out, x)
+        elif err_n:
+            yield ('N', out, x)
+        elif err_x:
+            yield ('X', out, x)
+        if (x + 1) % (1 << heartbeat) == 0:
+            yield ('V', x)
+
+def in_order(events, kind='R', nmax=0, nmaxcnt=0):
+    # Top's events with a fallback unit, in seed order. The fallback's
+    # results arrive late, as ('F', index, length, seed) if the seed beats
+    # the record of the seeds before it; records Top printed in the meantime
+    # may have been beaten by it. Sorted by seed, the records that still
+    # beat all before them are the records (kind 'R' or 'G'), renumbered.
+    # A heartbeat stays after the seeds up to it.
+    for ev in sorted(events, key=lambda ev: (ev[-1], ev[0] == 'V')):
+        if ev[0] not in ('R', 'G', 'F'):
+            yield ev
+        elif ev[2] > nmax:
+            nmax = ev[2]
+            nmaxcnt = nmaxcnt + 1
+            yield (kind, nmaxcnt, ev[2], ev[3])
+
+def format_event(ev):
+    # the line Top prints for a scan() event, without the trailing space,
+    # CR, LF and BEL
+    return ' '.join(str(v) for v in (ev[1:] if ev[0] == 'R' else ev))
@@ -0,0 +1,157 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from collatz_ref import delay, finish
+from collatz_np import U1, U3, LIMIT, delays
+
+# Multi-core software range search, for when the board is busy.
+#
+# The seed range is cut into chunks that a process pool works on. All
+# workers share one table of delays for the seeds below cache_size (in
+# multiprocessing.shared_memory, built once by the parent), so a trajectory
+# stops as soon as it drops below cache_size. Each chunk only returns its
+# local prefix maxima and its errors; merging them in chunk order gives the
+# same record (and N/X error) lines as the device. Memory is bounded by the
+# chunk size times the number of workers, not by the size of the range.
+#
+# With fallback (Top's FALLBACK widths) the err_x/err_n seeds are redone at
+# those widths, like Top's fallback unit does, so the events are those of
+# collatz_ref.scan(..., fallback=), i.e. Top's output after in_order().
+
+SENTINEL = 0xFFFF # table entry whose tail hit err_x/err_n, walk it instead
+
+def table_size(cache_size, xwidth):
+    # seeds of xwidth bits, from 2**xwidth on they wrap around (to 0)
+    return min(cache_size, 1 << xwidth)
+
+def build_table(cache_size, xwidth, nwidth):
+    # delays (with the hardware's width rules) of 0..cache_size-1, the tails
+    # are added to an absolute n, so the table itself is built with a wide
+    # counter and the nmax cutoff is applied per seed (see _delays_cached)
+    table = np.full(cache_size, SENTINEL, dtype=np.uint16)
+    if cache_size > 1:
+        (out, err_x, err_n, _) = delays(np.arange(1, cache_size, dtype=np.uint64), xwidth, 16)
+        ok = ~(err_x | err_n)
+        table[1:][ok] = out[ok]
+    return table
+
+# per worker process state, see _init
+_table = None
+_shm = None
+_widths = None
+_fallback = None
+
+def _init(name, cache_size, xwidth, nwidth, fallback):
+    global _table, _shm, _widths, _fallback
+    _shm = shared_memory.SharedMemory(name=name)
+    _table = np.ndarray((cache_size,), dtype=np.uint16, buffer=_shm.buf)
+    _widths = (xwidth, nwidth)
+    _fallback = fallback
+
+def _delays_cached(seeds, xwidth, nwidth, table):
+    # like collatz_np.delays (without cycles), lanes stop early once x is
+    # below len(table) (at least 2, so x == 1 always hits the table)
+    seeds = np.asarray(seeds, dtype=np.uint64)
+    if xwidth < 64:
+        seeds = seeds & np.uint64((1 << xwidth) - 1)
+    nmax = (1 << nwidth) - 1
+    top2 = np.uint64((3 << (2*xwidth - 2)) & (2**64 - 1))
+    limit = np.uint64(len(table))
+
+    size = len(seeds)
+    out = np.zeros(size, dtype=np.int64)
+    err_x = np.zeros(size, dtype=bool)
+    err_n = np.zeros(size, dtype=bool)
+
+    idx = np.arange(size)
+    x = seeds.copy()
+    n = np.zeros(size, dtype=np.int64)
+    while idx.size:
+        cached = x < limit
+        if cached.any():
+            ci = np.nonzero(cached)[0]
+            d = table[x[ci].astype(np.intp)].astype(np.int64)
+            total = n[ci] + d
+            # the step into 1 is always 2 -> 1 (n + 1), so the state before it,
+            # (total - 1, 2), fails the n < nmax - 1 check iff total >= nmax
+            over = total >= nmax
+            out[idx[ci]] = np.where(over, 0, total)
+            err_n[idx[ci]] = over
+            for i in ci[d == SENTINEL]:
+                (o, ex, en, _) = finish(int(x[i]), int(n[i]), 0, xwidth, nwidth)
+                out[idx[i]] = o
+                err_x[idx[i]] = ex
+                err_n[idx[i]] = en
+            keep = ~cached
+            idx, x, n = idx[keep], x[keep], n[keep]
+            if not idx.size:
+                break
+        exhausted = n >= nmax - 1
+        odd = ((x & U1) == U1) & ~exhausted
+        ovf = odd & ((x & top2) != 0)
+        big = odd & ~ovf & (x > LIMIT)
+        err_n[idx[exhausted]] = True
+        err_x[idx[ovf]] = True
+        for i in np.nonzero(big)[0]:
+            (o, ex, en, _) = finish(int(x[i]), int(n[i]), 0, xwidth, nwidth)
+            out[idx[i]] = o
+            err_x[idx[i]] = ex
+            err_n[idx[i]] = en
+        keep = ~(exhausted | ovf | big)
+        idx, x, n, odd = idx[keep], x[keep], n[keep], odd[keep]
+        x = np.where(odd, (x * U3 + U1) >> U1, x >> U1)
+        n = n + 1 + odd
+    return (out, err_x, err_n)
+
+def _chunk(lohi):
+    # worker: local prefix maxima and errors of seeds lo..hi-1, in seed order
+    (lo, hi) = lohi
+    (xwidth, nwidth) = _widths
+    (out, err_x, err_n) = _delays_cached(np.arange(lo, hi, dtype=np.uint64),
+                                         xwidth, nwidth, _table)
+    if _fallback:
+        # rare, one seed at a time like the fallback unit
+        for i in np.nonzero(err_x | err_n)[0]:
+            (out[i], err_x[i], err_n[i], _) = delay(lo + int(i), _fallback[0], _fallback[1])
+    run = np.maximum.accumulate(out)
+    rec = np.empty(len(out), dtype=bool)
+    rec[0] = out[0] > 0
+    rec[1:] = out[1:] > run[:-1]
+    events = []
+    for i in np.nonzero(rec | err_x | err_n)[0]:
+        if rec[i]:
+            events.append(('R', int(out[i]), lo + int(i)))
+        elif err_n[i]:
+            events.append(('N', int(out[i]), lo + int(i)))
+        else:
+            events.append(('X', int(out[i]), lo + int(i)))
+    return events
+
+def search(start, stop, xwidth, nwidth, workers=None, chunk=1 << 20, cache_size=1 << 22,
+           fallback=None):
+    # yields the same events as collatz_ref.scan(start, stop, ..., fallback), in order
+    assert start >= 1 and cache_size >= 2
+    cache_size = table_size(cache_size, xwidth)
+    table = build_table(cache_size, xwidth, nwidth)
+    shm = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+    try:
+        np.ndarray(table.shape, dtype=table.dtype, buffer=shm.buf)[:] = table
+        del table
+        chunks = ((lo, min(lo + chunk, stop)) for lo in range(start, stop, chunk))
+        nmax = 0
+        nmaxcnt = 0
+        with multiprocessing.Pool(workers, initializer=_init,
+                                  initargs=(shm.name, cache_size, xwidth, nwidth, fallback)) as pool:
+            for events in pool.imap(_chunk, chunks):
+                for ev in events:
+                    if ev[0] != 'R':
+                        yield ev
+                    elif ev[1] > nmax:
+                        nmax = ev[1]
+                        nmaxcnt += 1
+                        yield ('R', nmaxcnt, ev[1], ev[2])
+    finally:
+        shm.close()
+        shm.unlink()
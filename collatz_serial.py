@@ -0,0 +1,140 @@
+from nmigen import *
+
+# Word-serial Collatz core: the interface and results of collatz.Collatz
+# (same truncation, overflow and counter rules, see collatz_ref.delay), but
+# x is kept in a register of 'word' bit words that is rotated by one word
+# per cycle, so a step takes 2*xwidth/word cycles through a single word
+# wide adder. Wide x and n this way cost flip-flops rather than logic and
+# carry chains, e.g. SerialCollatz(64, 16): x of 128 bits, 8 cycles per
+# step; collatz_driver.Top uses it as the fallback for the seeds the fast
+# core gives up on (err_x, err_n).
+#
+# One step, words i = 0 (LSB) .. words-1, x[0] the word being processed and
+# x[1] the next one, not yet processed:
+#   half  = x >> 1, word i: x[0][1:] and bit 0 of x[1] (0 for the top word)
+#   even: x' = half
+#   odd:  x' = (3x+1)/2 = x + half + 1, the carry passed from word to word
+# x' == 1 and x' < seed (glide) are found word by word on the way. The
+# parity, the overflow (top two bits of x) and the counter are checked in
+# the first cycle of a step, with x in its original order.
+#
+# No trajectory memory, rd_addr/rd_data are not there. Its cycles per seed:
+# collatz_ref.serial_cycles.
+
+class SerialCollatz(Elaboratable):
+    def __init__(self, xwidth, nwidth, word=16):
+        self.xwidth = xwidth
+        self.nwidth = nwidth
+        self.word = word
+        self.words = (2*xwidth + word - 1) // word
+
+        # interface, output
+        self.rdy    = Signal()
+        self.done   = Signal()
+        self.out    = Signal(nwidth)
+        self.err_x  = Signal() # overflow
+        self.err_n  = Signal() # counter exhausted
+
+        # interface, input
+        self.ld_x   = Signal(xwidth)
+        self.start  = Signal()
+        self.glide  = Signal() # stop as soon as x < seed, out is the glide
+
+        # state, x and seed rotate by a word per cycle
+        self.x      = Signal(self.words * word)
+        self.seed   = Signal(self.words * word)
+        self.n      = Signal(nwidth)
+        self.i      = Signal(range(self.words)) # word of the step in x[0]
+        self.busy   = Signal()
+        self.fin    = Signal() # done, until the next start
+
+        # carried from word to word within a step
+        self.odd    = Signal()
+        self.carry  = Signal()
+        self.is1    = Signal() # x' == 1 so far
+        self.lt     = Signal() # x' < seed so far
+
+        self.nmax = (1 << nwidth) - 1
+
+    def elaborate(self, platform):
+        m = Module()
+        w = self.word
+        first = Signal()
+        last = Signal()
+        odd = Signal()
+        carry = Signal()
+        half = Signal(w)
+        total = Signal(w + 1)
+        new = Signal(w)
+        is1 = Signal()
+        lt = Signal()
+        m.d.comb += [
+            first.eq(self.i == 0),
+            last.eq(self.i == self.words - 1),
+            odd.eq(Mux(first, self.x[0], self.odd)),
+            carry.eq(Mux(first, 1, self.carry)),
+            half.eq(Cat(self.x[1:w], Mux(last, 0, self.x[w] if self.words > 1 else 0))),
+            total.eq(self.x[:w] + half + carry),
+            new.eq(Mux(odd, total[:w], half)),
+            is1.eq(Mux(first, new == 1, self.is1 & (new == 0))),
+            lt.eq((new < self.seed[:w]) | ((new == self.seed[:w]) & ~first & self.lt)),
+
+            self.rdy.eq(~self.busy),
+            self.done.eq(self.fin),
+            self.out.eq(Mux(self.fin, self.n, 0)),
+        ]
+        top2 = self.x[2*self.xwidth-2:2*self.xwidth]
+
+        with m.If(self.start):
+            # x = 0 never completes, like Collatz: rdy but not done
+            m.d.sync += [
+                self.x.eq(self.ld_x),
+                self.seed.eq(self.ld_x),
+                self.n.eq(0),
+                self.i.eq(0),
+                self.err_x.eq(0),
+                self.err_n.eq(0),
+                self.busy.eq(self.ld_x > 1),
+                self.fin.eq(self.ld_x == 1)
+            ]
+        with m.Elif(self.busy):
+            with m.If(first & (self.n >= self.nmax - 1)):
+                # sequence length exhausted
+                m.d.sync += [
+                    self.err_n.eq(1),
+                    self.n.eq(0),
+                    self.busy.eq(0),
+                    self.fin.eq(1)
+                ]
+            with m.Elif(first & self.x[0] & (top2 != 0)):
+                # overflow
+                m.d.sync += [
+                    self.err_x.eq(1),
+                    self.n.eq(0),
+                    self.busy.eq(0),
+                    self.fin.eq(1)
+                ]
+            with m.Else():
+                m.d.sync += [
+                    self.x.eq(Cat(self.x[w:], new)),
+                    self.seed.eq(Cat(self.seed[w:], self.seed[:w])),
+                    self.odd.eq(odd),
+                    self.carry.eq(total[w]),
+                    self.is1.eq(is1),
+                    self.lt.eq(lt)
+                ]
+                with m.If(last):
+                    m.d.sync += [
+                        self.i.eq(0),
+                        self.n.eq(self.n + 1 + odd)
+                    ]
+                    with m.If(is1 | (self.glide & lt)):
+                        m.d.sync += [
+                            self.busy.eq(0),
+                            self.fin.eq(1)
+                        ]
+                with m.Else():
+                    m.d.sync += [
+                        self.i.eq(self.i + 1)
+                    ]
+        return m
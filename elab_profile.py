@@ -0,0 +1,142 @@
+import resource
+import sys
+import time
+import tracemalloc
+
+from nmigen.hdl import dsl, ir
+
+# Opt-in profile of what a run spends before and around the simulation or
+# synthesis proper (collatz_driver.py --profile ...): the elaboration of
+# every Elaboratable, by its place in the design (e.g. Top/uart_printer:
+# UART_Printer/bcd:BCD1_32), nMigen's lowering of the fragment tree
+# (Fragment.prepare), the RTLIL backend, yosys, pysim's compilation of the
+# design (Simulator.__init__, with the elaboration and lowering it does as
+# entries below) and the toolchain. Times are wall clock, 'self' without
+# the entries below (submodules, nested phases).
+#
+# Not measured: lowering per submodule, Fragment.prepare lowers the whole
+# tree in one call and is one row; and peak memory per entry, "MB held" is
+# what an entry allocated and still holds when it returns, the entries
+# below included. Only the run as a whole has a peak (traced and max RSS).
+#
+#     with Profile() as prof:
+#         top = Top(...)
+#         Fragment.get(top, platform=None)
+#     # report on stderr
+#
+# tracemalloc makes the profiled run a few times slower, the times are
+# comparable with each other, not with a run without --profile. Work done in
+# worker processes (search, sweep, regression) is not seen.
+
+class Profile:
+    def __init__(self, file=sys.stderr):
+        self.file = file
+        self.rows = {} # path -> [calls, seconds, self seconds, bytes retained], in call order
+        self._stack = [] # [path, start time, start memory, seconds of the entries below]
+        self._modules = [] # Modules being elaborated, to name their submodules
+        self._patched = [] # (owner, attribute, original)
+
+    def _enter(self, name):
+        path = (self._stack[-1][0] if self._stack else ()) + (name,)
+        self.rows.setdefault(path, [0, 0.0, 0.0, 0])
+        self._stack.append([path, time.perf_counter(), tracemalloc.get_traced_memory()[0], 0.0])
+
+    def _exit(self):
+        (path, t0, m0, below) = self._stack.pop()
+        dt = time.perf_counter() - t0
+        row = self.rows[path]
+        row[0] += 1
+        row[1] += dt
+        row[2] += dt - below
+        row[3] += tracemalloc.get_traced_memory()[0] - m0
+        if self._stack:
+            self._stack[-1][3] += dt
+
+    def _timed(self, name, func):
+        # name: str, or a function of the call's arguments giving the name
+        # (None: not recorded)
+        def wrapper(*args, **kwargs):
+            label = name(*args) if callable(name) else name
+            if label is None:
+                return func(*args, **kwargs)
+            self._enter(label)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+        return wrapper
+
+    def _patch(self, owner, attr, make):
+        # replaces owner.attr by make(original function), undone by stop()
+        raw = vars(owner)[attr]
+        func = raw.__func__ if isinstance(raw, staticmethod) else raw
+        wrapper = make(func)
+        setattr(owner, attr, staticmethod(wrapper) if isinstance(raw, staticmethod) else wrapper)
+        self._patched.append((owner, attr, raw))
+
+    def _name(self, obj, platform=None):
+        # Fragment.get(obj): 'name:Class' for named submodules, 'Class' else
+        if isinstance(obj, ir.Fragment):
+            return None
+        cls = type(obj).__name__
+        if self._modules:
+            for (name, sub) in self._modules[-1]._named_submodules.items():
+                if sub is obj:
+                    return '%s:%s' % (name, cls)
+        return cls
+
+    def _module_elaborate(self, func):
+        def wrapper(module, platform):
+            self._modules.append(module)
+            try:
+                return func(module, platform)
+            finally:
+                self._modules.pop()
+        return wrapper
+
+    def start(self):
+        # the backends are loaded here rather than when the run needs them,
+        # they are patched before anything is elaborated
+        from nmigen.back import pysim, rtlil, verilog
+        from nmigen.build import run
+
+        self._patch(ir.Fragment, 'get', lambda f: self._timed(self._name, f))
+        self._patch(dsl.Module, 'elaborate', self._module_elaborate)
+        self._patch(ir.Fragment, 'prepare', lambda f: self._timed('lower (Fragment.prepare)', f))
+        self._patch(rtlil, 'convert_fragment', lambda f: self._timed('rtlil', f))
+        self._patch(verilog, '_convert_rtlil_text', lambda f: self._timed('yosys (verilog)', f))
+        # pysim compiles the design in Simulator.__init__ (_FragmentCompiler)
+        self._patch(pysim.Simulator, '__init__', lambda f: self._timed('pysim compile', f))
+        self._patch(run.BuildPlan, 'execute_local', lambda f: self._timed('toolchain', f))
+        tracemalloc.start()
+        self.t0 = time.perf_counter()
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.t0
+        (_, self.peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for (owner, attr, raw) in reversed(self._patched):
+            setattr(owner, attr, raw)
+        self._patched = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.report()
+
+    def report(self):
+        f = self.file
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on Linux
+        print('profile: %.3f s, peak traced memory %.1f MB, max RSS %.1f MB' %
+              (self.wall, self.peak / 2**20, rss), file=f)
+        print('%6s %9s %9s %9s  %s' % ('calls', 'total s', 'self s', 'MB held', 'elaboration / phase'), file=f)
+        top = 0.0
+        for (path, (calls, total, own, held)) in self.rows.items():
+            if len(path) == 1:
+                top += total
+            print('%6d %9.3f %9.3f %9.2f  %s%s' % (calls, total, own, held / 2**20,
+                                                    '  ' * (len(path) - 1), path[-1]), file=f)
+        print('%6s %9.3f %9s %9s  %s' % ('', self.wall - top, '', '', 'rest (simulation, I/O, ...)'), file=f)
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from transcript import Transcript
+from verifier import format_mismatch
+
+# Host side store for what the board prints (see transcript.py).
+#
+# <base>.log is append-only: one fixed size ENTRY per record, glide record,
+# fallback (F) record or N/X error line, in arrival order, so it can be
+# memory-mapped as a NumPy array.
+# <base>.seed.idx and <base>.len.idx index it by seed and by length, as
+# sorted runs one after the other: n sorted keys followed by the n matching
+# entry numbers (both uint64). <base>.seed.runs / .len.runs hold the n of
+# every run (uint64). index() sorts the entries appended since the last call
+# into a new run at the end; while the run before it is no longer, the two
+# are merged (truncating the file there), so the runs halve in size from
+# the start, there are at most log2(entries) + 1 of them and every entry is
+# rewritten O(log(entries)) times over a long ingest. Queries are binary
+# searches on the mapped keys of each run, no text is parsed again.
+
+ENTRY = np.dtype([('kind', 'u1'), ('index', '<u4'), ('length', '<u4'), ('seed', '<u8')])
+KINDS = ('R', 'N', 'X', 'G', 'F')
+
+def to_entries(events):
+    # transcript.parse_line() results -> ENTRY array (index is 0 for N/X)
+    a = np.zeros(len(events), dtype=ENTRY)
+    for (i, ev) in enumerate(events):
+        if ev[0] in ('R', 'G', 'F'):
+            a[i] = (KINDS.index(ev[0]), ev[1], ev[2], ev[3])
+        else:
+            a[i] = (KINDS.index(ev[0]), 0, ev[1], ev[2])
+    return a
+
+def format_entry(e):
+    # the line as the board printed it, without the trailing space etc.
+    if e['kind'] == 0:
+        return '%d %d %d' % (e['index'], e['length'], e['seed'])
+    if KINDS[e['kind']] in ('G', 'F'):
+        return '%s %d %d %d' % (KINDS[e['kind']], e['index'], e['length'], e['seed'])
+    return '%s %d %d' % (KINDS[e['kind']], e['length'], e['seed'])
+
+class RecordLog:
+    def __init__(self, base):
+        self.path = base + '.log'
+        self.idx_path = {'seed': base + '.seed.idx', 'length': base + '.len.idx'}
+        self.runs_path = {'seed': base + '.seed.runs', 'length': base + '.len.runs'}
+        open(self.path, 'ab').close()
+
+    def __len__(self):
+        return os.path.getsize(self.path) // ENTRY.itemsize
+
+    def append(self, events):
+        a = to_entries(events)
+        with open(self.path, 'ab') as f:
+            f.write(a.tobytes())
+        return len(a)
+
+    def entries(self):
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=ENTRY)
+        return np.memmap(self.path, dtype=ENTRY, mode='r', shape=(n,))
+
+    def _sizes(self, field):
+        # n of every run of an index, [] if it is missing or does not match
+        # its .runs (e.g. an interrupted index()), then it is rebuilt
+        path = self.runs_path[field]
+        if not os.path.exists(path) or not os.path.exists(self.idx_path[field]):
+            return []
+        sizes = [int(n) for n in np.fromfile(path, dtype='<u8')]
+        if 16 * sum(sizes) != os.path.getsize(self.idx_path[field]):
+            return []
+        return sizes
+
+    def _load(self, field):
+        # [(keys, entry numbers)] of the runs of an index, memory-mapped
+        path = self.idx_path[field]
+        runs = []
+        offset = 0
+        for n in self._sizes(field):
+            keys = np.memmap(path, dtype='<u8', mode='r', shape=(n,), offset=offset)
+            pos = np.memmap(path, dtype='<u8', mode='r', shape=(n,), offset=offset + 8*n)
+            runs.append((keys, pos))
+            offset += 16 * n
+        return runs
+
+    def index(self):
+        # brings both index files up to date with the log
+        entries = self.entries()
+        for field in self.idx_path:
+            sizes = self._sizes(field)
+            done = sum(sizes)
+            if done == len(entries):
+                continue
+            pos = np.arange(done, len(entries), dtype='<u8')
+            keys = entries[field][done:].astype('<u8')
+            order = np.argsort(keys, kind='stable')
+            (keys, pos) = (keys[order], pos[order])
+            runs = self._load(field)
+            while runs and len(runs[-1][0]) <= len(keys):
+                # older run first, equal keys stay in log order
+                (old_keys, old_pos) = runs.pop()
+                sizes.pop()
+                keys = np.concatenate([old_keys, keys])
+                pos = np.concatenate([old_pos, pos])
+                order = np.argsort(keys, kind='stable')
+                (keys, pos) = (keys[order], pos[order])
+            del runs
+            with open(self.idx_path[field], 'ab') as f:
+                f.truncate(16 * sum(sizes))
+                f.write(keys.tobytes())
+                f.write(pos.tobytes())
+            sizes.append(len(keys))
+            tmp = self.runs_path[field] + '.tmp'
+            np.array(sizes, dtype='<u8').tofile(tmp)
+            os.replace(tmp, self.runs_path[field])
+
+    def _select(self, field, select):
+        # (keys, entry numbers) of select(keys) of every run, ordered by key,
+        # equal keys in log order
+        parts = [(np.asarray(keys[select(keys)]), np.asarray(pos[select(keys)]))
+                 for (keys, pos) in self._load(field)]
+        keys = np.concatenate([k for (k, _) in parts] + [np.zeros(0, dtype='<u8')])
+        pos = np.concatenate([p for (_, p) in parts] + [np.zeros(0, dtype='<u8')])
+        order = np.lexsort((pos, keys))
+        return (keys[order], pos[order])
+
+    def query(self, field, lo, hi=None):
+        # entries with lo <= field < hi (hi defaults to lo + 1), ordered by
+        # field; call index() first, entries not indexed yet are not seen
+        hi = lo + 1 if hi is None else hi
+        def select(keys):
+            a = np.searchsorted(keys, np.uint64(lo), side='left')
+            b = np.searchsorted(keys, np.uint64(hi), side='left')
+            return slice(a, b)
+        (_, pos) = self._select(field, select)
+        return self.entries()[pos.astype(np.intp)]
+
+    def longest(self, count):
+        # the 'count' entries with the largest length, longest first
+        (_, pos) = self._select('length', lambda keys: slice(max(len(keys) - count, 0), len(keys)))
+        return self.entries()[pos[::-1][:count].astype(np.intp)]
+
+def open_source(port=None, path=None, baud=3000000):
+    # returns (read, source): read() returns the bytes available, b'' at the
+    # end of a file, None if nothing arrived yet; source is the open port/file
+    if port is not None:
+        import serial
+        ser = serial.Serial(port, baud, xonxoff=True, timeout=0.1)
+        return (lambda: ser.read(max(1, ser.in_waiting)) or None), ser
+    f = sys.stdin.buffer.raw if path in (None, '-') else open(path, 'rb', buffering=0)
+    return (lambda: f.read(1 << 16)), f
+
+def ingest(log, read, flush_every=1.0, verbose=True, verifier=None):
+    # feeds everything read() returns into log until end of file or Ctrl-C,
+    # indexing every flush_every seconds and at the end; verifier: a
+    # verifier.Verifier to hand the events to
+    t = Transcript()
+    total = 0
+    last = time.time()
+    try:
+        while True:
+            data = read()
+            if data == b'':
+                break
+            if data:
+                t.feed(data)
+                # query replies (Q/E/S lines) and heartbeats (V) are not kept
+                events = [ev for ev in t.drain() if ev[0] in KINDS]
+                total += log.append(events)
+                if verifier:
+                    for ev in events:
+                        verifier.submit(ev)
+                    for m in verifier.poll():
+                        print('MISMATCH ' + format_mismatch(m), file=sys.stderr)
+            if time.time() - last >= flush_every:
+                log.index()
+                last = time.time()
+                if verbose:
+                    print('%d entries, %d bytes read' % (total, t.nbytes), file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    log.index()
+    if verifier:
+        for m in verifier.close():
+            print('MISMATCH ' + format_mismatch(m), file=sys.stderr)
+        print('verified %d events (%d skipped), %d mismatches' %
+              (verifier.checked, verifier.skipped, len(verifier.mismatches)), file=sys.stderr)
+    return total
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_ingest = p_action.add_parser("ingest", help="append what the board prints to the log")
+    p_ingest.add_argument("log", help="basename of the .log/.idx files")
+    p_ingest.add_argument("--port", default=None,
+                          help="serial port of the board, e.g. /dev/ttyUSB1 (default: read --file)")
+    p_ingest.add_argument("--baud", type=int, default=3000000)
+    p_ingest.add_argument("--file", default="-",
+                          help="captured output to read instead, - for stdin (default: %(default)s)")
+    p_ingest.add_argument("--start", action="store_true",
+                          help="--port: send 'A' to start the scan")
+    p_ingest.add_argument("--glide", action="store_true",
+                          help="--port: send 'G' to start the glide scan")
+    p_ingest.add_argument("--verify", type=float, default=None,
+                          help="recompute every record and this fraction of the errors in the background")
+    p_query = p_action.add_parser("query", help="look entries up in the log")
+    p_query.add_argument("log")
+    p_query.add_argument("--seed", type=int, default=None)
+    p_query.add_argument("--length", type=int, default=None)
+    p_query.add_argument("--to", type=int, default=None,
+                         help="query the range --seed/--length .. TO-1 instead")
+    p_query.add_argument("--longest", type=int, default=None,
+                         help="the N entries with the largest length")
+    args = parser.parse_args()
+    if args.action == "ingest":
+        log = RecordLog(args.log)
+        (read, src) = open_source(args.port, args.file, args.baud)
+        if args.start:
+            src.write(b'A')
+        elif args.glide:
+            src.write(b'G')
+        verifier = None
+        if args.verify is not None:
+            from verifier import Verifier
+            verifier = Verifier(fraction=args.verify)
+        n = ingest(log, read, verifier=verifier)
+        print('%d entries appended, %d in the log' % (n, len(log)))
+    elif args.action == "query":
+        log = RecordLog(args.log)
+        log.index()
+        t0 = time.time()
+        if args.longest is not None:
+            found = log.longest(args.longest)
+        elif args.seed is not None:
+            found = log.query('seed', args.seed, args.to)
+        elif args.length is not None:
+            found = log.query('length', args.length, args.to)
+        else:
+            parser.error("query needs --seed, --length or --longest")
+        dt = time.time() - t0
+        for e in found:
+            print(format_entry(e))
+        print('%d of %d entries in %.3f ms' % (len(found), len(log), dt*1e3), file=sys.stderr)
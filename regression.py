@@ -0,0 +1,577 @@
+import contextlib
+import multiprocessing
+import random
+import sys
+import time
+
+from nmigen import *
+from nmigen.back import pysim
+
+from collatz_ref import delay, result, trajectory, serial_cycles
+
+# Table driven self-tests of the nMigen modules, in simulation.
+#
+# A configuration is one module instance (e.g. Collatz(16, 8)) plus a table
+# of vectors, inputs and the outputs expected from the Python references:
+# collatz_ref for Collatz (its result and, read back, the steps in its
+# memory), integer arithmetic for BCD1_32, string formatting for
+# UART_Printer and the words in order for SPRAMFIFO. All vectors of a
+# configuration run back to back in one simulation, each for only as many
+# cycles as the module needs (no fixed run_until windows). Configurations go to a process pool.
+#
+# sim_compiled is checked against pysim instead: the same host bytes must
+# give the same transcript lines. Without yosys and Verilator or Icarus the
+# configuration is reported as skipped.
+#
+# Host side searches that do not mirror a module (collatz_inverse, the
+# collatz_search workers) are checked the same way, against a forward scan
+# or collatz_ref, with 0 cycles.
+#
+# Collatz configurations whose seeds all fit in 'count' are tested
+# exhaustively; the simulation cost of Collatz grows with 2**nwidth (the
+# sequence RAM), so the wide configurations get few vectors and the small
+# ones many.
+
+PERIOD = 100e-9
+
+# seeds with known delays, from the original collatz.py test
+KNOWN_SEEDS = [1, 2, 3, 5, 11, 27, 97, 871, 6171]
+
+# (kind, parameters, number of vectors)
+SUITE = [
+    ('collatz', (32, 10), 9), # the original test
+    ('collatz', (34, 12), 6), # as on the board
+    ('collatz', (16, 8), 32),
+    ('collatz', (7, 6), 127), # all seeds, including err_x and err_n
+    ('collatz', (3, 10), 7), # all seeds, 7 overflows
+    ('collatz', (32, 6), 32), # nwidth too small, mostly err_n
+    ('glide', (34, 12), 6), # Collatz.glide, same seeds
+    ('glide', (7, 6), 127),
+    ('serial', (7, 6, 0), 127), # SerialCollatz(xwidth, nwidth), glide
+    ('serial', (7, 6, 1), 127),
+    ('serial', (24, 10, 0), 64),
+    ('serial', (64, 16, 0), 16), # the fallback of Top
+    ('serial', (64, 16, 1), 16),
+    ('bcd', (), 2000),
+    ('printer', (), 64),
+    ('spram', (8, 64), 600), # SPRAMFIFO(width, depth), SPRAM model
+    ('spram', (37, 50), 300),
+    ('top', (34, 12, 20), 10), # Top (CollatzModel) against soft_board, commands; heartbeat
+    ('top', (34, 6, 4), 11), # narrow: R and G seeds go to the fallback, then a 'G' scan
+    ('inverse', (2000,), 80), # collatz_inverse, delays 1..80, seeds below 2000
+    ('search', (7, 6, 16, 8, 22), 8), # collatz_search chunks, (xwidth, nwidth) + fallback, cache bits
+    ('search', (16, 8, 64, 16, 22), 8), # the default cache, more than 2**xwidth seeds
+    ('search', (7, 6, 7, 6, 6), 8), # a fallback no wider than the core, the errors stay
+    ('compiled', (34, 12), 3), # Top on sim_compiled against pysim, skipped without yosys + a backend
+]
+
+def collatz_vectors(params, count, rng):
+    # [(seed, (out, err_x, err_n, cycles))]
+    (xwidth, nwidth) = params
+    if count >= (1 << xwidth) - 1:
+        seeds = list(range(1, 1 << xwidth))
+    else:
+        seeds = [x for x in KNOWN_SEEDS if x < (1 << xwidth)][:count]
+        while len(seeds) < count:
+            # as many short as long seeds
+            x = rng.getrandbits(rng.randint(1, xwidth))
+            if x:
+                seeds.append(x)
+        if nwidth == 6 and xwidth >= 13:
+            seeds[0] = 6176 # needs 9 bits of n
+    return [(x, delay(x, xwidth, nwidth)) for x in seeds]
+
+def glide_vectors(params, count, rng):
+    # collatz_vectors, with the results of Collatz.glide
+    return [(x, delay(x, *params, glide=True)) for (x, _) in collatz_vectors(params, count, rng)]
+
+def serial_vectors(params, count, rng):
+    # collatz_vectors, with the results and cycles of SerialCollatz
+    (xwidth, nwidth, glide) = params
+    vectors = []
+    for (x, _) in collatz_vectors((xwidth, nwidth), count, rng):
+        (out, err_x, err_n, c) = delay(x, xwidth, nwidth, glide=glide)
+        vectors.append((x, (out, err_x, err_n, serial_cycles(c, err_x | err_n, xwidth))))
+    return vectors
+
+def bcd_vectors(params, count, rng):
+    # [((mag, value), (digit, remainder))], value < 10**(mag+1)
+    vectors = []
+    for i in range(count):
+        mag = i % 10
+        value = [0, 10**mag, 10**(mag + 1) - 1][i // 10] if i < 30 else rng.randrange(10**(mag + 1))
+        value = min(value, 9999999999)
+        digit = min(value // 10**mag, 9)
+        vectors.append(((mag, value), (digit, value - digit * 10**mag)))
+    return vectors
+
+def printer_vectors(params, count, rng):
+    # [((cmd, data), bytes printed)], see UART_Printer's command dispatcher
+    vectors = []
+    for i in range(count):
+        cmd = 4 + i % 4
+        if cmd == 4:
+            # verbatim, LSB first, 0 bytes are not printed
+            data = [rng.choice([0, rng.randrange(1, 256)]) for _ in range(4)]
+            vectors.append(((4, sum(b << (8*j) for (j, b) in enumerate(data))),
+                            bytes(b for b in data if b)))
+        elif cmd == 5:
+            value = rng.choice([0, rng.randrange(10), 9999999999,
+                                rng.randrange(10**rng.randint(1, 10))])
+            vectors.append(((5, value), ('%d ' % value).encode()))
+        else:
+            value = rng.getrandbits(32)
+            text = '%08x ' % value if cmd == 6 else ' '.join('%02x' % (value >> s & 0xff)
+                                                          for s in (24, 16, 8, 0)) + ' '
+            vectors.append(((cmd, value), text.encode()))
+    return vectors
+
+def spram_vectors(params, count, rng):
+    # [(word, cycles the reader waits before taking it)]; now and then the
+    # reader waits until the FIFO is full
+    (width, depth) = params
+    return [(rng.getrandbits(width), depth + 8 if i % 100 == 99 else rng.choice([0, 0, 0, 1, 2, 7]))
+            for i in range(count)]
+
+def top_vectors(params, count, rng):
+    # [(host bytes, (reply, cycles))], the replies of soft_board.SoftBoard;
+    # the rejected commands first (seed 0 never completes), then commands
+    # that show the board still answers, a range (with a narrow nwidth, its
+    # long seeds go to the fallback and come back as F lines) and last a
+    # glide scan, for which 'reply' is collatz_ref.glide_scan's events up to
+    # the third heartbeat (in seed order, see sim_top)
+    from collatz_client import command
+    from collatz_driver import FALLBACK
+    from collatz_ref import glide_scan
+    from soft_board import SoftBoard
+    (xwidth, nwidth, heartbeat) = params
+    cmds = [('Q', 0), ('T', 0), ('P', 0), ('R', 0, 5), ('Q', 1 << xwidth), ('R', 1, (1 << xwidth) + 1),
+            ('Q', 27), ('R', 1, 10), ('P', 7), ('R', 1, 100), ('G',)]
+    board = SoftBoard(xwidth, nwidth, heartbeat, FALLBACK)
+    vectors = []
+    for c in cmds[:count]:
+        host = command(*c)
+        if c[0] == 'G':
+            start = board.x + 1
+            stop = ((start >> heartbeat) + 3) << heartbeat
+            board.feed(host)
+            (reply, cycles) = board.scan(stop - start)
+            vectors.append((host, (list(glide_scan(start, stop, xwidth, nwidth, heartbeat, fallback=FALLBACK)),
+                                   cycles + 16*len(reply))))
+            break
+        (reply, cycles) = board.feed(host)[0]
+        vectors.append((host, (reply, cycles)))
+    return vectors
+
+def compiled_vectors(params, count, rng):
+    # [(host bytes, cycles to run)], 'Q' queries; the expected transcript is
+    # pysim's, simulated next to the compiled one in sim_compiled_top
+    from collatz_client import command
+    (xwidth, nwidth) = params
+    seeds = [27] + [rng.randrange(1, 1 << min(xwidth, 20)) for i in range(count - 1)]
+    return [(command('Q', x), 2000) for x in seeds]
+
+def inverse_vectors(params, count, rng):
+    # [(length, (smallest seed with delay >= length and its delay,
+    #            the seeds < below with delay exactly length))]
+    (below,) = params
+    delays = {}
+    x = 1
+    while len(delays) < below or max(delays.values()) < count:
+        (out, err_x, err_n, _) = delay(x, 64, 16)
+        assert not (err_x or err_n)
+        delays[x] = out
+        x += 1
+    vectors = []
+    for length in range(1, count + 1):
+        first = min(x for x in delays if delays[x] >= length)
+        vectors.append((length, ((first, delays[first]),
+                                 [x for x in range(1, below) if delays[x] == length])))
+    return vectors
+
+def search_vectors(params, count, rng):
+    # [((lo, hi), the chunk's events: its local prefix maxima ('R', out, seed)
+    #   and the errors the fallback leaves ('N'/'X', out, seed))]
+    (xwidth, nwidth, fb_xwidth, fb_nwidth, cache_bits) = params
+    vectors = []
+    for i in range(count):
+        lo = 1 if i == 0 else rng.randrange(1, 1 << min(xwidth, 20))
+        hi = min(lo + rng.randrange(1, 1000), 1 << xwidth) # no seed 0 after the wrap
+        events = []
+        nmax = 0
+        for x in range(lo, hi):
+            (out, err_x, err_n, _) = result(x, xwidth, nwidth, (fb_xwidth, fb_nwidth))
+            if out > nmax or x == lo and out > 0:
+                nmax = out
+                events.append(('R', out, x))
+            elif err_n:
+                events.append(('N', out, x))
+            elif err_x:
+                events.append(('X', out, x))
+        vectors.append(((lo, hi), events))
+    return vectors
+
+def sim_collatz(params, vectors, vcd=None, glide=False, core=None):
+    # [(seed, expected, got)] of the failing vectors, cycles simulated;
+    # core: another Collatz(*params) than collatz.Collatz, without mem
+    from collatz import Collatz
+    collatz = (core or Collatz)(*params)
+    failures = []
+    cycles = [0]
+    with _simulator(collatz, vcd, [collatz.ld_x, collatz.start, collatz.rdy]) as sim:
+        def proc():
+            yield collatz.glide.eq(glide)
+            for (x, exp) in vectors:
+                yield collatz.ld_x.eq(x)
+                yield collatz.start.eq(1)
+                yield
+                yield collatz.start.eq(0)
+                # done is seen one cycle after the core got there; only check
+                # the cycle before and the cycle itself, polling is slower
+                for _ in range(exp[3]):
+                    yield
+                n = exp[3]
+                if n and (yield collatz.done):
+                    got = ('done early',)
+                else:
+                    while True:
+                        yield
+                        if (yield collatz.done):
+                            got = ((yield collatz.out), (yield collatz.err_x), (yield collatz.err_n), n)
+                            break
+                        n += 1
+                        if n > exp[3] + 2:
+                            got = ('not done',)
+                            break
+                cycles[0] += n + 2
+                if got != exp:
+                    failures.append((x, exp, got))
+                    continue
+                if core:
+                    continue
+                # the steps in mem, read back like Top's 'T' (with glide,
+                # those up to out)
+                addr = 0
+                for v in trajectory(x, *params)[1]:
+                    if addr >= exp[0]:
+                        break
+                    yield collatz.rd_addr.eq(addr)
+                    yield
+                    yield
+                    cycles[0] += 2
+                    r = yield collatz.rd_data
+                    if r != v & ((1 << params[0]) - 1):
+                        failures.append((x, ('mem', addr, v & ((1 << params[0]) - 1)), ('mem', addr, r)))
+                        break
+                    addr += 1 + (v & 1)
+        sim.add_sync_process(proc())
+        sim.run()
+    return (failures, cycles[0])
+
+def sim_glide(params, vectors, vcd=None):
+    return sim_collatz(params, vectors, vcd, glide=True)
+
+def sim_serial(params, vectors, vcd=None):
+    from collatz_serial import SerialCollatz
+    return sim_collatz(params[:2], vectors, vcd, glide=params[2], core=SerialCollatz)
+
+def sim_bcd(params, vectors, vcd=None):
+    from bcd import BCD1_32
+    bcd = BCD1_32()
+    failures = []
+    with _simulator(bcd, vcd, [bcd.i_val, bcd.o_digit, bcd.o_rem], clock=False) as sim:
+        def proc():
+            for ((mag, value), exp) in vectors:
+                yield bcd.mag.eq(mag)
+                yield bcd.i_val.eq(value)
+                # combinational, settles within the delay
+                yield pysim.Delay(PERIOD)
+                got = ((yield bcd.o_digit), (yield bcd.o_rem))
+                if got != exp:
+                    failures.append(((mag, value), exp, got))
+        sim.add_process(proc())
+        sim.run()
+    return (failures, len(vectors))
+
+def sim_printer(params, vectors, vcd=None):
+    from uart_printer import Top, maxn
+    top = Top(sim=True)
+    printer = top.printer
+    fifo = top.b_fifo
+    failures = []
+    cycles = [0]
+    with _simulator(Fragment.get(top, platform=None), vcd, [printer.we, fifo.r_data, fifo.r_rdy]) as sim:
+        def proc():
+            for ((cmd, data), exp) in vectors:
+                yield printer.din.eq(data | cmd << maxn)
+                yield printer.we.eq(1)
+                yield
+                yield printer.we.eq(0)
+                got = b''
+                # a byte per two cycles (r_data and r_rdy are read before
+                # they settle), plus the decimal conversion
+                for n in range(4*len(exp) + 16):
+                    if len(got) == len(exp):
+                        break
+                    if (yield fifo.r_rdy):
+                        got += bytes([(yield fifo.r_data)])
+                        yield fifo.r_en.eq(1)
+                        yield
+                        yield fifo.r_en.eq(0)
+                    yield
+                # nothing more may follow
+                for _ in range(4):
+                    yield
+                    if (yield fifo.r_rdy):
+                        got += bytes([(yield fifo.r_data)])
+                        yield fifo.r_en.eq(1)
+                        yield
+                        yield fifo.r_en.eq(0)
+                cycles[0] += n + 6
+                if got != exp:
+                    failures.append(((cmd, data), exp, got))
+        sim.add_sync_process(proc())
+        sim.run()
+    return (failures, cycles[0])
+
+def sim_spram(params, vectors, vcd=None):
+    from spram import SPRAMFIFO
+    (width, depth) = params
+    fifo = SPRAMFIFO(width, depth)
+    failures = []
+    cycles = [0]
+    with _simulator(fifo, vcd, [fifo.w_en, fifo.w_rdy, fifo.r_en, fifo.r_rdy, fifo.r_data, fifo.level]) as sim:
+        def proc():
+            # the writer offers the next word every cycle, the reader takes
+            # one after its wait; inputs are set once the outputs settled
+            sent = 0
+            got = 0
+            wait = vectors[0][1]
+            full = False
+            limit = sum(2 * w + 4 for (_, w) in vectors) + 100
+            while got < len(vectors) and cycles[0] < limit:
+                yield pysim.Delay(PERIOD / 4)
+                level = yield fifo.level
+                full |= level >= depth
+                if level > depth + 2:
+                    failures.append(('level', depth + 2, level))
+                w_en = sent < len(vectors)
+                w_rdy = yield fifo.w_rdy
+                r_en = (yield fifo.r_rdy) and wait == 0
+                yield fifo.w_en.eq(w_en)
+                yield fifo.w_data.eq(vectors[sent][0] if w_en else 0)
+                yield fifo.r_en.eq(r_en)
+                if r_en:
+                    word = yield fifo.r_data
+                    if word != vectors[got][0]:
+                        failures.append((got, vectors[got][0], word))
+                    got += 1
+                    wait = vectors[got][1] if got < len(vectors) else 0
+                elif wait and (yield fifo.r_rdy):
+                    wait -= 1
+                sent += w_en and w_rdy
+                cycles[0] += 1
+                yield pysim.Tick()
+            if got < len(vectors):
+                failures.append(('words', len(vectors), got))
+            if not full and any(w > depth for (_, w) in vectors):
+                failures.append(('full', depth, 'never'))
+        sim.add_process(proc())
+        sim.run()
+    return (failures, cycles[0])
+
+@contextlib.contextmanager
+def _simulator(fragment, vcd, traces, clock=True):
+    # vcd: basename of a .vcd/.gtkw pair to write, or None
+    from sim_trace import deep_memories
+    deep_memories()
+    with pysim.Simulator(fragment,
+                         vcd_file=open(vcd + ".vcd", "w") if vcd else None,
+                         gtkw_file=open(vcd + ".gtkw", "w") if vcd else None,
+                         traces=traces) as sim:
+        if clock:
+            sim.add_clock(PERIOD)
+        yield sim
+
+def sim_top(params, vectors, vcd=None):
+    # replies byte for byte; the 'G' scan (reply: a list of events) up to
+    # the heartbeat of its last seed, in seed order (collatz_ref.in_order)
+    from collatz_driver import Top
+    from collatz_model import CollatzModel
+    from collatz_ref import in_order
+    from transcript import Transcript, XON, XOFF
+    (xwidth, nwidth, heartbeat) = params
+    collatz = CollatzModel(xwidth, nwidth)
+    top = Top(sim=True, sim_tx_cycle_accurate=True, xwidth=xwidth, nwidth=nwidth,
+              sim_tx_cycles=1, collatz=collatz, heartbeat=heartbeat)
+    fragment = Fragment.get(top, platform=None)
+    uart = top.uartfifo.uart
+    failures = []
+    cycles = [0]
+    with _simulator(fragment, vcd, [uart.rx_rdy, uart.tx_rdy, uart.tx_data]) as sim:
+        def proc():
+            for (host, (exp, busy)) in vectors:
+                got = b''
+                for b in host:
+                    yield uart.rx_data.eq(b)
+                    yield uart.rx_rdy.eq(1)
+                    yield
+                yield uart.rx_rdy.eq(0)
+                # the board's cycles, then a few per byte for the printer
+                limit = busy + 16*len(exp) + 100
+                scan = isinstance(exp, list)
+                lines = Transcript()
+                n = 0
+                while n < limit and (lines.verified < exp[-1][1] if scan else len(got) < len(exp)):
+                    yield
+                    if (yield uart.tx_rdy):
+                        b = yield uart.tx_data
+                        if b not in (XON, XOFF):
+                            got += bytes([b])
+                            lines.feed([b])
+                    n += 1
+                cycles[0] += len(host) + n
+                if scan:
+                    got = list(in_order(lines.events, 'G'))
+                if got != exp:
+                    failures.append((host, exp, got))
+        sim.add_sync_process(proc())
+        sim.add_sync_process(collatz.process())
+        sim.run_until(PERIOD * (sum(len(h) + busy + 16*len(r) + 100 for (h, (r, busy)) in vectors) + 10))
+    return (failures, cycles[0])
+
+def sim_compiled_top(params, vectors, vcd=None):
+    # failures None: skipped, no yosys or no compiled simulator here
+    import sim_compiled
+    from collatz_driver import Top
+    from transcript import Transcript, sim_collect
+    backend = sim_compiled.available()
+    if backend is None:
+        return (None, 0)
+    def top():
+        return Top(sim=True, sim_tx_cycle_accurate=True, xwidth=params[0], nwidth=params[1],
+                   sim_tx_cycles=1)
+    failures = []
+    cycles = 0
+    for (host, limit) in vectors:
+        exp = Transcript()
+        pytop = top()
+        fragment = Fragment.get(pytop, platform=None)
+        uart = pytop.uartfifo.uart
+        with _simulator(fragment, vcd, [uart.rx_rdy, uart.tx_rdy, uart.tx_data]) as sim:
+            # like collatz_driver.simulate and the testbench: a byte per cycle
+            def proc():
+                for b in host:
+                    yield uart.rx_data.eq(b)
+                    yield uart.rx_rdy.eq(1)
+                    yield
+                yield uart.rx_rdy.eq(0)
+            sim.add_sync_process(proc())
+            sim.add_sync_process(sim_collect(exp, uart))
+            sim.run_until(PERIOD * limit, run_passive=True)
+        got = Transcript()
+        sim_compiled.run(top(), backend, limit, host, got)
+        cycles += limit
+        if not exp.lines or got.lines != exp.lines:
+            failures.append((host, exp.lines, got.lines))
+    return (failures, cycles)
+
+def sim_inverse(params, vectors, vcd=None):
+    from collatz_inverse import with_delay, smallest_with_delay_at_least
+    (below,) = params
+    failures = []
+    for (length, exp) in vectors:
+        got = (smallest_with_delay_at_least(length), with_delay(length, below))
+        if got != exp:
+            failures.append((length, exp, got))
+    return (failures, 0)
+
+def sim_search(params, vectors, vcd=None):
+    # the worker side of collatz_search, in this process: a pool cannot be
+    # started from the regression's own pool workers
+    import collatz_search
+    (xwidth, nwidth, fb_xwidth, fb_nwidth, cache_bits) = params
+    size = collatz_search.table_size(1 << cache_bits, xwidth)
+    collatz_search._table = collatz_search.build_table(size, xwidth, nwidth)
+    collatz_search._widths = (xwidth, nwidth)
+    collatz_search._fallback = (fb_xwidth, fb_nwidth)
+    failures = []
+    for (lohi, exp) in vectors:
+        got = collatz_search._chunk(lohi)
+        if got != exp:
+            failures.append((lohi, exp, got))
+    return (failures, 0)
+
+KINDS = {
+    'collatz': (collatz_vectors, sim_collatz),
+    'glide': (glide_vectors, sim_glide),
+    'serial': (serial_vectors, sim_serial),
+    'bcd': (bcd_vectors, sim_bcd),
+    'printer': (printer_vectors, sim_printer),
+    'spram': (spram_vectors, sim_spram),
+    'top': (top_vectors, sim_top),
+    'inverse': (inverse_vectors, sim_inverse),
+    'search': (search_vectors, sim_search),
+    'compiled': (compiled_vectors, sim_compiled_top),
+}
+
+def name(kind, params):
+    return '%s%s' % (kind, '(%s)' % ', '.join(map(str, params)) if params else '')
+
+def run_config(job):
+    # worker: (kind, params, vectors) -> (kind, params, vectors, failures, cycles, seconds)
+    (kind, params, vectors) = job
+    t0 = time.time()
+    (failures, cycles) = KINDS[kind][1](params, vectors)
+    return (kind, params, len(vectors), failures, cycles, time.time() - t0)
+
+def run(suite=SUITE, workers=None, seed=0, scale=1.0):
+    # yields run_config() results as the configurations finish
+    rng = random.Random(seed)
+    jobs = []
+    for (kind, params, count) in suite:
+        count = max(1, int(count * scale))
+        jobs.append((kind, params, KINDS[kind][0](params, count, rng)))
+    # the slowest first, they decide when the pool is done
+    jobs.sort(key=lambda job: -sum(v[1][3] for v in job[2]) if job[0] in ('collatz', 'glide', 'serial') else 0)
+    if workers == 0:
+        yield from map(run_config, jobs)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(run_config, jobs)
+
+def main(kinds=None, workers=None, seed=0, scale=1.0, file=sys.stdout):
+    # runs the suite (only the configurations of 'kinds' if given), returns
+    # the number of failing vectors
+    suite = [c for c in SUITE if kinds is None or c[0] in kinds]
+    t0 = time.time()
+    total = 0
+    failed = 0
+    for (kind, params, count, failures, cycles, seconds) in run(suite, workers, seed, scale):
+        if failures is None:
+            print('%-20s %5d vectors skipped, tools not installed' % (name(kind, params), count),
+                  file=file, flush=True)
+            continue
+        total += count
+        failed += len(failures)
+        print('%-20s %5d vectors %7d cycles %6.1f s  %s' % (
+            name(kind, params), count, cycles, seconds,
+            'ok' if not failures else '%d FAILED' % len(failures)), file=file, flush=True)
+        for (vector, exp, got) in failures[:10]:
+            print('    %s: expected %s, got %s' % (vector, exp, got), file=file)
+    print('%d vectors, %d failed, %.1f s' % (total, failed, time.time() - t0), file=file)
+    return failed
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", action="append", choices=sorted(KINDS), default=None,
+                        help="run only these kinds of configurations, repeat for more")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, 0: run here (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of the vector tables (default: %(default)s)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply the number of vectors per configuration (default: %(default)s)")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.only, args.workers, args.seed, args.scale) else 0)
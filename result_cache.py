@@ -0,0 +1,104 @@
+import asyncio
+import collections
+import os
+
+import numpy as np
+
+# Host side cache of device query results, seed -> (out, err_x, err_n), in
+# front of collatz_client.Client.
+#
+# At most 'size' seeds are kept, the least recently used goes first. The
+# cache is saved as a small header followed by fixed size entries, oldest
+# first, so loading it also restores the LRU order. Results depend on the
+# board's widths, a file written for other widths is ignored.
+
+MAGIC = b'CZC1'
+HEADER = np.dtype([('magic', 'S4'), ('xwidth', '<u2'), ('nwidth', '<u2')])
+ENTRY = np.dtype([('seed', '<u8'), ('out', '<u4'), ('flags', 'u1')]) # flags: 1 err_n, 2 err_x
+
+class ResultCache:
+    def __init__(self, path=None, size=1 << 20, xwidth=34, nwidth=12):
+        # xwidth, nwidth: those of the board (collatz_driver's defaults)
+        self.path = path
+        self.size = size
+        self.xwidth = xwidth
+        self.nwidth = nwidth
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, seed):
+        # (out, err_x, err_n) or None
+        v = self.entries.get(seed)
+        if v is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(seed)
+        return v
+
+    def put(self, seed, result):
+        self.entries[seed] = result
+        self.entries.move_to_end(seed)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        n = self.hits + self.misses
+        return self.hits / n if n else 0.0
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER)
+            if (len(header) != 1 or header[0]['magic'] != MAGIC or
+                    (header[0]['xwidth'], header[0]['nwidth']) != (self.xwidth, self.nwidth)):
+                return
+            a = np.frombuffer(f.read(), dtype=ENTRY)
+        for (seed, out, flags) in a[-self.size:].tolist():
+            self.entries[seed] = (out, flags >> 1 & 1, flags & 1)
+
+    def save(self):
+        header = np.array([(MAGIC, self.xwidth, self.nwidth)], dtype=HEADER)
+        a = np.fromiter(((seed, out, err_n | err_x << 1)
+                         for (seed, (out, err_x, err_n)) in self.entries.items()),
+                        dtype=ENTRY, count=len(self.entries))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(a.tobytes())
+        os.replace(tmp, self.path)
+
+class CachedClient:
+    # query()/query_many() of collatz_client.Client, answered from the cache
+    # where possible; a seed already on its way to the board is not sent
+    # again, the second caller waits for the first reply
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.inflight = {} # seed -> future
+
+    async def query(self, seed):
+        fut = self.inflight.get(seed)
+        if fut is not None:
+            # not in the cache yet, but it does not reach the board either
+            self.cache.hits += 1
+            return await asyncio.shield(fut)
+        v = self.cache.get(seed)
+        if v is not None:
+            return v
+        fut = asyncio.ensure_future(self.client.query(seed))
+        self.inflight[seed] = fut
+        try:
+            v = await asyncio.shield(fut)
+        finally:
+            del self.inflight[seed]
+        self.cache.put(seed, v)
+        return v
+
+    async def query_many(self, seeds):
+        return await asyncio.gather(*(self.query(x) for x in seeds))
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import re
+import subprocess
+
+from nmigen import *
+from nmigen._toolchain import has_tool, require_tool
+
+# Simulation of collatz_driver.Top (sim=True) by a compiled simulator, for
+# runs of millions of cycles that pysim would take hours for.
+#
+# Harness exposes the clock and the host side of the UART model (UART_SIM)
+# as ports, verilog.convert (yosys) turns it into the Verilog module
+# 'harness', and TESTBENCH drives that like collatz_driver.s drives the
+# pysim simulation: one host byte per cycle from the start, and every byte
+# handed to the UART model for transmission (sim_collect) is printed as
+# "tx <hex>". The simulator binary is built once per design, in
+# build/sim_<backend>_<hash>/; the number of cycles, the host bytes and the
+# vcd are run time arguments.
+#
+#   verilator: 5.0 or later (--binary), fastest
+#   icarus:    iverilog/vvp, slower but compiles quickly
+#
+# Only what the Verilog can show is supported: no CollatzModel (a pysim
+# process), no SignalTracer windows or EventLog; --trace all dumps the
+# testbench's vcd (Verilog signal names, not nMigen's).
+
+BACKENDS = ("verilator", "icarus")
+MAX_HOST = 4096 # host bytes, size of the testbench's array
+
+TESTBENCH = """\
+`timescale 1ns/1ns
+module tb;
+    reg clk = 1'b0;
+    reg [7:0] host [0:%(max_host)d-1];
+    reg [8*1024-1:0] path;
+    integer host_len = 0;
+    integer cycles = 0;
+    integer cycle = 0;
+    wire rx_rdy = cycle < host_len;
+    wire [7:0] rx_data = rx_rdy ? host[cycle %% %(max_host)d] : 8'h00;
+    wire [7:0] tx_data;
+    wire tx_rdy;
+
+    harness dut (
+        .tb_clk(clk),
+        .tb_rx_data(rx_data),
+        .tb_rx_rdy(rx_rdy),
+        .tb_tx_data(tx_data),
+        .tb_tx_rdy(tx_rdy)
+    );
+
+    initial begin
+        if (!$value$plusargs("cycles=%%d", cycles))
+            cycles = 1;
+        if ($value$plusargs("host_len=%%d", host_len) && host_len > 0) begin
+            if ($value$plusargs("host=%%s", path))
+                $readmemh(path, host, 0, host_len - 1);
+        end
+        if ($value$plusargs("vcd=%%s", path)) begin
+            $dumpfile(path);
+            $dumpvars(0, tb);
+        end
+    end
+
+    always #1 clk = ~clk;
+
+    // values of the cycle before the edge, like a pysim sync process
+    always @(posedge clk) begin
+        if (tx_rdy)
+            $display("tx %%02x", tx_data);
+        cycle <= cycle + 1;
+        if (cycle + 1 >= cycles)
+            $finish;
+    end
+endmodule
+""" % dict(max_host=MAX_HOST)
+
+_TX = re.compile(r'^tx ([0-9a-f]{2})$')
+
+class Harness(Elaboratable):
+    # top (collatz_driver.Top with sim=True) with its clock and the UART
+    # model's host side as ports of the Verilog module
+    def __init__(self, top):
+        self.top = top
+        self.tb_clk = Signal()
+        self.tb_rx_data = Signal(8)
+        self.tb_rx_rdy = Signal()
+        self.tb_tx_data = Signal(8)
+        self.tb_tx_rdy = Signal()
+
+    def ports(self):
+        return [self.tb_clk, self.tb_rx_data, self.tb_rx_rdy, self.tb_tx_data, self.tb_tx_rdy]
+
+    def elaborate(self, platform):
+        m = Module()
+        # Top creates its UART_FIFO when elaborated
+        m.submodules.top = Fragment.get(self.top, platform)
+        uart = self.top.uartfifo.uart
+        m.d.comb += [
+            ClockSignal().eq(self.tb_clk),
+            ResetSignal().eq(0),
+            uart.rx_data.eq(self.tb_rx_data),
+            uart.rx_rdy.eq(self.tb_rx_rdy),
+            self.tb_tx_data.eq(uart.tx_data),
+            self.tb_tx_rdy.eq(uart.tx_rdy),
+        ]
+        return m
+
+def available(backend=None):
+    # the first usable backend (of 'backend' only, if given), or None;
+    # yosys is needed for the Verilog
+    if not has_tool("yosys"):
+        return None
+    for name in ([backend] if backend else BACKENDS):
+        if name == "verilator" and has_tool("verilator"):
+            version = subprocess.run([require_tool("verilator"), "--version"],
+                                     stdout=subprocess.PIPE, encoding="utf-8").stdout
+            m = re.search(r'Verilator (\d+)', version)
+            if m and int(m.group(1)) >= 5:
+                return name
+        elif name == "icarus" and has_tool("iverilog") and has_tool("vvp"):
+            return name
+    return None
+
+def build(top, backend, root="build"):
+    # compiles Top into a simulator binary, returns the command that runs it
+    from nmigen.back import verilog
+    harness = Harness(top)
+    text = verilog.convert(harness, name="harness", ports=harness.ports())
+    key = hashlib.blake2b((backend + TESTBENCH + text).encode(), digest_size=8).hexdigest()
+    path = os.path.abspath(os.path.join(root, "sim_%s_%s" % (backend, key)))
+    if backend == "verilator":
+        command = [os.path.join(path, "obj_dir", "Vtb")]
+    else:
+        command = [require_tool("vvp"), "-n", os.path.join(path, "tb.vvp")]
+    if os.path.exists(command[-1]):
+        return command
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "top.v"), "w") as f:
+        f.write(text)
+    with open(os.path.join(path, "tb.v"), "w") as f:
+        f.write(TESTBENCH)
+    if backend == "verilator":
+        subprocess.run([require_tool("verilator"), "--binary", "--trace", "-O3", "-Wno-fatal", "-Wno-lint",
+                        "--top-module", "tb", "tb.v", "top.v"], cwd=path, check=True)
+    else:
+        subprocess.run([require_tool("iverilog"), "-g2012", "-s", "tb", "-o", "tb.vvp", "tb.v", "top.v"],
+                       cwd=path, check=True)
+    return command
+
+def run(top, backend, cycles, host, transcript, vcd=None, root="build"):
+    # simulates 'cycles' cycles of top, the host sending 'host' (bytes);
+    # feeds every transmitted byte into transcript
+    if len(host) > MAX_HOST:
+        raise ValueError("at most %d host bytes, got %d" % (MAX_HOST, len(host)))
+    command = build(top, backend, root)
+    hostfile = os.path.join(os.path.dirname(command[-1]), "host%d.hex" % os.getpid())
+    with open(hostfile, "w") as f:
+        f.write("".join("%02x\n" % b for b in host))
+    args = ["+cycles=%d" % cycles, "+host_len=%d" % len(host), "+host=%s" % hostfile]
+    if vcd:
+        args.append("+vcd=%s" % os.path.abspath(vcd))
+    try:
+        with subprocess.Popen(command + args, stdout=subprocess.PIPE, encoding="utf-8") as proc:
+            for line in proc.stdout:
+                m = _TX.match(line.strip())
+                if m:
+                    transcript.feed([int(m.group(1), 16)])
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command)
+    finally:
+        os.remove(hostfile)
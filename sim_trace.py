@@ -0,0 +1,120 @@
+# Low overhead tracing for long pysim runs.
+#
+# pysim's own vcd_file traces every signal of the design, every cycle. For
+# long scans that is both slow and huge. SignalTracer only samples a named
+# list of signals and only writes them inside a time or trigger window.
+# EventLog is more compact still: one line per FSM state transition and per
+# UART byte.
+import sys
+
+from vcd import VCDWriter
+
+def deep_memories(depth=1 << 14):
+    # pysim compiles a memory read port into one nested expression per word,
+    # too deep for Python's default recursion limit at e.g. Collatz(34,12)'s
+    # 4096 words; call before building a Simulator with memories up to depth
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * depth + 1000))
+
+def resolve(top, name):
+    # "uartfifo.r_fifo.level" -> top.uartfifo.r_fifo.level
+    obj = top
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+def fsm_states(top):
+    # FSM state signals of Top, UART_Printer and UART_FIFO, only known after
+    # elaboration (e.g. Fragment.get(top, platform))
+    return [
+        ('top', top.fsm.state),
+        ('uart_printer', top.uart_printer.fsm.state),
+        ('uartfifo.rd_from_host', top.uartfifo.fsm_rd_from_host.state),
+        ('uartfifo.wr_to_host', top.uartfifo.fsm_wr_to_host.state),
+    ]
+
+def state_name(signal, value):
+    if signal.decoder:
+        return signal.decoder(value).split('/')[0]
+    return str(value)
+
+class SignalTracer:
+    # start/stop are in seconds of simulated time, trigger is a (signal, value)
+    # pair, the window opens once both start has passed and signal >= value
+    # (e.g. (top.nmaxcnt, 100) to trace from the 100th record on).
+    def __init__(self, vcd_file, signals, period, start=0.0, stop=None, trigger=None):
+        self.vcd_file = vcd_file
+        self.signals = signals # [(name, signal)]
+        self.period = period
+        self.start = start
+        self.stop = stop
+        self.trigger = trigger
+        self.writer = None
+
+    def process(self):
+        ns = self.period * 1e9
+        self.writer = writer = VCDWriter(self.vcd_file, timescale="1 ns", comment="sim_trace")
+        variables = []
+        for (name, signal) in self.signals:
+            scope, _, var = ('top.' + name).rpartition('.')
+            if signal.decoder:
+                v = writer.register_var(scope, var, 'string')
+            else:
+                v = writer.register_var(scope, var, 'wire', size=len(signal))
+            variables.append(v)
+        last = [None] * len(self.signals)
+        cycle = 0
+        armed = self.trigger is None
+        while True:
+            t = cycle * self.period
+            if not armed:
+                (signal, value) = self.trigger
+                armed = (yield signal) >= value
+            if armed and t >= self.start and (self.stop is None or t <= self.stop):
+                for (i, (name, signal)) in enumerate(self.signals):
+                    value = yield signal
+                    if value != last[i]:
+                        last[i] = value
+                        if signal.decoder:
+                            value = state_name(signal, value)
+                        writer.change(variables[i], int(cycle * ns), value)
+            cycle += 1
+            yield
+
+    def close(self):
+        # call after the simulation, the process itself never returns
+        if self.writer:
+            self.writer.close()
+
+class EventLog:
+    # fsms: [(name, state signal)], uart: the UART (model) of UART_FIFO
+    def __init__(self, log_file, fsms, uart, period):
+        self.log_file = log_file
+        self.fsms = fsms
+        self.uart = uart
+        self.period = period
+
+    def _write(self, cycle, what, text):
+        self.log_file.write('%12d ns  %-22s %s\n' % (round(cycle * self.period * 1e9), what, text))
+
+    def process(self):
+        last = [None] * len(self.fsms)
+        cycle = 0
+        while True:
+            for (i, (name, state)) in enumerate(self.fsms):
+                value = yield state
+                if value != last[i]:
+                    if last[i] is not None:
+                        self._write(cycle, name,
+                                    '%s -> %s' % (state_name(state, last[i]), state_name(state, value)))
+                    last[i] = value
+            if (yield self.uart.tx_rdy):
+                self._write(cycle, 'uart.tx', _byte(((yield self.uart.tx_data))))
+            if (yield self.uart.rx_rdy):
+                self._write(cycle, 'uart.rx', _byte(((yield self.uart.rx_data))))
+            cycle += 1
+            yield
+
+def _byte(b):
+    if 32 <= b < 127:
+        return '0x%02x %r' % (b, chr(b))
+    return '0x%02x' % b
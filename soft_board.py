@@ -0,0 +1,256 @@
+import asyncio
+import socket
+
+from collatz_ref import delay, trajectory, parity_words, serial_cycles
+from collatz_client import NBYTES, Client
+
+# Software stand-in for the board: the command protocol of collatz_driver.Top
+# (see collatz_client.py) on top of collatz_ref, byte for byte the output
+# UART_Printer would send, without XON/XOFF.
+#
+# feed() takes host bytes and returns the replies of the commands they
+# complete, each with the number of clock cycles the board would need for
+# it (Collatz cycles plus a few per seed, printing not included), so a
+# caller can pace them like the board (see serve()).
+#
+# The fallback unit is mirrored too: a seed Collatz gives up on is finished
+# with the fallback's widths and merged where Top merges it (before the
+# next such seed, a heartbeat or the end of a range), its cycles run next
+# to the scan's and only count where Top would wait for them.
+
+END = b' \r\n\x07'
+SEED_OVERHEAD = 3 # cycles per seed outside Collatz: INC, CALC_START, CALC
+HEARTBEAT = 20 # same as collatz_driver.HEARTBEAT
+FALLBACK = (64, 16) # same as collatz_driver.FALLBACK
+
+class SoftBoard:
+    def __init__(self, xwidth=34, nwidth=12, heartbeat=HEARTBEAT, fallback=FALLBACK):
+        self.xwidth = xwidth
+        self.nwidth = nwidth
+        self.heartbeat = heartbeat
+        self.fallback = fallback # None: N and X lines straight from Collatz
+        self.buf = bytearray()
+        self.seeds = 0
+        self.nmax = 0
+        self.nmaxcnt = 0
+        self.xmax = 0
+        self.x = 0 # Top.x, shared by the scan, Q and R like on the board
+        self.scanning = False # 'A' received, no more commands (see scan())
+        self.glide = False # 'G' received, scan() is a glide scan
+        self.hung = False # the scan wrapped around to seed 0, Collatz never finishes
+        self.pending = None # (seed, nmax before it, cycles left) in the fallback unit
+
+    def _seed(self, x, glide=False):
+        # one seed through Collatz: (out, err_x, err_n, cycles)
+        x &= (1 << self.xwidth) - 1
+        if x == 0:
+            self.hung = True
+            return None
+        self.seeds += 1
+        return delay(x, self.xwidth, self.nwidth, glide)
+
+    def _scan_seed(self, x, lines, last=False):
+        # like Top's CALC state, appends the line printed for seed x (if any),
+        # and INC's merge of the fallback's seed and the heartbeat of a glide
+        # scan; last: the last seed of a range
+        r = self._seed(x, self.glide)
+        if r is None:
+            return 0
+        (out, err_x, err_n, cycles) = r
+        cycles += SEED_OVERHEAD
+        if self.pending:
+            self.pending[2] -= cycles
+        if out > self.nmax:
+            self.nmax = out
+            self.nmaxcnt += 1
+            self.xmax = x
+            lines.append('%s%d %d %d' % ('G ' if self.glide else '', self.nmaxcnt, self.nmax, self.xmax))
+        elif (err_n or err_x) and self.fallback:
+            # FB_HAND
+            if self.pending:
+                cycles += self._merge(lines)
+            (_, fb_err_x, fb_err_n, fb_cycles) = delay(x, *self.fallback, self.glide)
+            self.pending = [x, self.nmax, serial_cycles(fb_cycles, fb_err_x | fb_err_n, self.fallback[0])]
+            cycles += 1
+        elif err_n:
+            lines.append('N %d %d' % (out, x))
+        elif err_x:
+            lines.append('X %d %d' % (out, x))
+        if self.pending and ((x + 1) % (1 << self.heartbeat) == 0 or last):
+            cycles += self._merge(lines)
+        if self.glide and (x + 1) % (1 << self.heartbeat) == 0:
+            lines.append('V %d' % x)
+        return cycles
+
+    def _merge(self, lines):
+        # Top's F_MERGE: the fallback's result for the pending seed, as if
+        # it had come in seed order; returns the cycles waited for it
+        (x, nmax, left) = self.pending
+        self.pending = None
+        (out, err_x, err_n, _) = delay(x, *self.fallback, self.glide)
+        if out > nmax:
+            self.nmaxcnt += 1
+            if out >= self.nmax:
+                self.nmax = out
+                self.xmax = x
+            lines.append('F %d %d %d' % (self.nmaxcnt, out, x))
+        elif err_n:
+            lines.append('N %d %d' % (out, x))
+        elif err_x:
+            lines.append('X %d %d' % (out, x))
+        return max(left, 0) + 1
+
+    def _number(self, at):
+        # number starting at buf[at]: (value, end) or (None, end) if cut short
+        # by a command byte at buf[end], or None if incomplete
+        for i in range(NBYTES):
+            if at + i >= len(self.buf):
+                return None
+            if not self.buf[at + i] & 0x80:
+                return (None, at + i)
+        v = sum((self.buf[at + i] & 0x7f) << (7*i) for i in range(NBYTES))
+        return (v, at + NBYTES)
+
+    def feed(self, data):
+        # returns [(reply bytes, cycles)] for the commands data completes
+        replies = []
+        if self.scanning or self.hung:
+            return replies
+        self.buf.extend(data)
+        while self.buf and not self.hung:
+            c = chr(self.buf[0])
+            if c in ('A', 'G'):
+                del self.buf[:]
+                self.scanning = True
+                if c == 'G':
+                    self.glide = True
+                    self.nmax = 0
+                    self.nmaxcnt = 0
+                    self.xmax = 0
+                break
+            elif c in ('Q', 'R', 'T', 'P'):
+                nums = []
+                at = 1
+                for _ in range(2 if c == 'R' else 1):
+                    r = self._number(at)
+                    if r is None or r[0] is None:
+                        break
+                    (v, at) = r
+                    nums.append(v)
+                    if self._rejected(nums):
+                        break
+                if r is None:
+                    break # wait for more bytes
+                del self.buf[:at if r[0] is not None else r[1]]
+                if r[0] is None:
+                    continue # cut short, the number is dropped
+                if self._rejected(nums):
+                    # like Top's NUM_DONE, the rest of an R is swallowed
+                    replies.append((('? %s' % c).encode() + END, 1))
+                elif c == 'Q':
+                    replies.append(self._query(nums[0]))
+                elif c in ('T', 'P'):
+                    replies.append(self._trajectory(c, nums[0]))
+                else:
+                    replies.append(self._range(nums[0], nums[1]))
+            elif c == 'S':
+                del self.buf[:1]
+                replies.append((('S %d %d %d' % (self.seeds, self.nmax, self.xmax)).encode() + END, 1))
+            else:
+                del self.buf[:1] # swallow and ignore
+        return replies
+
+    def _rejected(self, nums):
+        # Top's NUM_DONE: a seed or range start of 0 (xwidth bits), or a
+        # range end above 2**xwidth, would never complete
+        if len(nums) == 1:
+            return nums[0] & ((1 << self.xwidth) - 1) == 0
+        return nums[1] > 1 << self.xwidth
+
+    def _query(self, x):
+        x &= (1 << self.xwidth) - 1
+        self.x = x
+        r = self._seed(x) # x > 0, see _rejected()
+        (out, err_x, err_n, cycles) = r
+        return (('Q %d %d %d' % (out, x, err_n | err_x << 1)).encode() + END, cycles + SEED_OVERHEAD)
+
+    def _trajectory(self, c, x):
+        # like _query, then Top's walk of Collatz.mem, two cycles per step
+        x &= (1 << self.xwidth) - 1
+        self.x = x
+        r = self._seed(x) # x > 0, see _rejected()
+        (out, xs) = trajectory(x, self.xwidth, self.nwidth)
+        values = parity_words(xs) if c == 'P' else [v & 0xffffffff for v in xs]
+        line = ' '.join([c, str(out), str(x)] + ['%08x' % v for v in values])
+        return (line.encode() + END, r[3] + SEED_OVERHEAD + 2*len(xs))
+
+    def _range(self, start, stop):
+        self.nmax = 0
+        self.nmaxcnt = 0
+        self.xmax = 0
+        mask = (1 << self.xwidth) - 1
+        self.x = (start - 1) & mask
+        lines = []
+        cycles = 0
+        while self.x + 1 < stop:
+            self.x = (self.x + 1) & mask
+            cycles += self._scan_seed(self.x, lines, last=self.x + 1 >= stop)
+        lines.append('E %d %d' % (self.nmax, self.xmax))
+        return (b''.join(l.encode() + END for l in lines), cycles)
+
+    def scan(self, count):
+        # after 'A': the next count seeds of the endless scan, (bytes, cycles)
+        lines = []
+        cycles = 0
+        for _ in range(count):
+            self.x = (self.x + 1) & ((1 << self.xwidth) - 1)
+            cycles += self._scan_seed(self.x, lines)
+        return (b''.join(l.encode() + END for l in lines), cycles)
+
+async def serve(board, reader, writer, clock=12e6, stall_after=None):
+    # answers host bytes from reader on writer; each reply is held back for
+    # its cycles at 'clock' Hz (None: as fast as possible). After stall_after
+    # replies the board goes silent (to test timeouts). The model runs in a
+    # thread, so the event loop (e.g. the host side of the link) goes on.
+    loop = asyncio.get_event_loop()
+    replies = 0
+    try:
+        while True:
+            data = await reader.read(1 << 16)
+            if not data:
+                break
+            if stall_after is not None and replies >= stall_after:
+                continue
+            for (reply, cycles) in await loop.run_in_executor(None, board.feed, data):
+                if clock:
+                    await asyncio.sleep(cycles / clock)
+                writer.write(reply)
+                await writer.drain()
+                replies += 1
+            while board.scanning:
+                (reply, cycles) = await loop.run_in_executor(None, board.scan, 1 << 12)
+                if clock:
+                    await asyncio.sleep(cycles / clock)
+                writer.write(reply)
+                await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+_serving = set() # serve() tasks of open_soft()
+
+async def open_soft(window=64, xwidth=34, nwidth=12, clock=12e6, stall_after=None):
+    # a collatz_client.Client connected to a SoftBoard (over a socket pair)
+    (a, b) = socket.socketpair()
+    (reader, writer) = await asyncio.open_connection(sock=a)
+    (board_reader, board_writer) = await asyncio.open_connection(sock=b)
+    task = asyncio.ensure_future(serve(SoftBoard(xwidth, nwidth), board_reader, board_writer,
+                                       clock=clock, stall_after=stall_after))
+    # the loop only keeps a weak reference to tasks
+    _serving.add(task)
+    task.add_done_callback(_serving.discard)
+    return Client(reader, writer, window)
+
+async def wait_closed():
+    # until all open_soft() boards saw their client close the link
+    await asyncio.gather(*_serving)
@@ -0,0 +1,143 @@
+from nmigen import *
+from nmigen.lib.fifo import SyncFIFO
+
+# Large buffers on the iCE40UP5K's single port RAM (SPRAM, SB_SPRAM256KA:
+# four blocks of 16K x 16 bits, 128 KB in all), which the block RAMs (EBR:
+# 30 of 4 kbit) are too small for, and which the design needs for compute.
+#
+# SPRAM: a single port RAM, addr, w_data, w_en; r_data is the word at the
+# previous cycle's addr (one cycle read latency), and undefined after a
+# write. On the UP5K it is built from SB_SPRAM256KA, side by side for
+# widths above 16 bits and one above the other for depths above 16K (at
+# most the four blocks there are). Without a platform (pysim, sim_compiled)
+# or on another device a Memory with the same timing stands in.
+#
+# SPRAMFIFO: a first word fall through FIFO with the interface of nMigen's
+# SyncFIFOBuffered (w_en, w_data, w_rdy, r_en, r_data, r_rdy, level), on
+# SPRAM, e.g. the UART_FIFO w_fifo as a backlog of records.
+
+BLOCK_WIDTH = 16
+BLOCK_DEPTH = 16384
+BLOCKS = 4 # on the iCE40UP5K
+
+def blocks(width, depth):
+    # SB_SPRAM256KA of an SPRAM(width, depth) on the board
+    return ((width + BLOCK_WIDTH - 1) // BLOCK_WIDTH) * ((depth + BLOCK_DEPTH - 1) // BLOCK_DEPTH)
+
+class SPRAM(Elaboratable):
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.cols = (width + BLOCK_WIDTH - 1) // BLOCK_WIDTH
+        self.banks = (depth + BLOCK_DEPTH - 1) // BLOCK_DEPTH
+        assert blocks(width, depth) <= BLOCKS, "%d x %d needs more than %d SPRAMs" % (width, depth, BLOCKS)
+
+        self.addr = Signal(range(depth))
+        self.w_data = Signal(width)
+        self.w_en = Signal()
+        self.r_data = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+        if platform is None or getattr(platform, "device", None) != "iCE40UP5K":
+            # behavioural model, see sim_trace.deep_memories for pysim
+            mem = Memory(width=self.width, depth=self.depth)
+            m.submodules.rdport = rdport = mem.read_port(transparent=False)
+            m.submodules.wrport = wrport = mem.write_port()
+            m.d.comb += [
+                rdport.addr.eq(self.addr),
+                wrport.addr.eq(self.addr),
+                wrport.data.eq(self.w_data),
+                wrport.en.eq(self.w_en),
+                self.r_data.eq(rdport.data),
+            ]
+            return m
+
+        addr = Signal(14)
+        din = Signal(BLOCK_WIDTH * self.cols)
+        bank = Signal(range(self.banks)) # of the word on r_data
+        m.d.comb += [
+            addr.eq(self.addr),
+            din.eq(self.w_data),
+        ]
+        m.d.sync += bank.eq(self.addr >> 14)
+        dout = []
+        for b in range(self.banks):
+            dout.append(Signal(BLOCK_WIDTH * self.cols, name="dout_%d" % b))
+            select = (self.addr >> 14) == b if self.banks > 1 else Const(1)
+            for c in range(self.cols):
+                m.submodules["spram_%d_%d" % (b, c)] = Instance("SB_SPRAM256KA",
+                    i_ADDRESS=addr,
+                    i_DATAIN=din[BLOCK_WIDTH*c:BLOCK_WIDTH*(c+1)],
+                    i_MASKWREN=Const(0xf, 4),
+                    i_WREN=self.w_en,
+                    i_CHIPSELECT=select,
+                    i_CLOCK=ClockSignal(),
+                    i_STANDBY=Const(0),
+                    i_SLEEP=Const(0),
+                    i_POWEROFF=Const(1), # active low
+                    o_DATAOUT=dout[b][BLOCK_WIDTH*c:BLOCK_WIDTH*(c+1)])
+        with m.Switch(bank):
+            for b in range(self.banks):
+                with m.Case(b):
+                    m.d.comb += self.r_data.eq(dout[b])
+        return m
+
+class SPRAMFIFO(Elaboratable):
+    # The single port takes either a write or a read per cycle. Reads go
+    # ahead into a two word output buffer (registers), and take priority:
+    # while the reader keeps up a writer gets every other cycle, which is
+    # plenty for a UART's w_fifo. A word takes three cycles from w_en to
+    # r_rdy.
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+
+        self.w_en = Signal()
+        self.w_data = Signal(width)
+        self.w_rdy = Signal()
+        self.r_en = Signal()
+        self.r_data = Signal(width)
+        self.r_rdy = Signal()
+        self.level = Signal(range(depth + 3)) # RAM plus output buffer
+
+        self.ram = SPRAM(width, depth)
+        self.out = SyncFIFO(width=width, depth=2)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.ram = ram = self.ram
+        m.submodules.out = out = self.out
+
+        wp = Signal(range(self.depth))
+        rp = Signal(range(self.depth))
+        count = Signal(range(self.depth + 1)) # words in the RAM
+        pending = Signal() # read last cycle, r_data goes to out
+
+        do_read = Signal()
+        do_write = Signal()
+        m.d.comb += [
+            do_read.eq((count != 0) & (out.level + pending < 2)),
+            self.w_rdy.eq((count != self.depth) & ~do_read),
+            do_write.eq(self.w_en & self.w_rdy),
+
+            ram.addr.eq(Mux(do_read, rp, wp)),
+            ram.w_data.eq(self.w_data),
+            ram.w_en.eq(do_write),
+            out.w_data.eq(ram.r_data),
+            out.w_en.eq(pending),
+
+            self.r_data.eq(out.r_data),
+            self.r_rdy.eq(out.r_rdy),
+            out.r_en.eq(self.r_en),
+            self.level.eq(count + out.level + pending),
+        ]
+        m.d.sync += [
+            pending.eq(do_read),
+            count.eq(count + do_write - do_read),
+        ]
+        with m.If(do_read):
+            m.d.sync += rp.eq(Mux(rp == self.depth - 1, 0, rp + 1))
+        with m.If(do_write):
+            m.d.sync += wp.eq(Mux(wp == self.depth - 1, 0, wp + 1))
+        return m
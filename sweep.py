@@ -0,0 +1,142 @@
+import itertools
+import multiprocessing
+import re
+import subprocess
+import sys
+
+from soft_board import SEED_OVERHEAD
+
+# Design space sweep of collatz_driver.Top: every combination of the grid
+# (core variant, xwidth, nwidth, UART FIFO depth, printer FIFO depth, UART
+# divisor) is built with the local yosys/nextpnr flow, one process per
+# configuration, through build_cache (an unchanged configuration is not
+# built again). From the nextpnr log come the logic cells and block RAMs
+# used and the achieved Fmax; from benchmark.bench_core the core's cycles
+# per seed (plus SEED_OVERHEAD for Top), which give the seeds per second at
+# the board's 12 MHz and, with a PLL, at Fmax.
+#
+# Without the toolchain only the cycles are reported. A configuration fits
+# if nextpnr placed and routed it and it meets 12 MHz.
+
+CLOCK = 12e6
+
+GRID = dict( # default of collatz_driver.py sweep
+    variant=None, # all of benchmark.VARIANTS
+    xwidth=[34, 32],
+    nwidth=[12, 11],
+    fifo_depth=[1024, 512],
+    printer_depth=[128],
+    divisor=[4],
+)
+
+_UTIL = re.compile(r'^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%', re.MULTILINE)
+_FMAX = re.compile(r"Max frequency for clock\s+'([^']*)': ([\d.]+) MHz")
+_LUT4 = re.compile(r'^\s+SB_LUT4\s+(\d+)', re.MULTILINE)
+
+def parse_nextpnr(log):
+    # {'lc': used, 'lc_total': ..., 'ram': ..., 'fmax': MHz} from nextpnr's log
+    res = {}
+    for (cell, used, total) in _UTIL.findall(log):
+        name = {'ICESTORM_LC': 'lc', 'ICESTORM_RAM': 'ram', 'ICESTORM_SPRAM': 'spram'}.get(cell)
+        if name:
+            res[name] = int(used)
+            res[name + '_total'] = int(total)
+    # the last report (after routing) per clock, the slowest clock
+    fmax = {}
+    for (clock, mhz) in _FMAX.findall(log):
+        fmax[clock] = float(mhz)
+    if fmax:
+        res['fmax'] = min(fmax.values())
+    return res
+
+def parse_yosys(report):
+    m = _LUT4.findall(report)
+    return {'lut4': int(m[-1])} if m else {}
+
+def configurations(grid):
+    import benchmark
+    grid = dict(grid)
+    grid['variant'] = grid['variant'] or sorted(benchmark.VARIANTS)
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def _cycles(key):
+    # worker: cycles per seed of the core, simulated and checked by benchmark
+    import benchmark
+    (variant, xwidth, nwidth) = key
+    res = benchmark.bench_core(variant, xwidth, nwidth)
+    prefix = 'core.%s.%d_%d.' % key
+    if not res[prefix + 'sim_matches_ref']:
+        raise RuntimeError("%s(%d, %d) disagrees with collatz_ref" % key)
+    return (key, res[prefix + 'cycles_per_seed'])
+
+def _build(job):
+    # worker: builds one configuration, returns its resources, or 'error'
+    (config, cache_root) = job
+    import benchmark
+    import build_cache
+    from collatz_driver import Top, build_params
+    from nmigen_boards.icebreaker import ICEBreakerPlatform
+
+    collatz = benchmark.VARIANTS[config['variant']](config['xwidth'], config['nwidth'])
+    top = Top(sim=False, sim_tx_cycle_accurate=False, xwidth=config['xwidth'], nwidth=config['nwidth'],
+              collatz=collatz, fifo_depth=config['fifo_depth'], printer_depth=config['printer_depth'],
+              divisor=config['divisor'])
+    name = 'sweep_%s_%d_%d_%d_%d_%d' % tuple(config[k] for k in
+        ('variant', 'xwidth', 'nwidth', 'fifo_depth', 'printer_depth', 'divisor'))
+    try:
+        (products, _) = build_cache.build(ICEBreakerPlatform(), top, build_params(top),
+                                          build_cache.BuildCache(cache_root), name="top",
+                                          build_dir="build/" + name)
+    except subprocess.CalledProcessError:
+        # typically nextpnr failing to place a design that is too large
+        return (config, {'error': 'build failed'}) # log in build/<name>
+    res = parse_nextpnr(products.get("top.tim", "t"))
+    res.update(parse_yosys(products.get("top.rpt", "t")))
+    return (config, res)
+
+def sweep(grid=GRID, workers=None, build=None, cache_root="build_cache"):
+    # [(config, result)], result: resources (if built), cycles per seed and
+    # seeds per second; build None: if the toolchain is installed
+    configs = configurations(grid)
+    if build is None:
+        from nmigen_boards.icebreaker import ICEBreakerPlatform
+        build = ICEBreakerPlatform().has_required_tools()
+    cores = sorted({(c['variant'], c['xwidth'], c['nwidth']) for c in configs})
+    with multiprocessing.Pool(workers) as pool:
+        cycles = pool.map_async(_cycles, cores)
+        built = pool.map_async(_build, [(c, cache_root) for c in configs]) if build else None
+        cycles = dict(cycles.get())
+        built = built.get() if built else [(c, {}) for c in configs]
+    results = []
+    for (config, res) in built:
+        res = dict(res)
+        res['cycles'] = cycles[(config['variant'], config['xwidth'], config['nwidth'])] + SEED_OVERHEAD
+        res['seeds_per_second'] = CLOCK / res['cycles']
+        if 'fmax' in res:
+            res['seeds_per_second_fmax'] = res['fmax'] * 1e6 / res['cycles']
+        if build:
+            res['fits'] = 'error' not in res and res.get('fmax', 0) * 1e6 >= CLOCK
+        results.append((config, res))
+    # fitting configurations first, fastest first, then the smallest
+    results.sort(key=lambda r: (not r[1].get('fits', True), -r[1]['seeds_per_second'], r[1].get('lc', 0)))
+    return results
+
+def report(results, file=sys.stdout):
+    cols = ('variant', 'xwidth', 'nwidth', 'fifo_depth', 'printer_depth', 'divisor')
+    print('%-10s %6s %6s %6s %6s %4s | %11s %6s %6s %7s | %7s %10s %10s' % (
+        'variant', 'xwidth', 'nwidth', 'fifo', 'print', 'div',
+        'LC', 'LUT4', 'RAM', 'Fmax', 'cycles', 'seeds/s', '@Fmax'), file=file)
+    for (config, res) in results:
+        if 'lc' in res:
+            used = '%5d/%5d %6s %2d/%3d %7.2f' % (res['lc'], res['lc_total'], res.get('lut4', '-'),
+                                                 res.get('ram', 0), res.get('ram_total', 0), res.get('fmax', 0))
+        else:
+            used = '%-33s' % res.get('error', 'not built')[:33]
+        print('%-10s %6d %6d %6d %6d %4d | %s | %7.2f %10.0f %10s%s' % (
+            tuple(config[c] for c in cols) + (used, res['cycles'], res['seeds_per_second'],
+            '%.0f' % res['seeds_per_second_fmax'] if 'seeds_per_second_fmax' in res else '-',
+            '' if res.get('fits', True) else '  does not fit')), file=file)
+    best = [r for r in results if r[1].get('fits')]
+    if best:
+        print('fastest that fits: %s' % ' '.join('%s=%s' % (c, best[0][0][c]) for c in cols), file=file)
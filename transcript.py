@@ -0,0 +1,160 @@
+# Host side decoding of the byte stream printed by UART_Printer, as driven by
+# collatz_driver.Top:
+#
+#   "<index> <length> <seed> \r\n\a"   new record (length is the delay)
+#   "N <out> <seed> \r\n\a"            counter exhausted (err_n)
+#   "X <out> <seed> \r\n\a"            overflow (err_x)
+#
+# With the fallback unit (collatz_driver.FALLBACK) the seeds the core gave up
+# on come back later, out of seed order, and the N and X lines are those the
+# fallback gave up on as well:
+#
+#   "F <index> <length> <seed> \r\n\a"  record of a fallback seed; records
+#                                       printed since may not be records
+#                                       any more (collatz_ref.in_order)
+#
+# or, in the glide scan ('G', with the N, X and F lines above):
+#
+#   "G <index> <glide> <seed> \r\n\a"  new glide record
+#   "V <seed> \r\n\a"                  heartbeat: all seeds up to here fell
+#                                       below themselves, but the N/X ones
+#
+# and, in reply to the host commands of collatz_client.py:
+#
+#   "Q <out> <seed> <flags> \r\n\a"    one seed, flags: 1 err_n, 2 err_x
+#   "E <length> <seed> \r\n\a"         end of a range, its longest delay
+#   "S <seeds> <length> <seed> \r\n\a" status: seeds done, longest so far
+#   "T <out> <seed> <x> ... \r\n\a"   trajectory, low 32 bits of each x, hex
+#   "P <out> <seed> <word> ... \r\n\a" trajectory, parity bits, hex words
+#   "? <command> \r\n\a"               rejected: Q/T/P/R of seed 0, or an
+#                                       R ending above 2**xwidth
+#
+# XON/XOFF (see uart_fifo.py) are flow control only and are dropped here.
+
+XON  = 0x11 # same as uart_fifo.XON
+XOFF = 0x13 # same as uart_fifo.XOFF
+BEL  = 0x07
+
+def parse_line(line):
+    # returns ('R', index, length, seed), ('N', out, seed), ('X', out, seed),
+    # ('F', index, length, seed), ('G', index, glide, seed), ('V', seed),
+    # ('Q', out, seed, flags), ('E', length, seed), ('S', seeds, length, seed),
+    # ('T'/'P', out, seed, (values or words)), ('?', command),
+    # or None for anything else (e.g. partial or garbled lines)
+    f = line.split()
+    try:
+        if len(f) >= 3 and f[0] in ('T', 'P'):
+            return (f[0], int(f[1]), int(f[2]), tuple(int(v, 16) for v in f[3:]))
+        if len(f) == 3 and f[0] in ('N', 'X', 'E'):
+            return (f[0], int(f[1]), int(f[2]))
+        if len(f) == 4 and f[0] in ('Q', 'S', 'G', 'F'):
+            return (f[0], int(f[1]), int(f[2]), int(f[3]))
+        if len(f) == 2 and f[0] == '?':
+            return ('?', f[1])
+        if len(f) == 2 and f[0] == 'V':
+            return ('V', int(f[1]))
+        if len(f) == 3:
+            return ('R', int(f[0]), int(f[1]), int(f[2]))
+    except ValueError:
+        pass
+    return None
+
+class Transcript:
+    def __init__(self):
+        self.nbytes  = 0  # all bytes seen, including flow control
+        self.nbells  = 0
+        self.nxoff   = 0
+        self.nxon    = 0
+        self.lines   = [] # decoded text lines, without CR, LF, BEL
+        self.records = [] # (index, length, seed)
+        self.errors  = [] # (kind, out, seed), kind is 'N' or 'X'
+        self.glides  = [] # (index, glide, seed)
+        self.late    = [] # (index, length, seed) of the F lines
+        self.verified = 0 # seed of the last heartbeat
+        self.other   = [] # lines that did not parse
+        self.events  = [] # parse_line() results in arrival order, see drain()
+        self._line   = bytearray()
+
+    def feed(self, data):
+        for b in data:
+            self.nbytes += 1
+            if b == XON:
+                self.nxon += 1
+            elif b == XOFF:
+                self.nxoff += 1
+            elif b == BEL:
+                self.nbells += 1
+            elif b == 13: # CR
+                pass
+            elif b == 10: # LF
+                self._end_line()
+            else:
+                self._line.append(b)
+
+    def _end_line(self):
+        line = self._line.decode('ascii', errors='replace').strip()
+        self._line = bytearray()
+        self.lines.append(line)
+        v = parse_line(line)
+        if v is None:
+            self.other.append(line)
+        elif v[0] == 'R':
+            self.records.append(v[1:])
+        elif v[0] in ('N', 'X'):
+            self.errors.append(v)
+        elif v[0] == 'G':
+            self.glides.append(v[1:])
+        elif v[0] == 'F':
+            self.late.append(v[1:])
+        elif v[0] == 'V':
+            self.verified = v[1]
+        if v is not None:
+            self.events.append(v)
+        return v
+
+    def drain(self):
+        # events since the last drain(); forgets the lines, records, errors
+        # and events kept so far, so long running readers stay small
+        events = self.events
+        self.lines   = []
+        self.records = []
+        self.errors  = []
+        self.glides  = []
+        self.late    = []
+        self.other   = []
+        self.events  = []
+        return events
+
+    def partial(self):
+        # text of the last, not yet terminated line
+        return self._line.decode('ascii', errors='replace')
+
+    def write(self, transcript_file, records_file):
+        with open(transcript_file, 'w') as f:
+            for line in self.lines:
+                f.write(line + '\n')
+            if self._line:
+                f.write(self.partial() + '\n')
+        with open(records_file, 'w') as f:
+            for (i, n, x) in self.records:
+                f.write('%d %d %d\n' % (i, n, x))
+
+    def stats(self, seconds):
+        # throughput over 'seconds' of (simulated) time
+        nrec = len(self.records)
+        return {
+            'bytes': self.nbytes,
+            'records': nrec,
+            'errors': len(self.errors),
+            'seconds': seconds,
+            'records_per_second': nrec / seconds if seconds else 0.0,
+            'bytes_per_record': self.nbytes / nrec if nrec else 0.0,
+        }
+
+def sim_collect(transcript, uart):
+    # passive pysim sync process, feeds every byte handed to the UART (model)
+    # for transmission, i.e. what leaves w_fifo plus XON/XOFF, into transcript
+    while True:
+        if (yield uart.tx_rdy):
+            transcript.feed([(yield uart.tx_data)])
+        yield
@@ -1,21 +1,39 @@
 from nmigen import *
-from nmigen.back import pysim, verilog
-from nmigen.cli import main
 from nmigen.lib.fifo import *
-from nmigen_boards.icebreaker import ICEBreakerPlatform
 
-from uart_wrapper_nmigen import UART
+from spram import SPRAMFIFO
+from uart_wrapper_nmigen import UART, DIVISOR
 from uart_wrapper_sim import UART_SIM
 
+# software flow control characters, see
+# https://en.wikipedia.org/wiki/Software_flow_control
+XON  = 0x11 # DC1, host may resume sending
+XOFF = 0x13 # DC3, host must pause sending
+
 class UART_FIFO(Elaboratable):
-    def __init__(self, sim, sim_tx_cycle_accurate, width, depth, clk, board_uart):
+    def __init__(self, sim, sim_tx_cycle_accurate, width, depth, clk, board_uart,
+                 xoff_level=None, xon_level=None, sim_tx_cycles=None, divisor=DIVISOR,
+                 backlog=None):
         self.sim = sim
         self.sim_tx_cycle_accurate = sim_tx_cycle_accurate
+        self.sim_tx_cycles = sim_tx_cycles # None: UART_SIM default
+
+        # r_fifo watermarks for XON/XOFF backpressure. The headroom above
+        # xoff_level has to absorb whatever the host (and its USB serial
+        # chip) still has in flight after it saw the XOFF.
+        if xoff_level is None:
+            xoff_level = depth - depth // 4 # e.g. 768 of 1024
+        if xon_level is None:
+            xon_level = depth // 4 # e.g. 256 of 1024
+        assert 0 <= xon_level < xoff_level <= depth
+        self.xoff_level = xoff_level
+        self.xon_level = xon_level
 
         self.tx = Signal() # output from uart_fifo to host, fed by t_fifo
         self.tx_active = Signal() # high while busy transmitting data
         self.tx_done = Signal() # high for one cycle, after tx completed
         self.rx = Signal() # input to uart_fifo from host, feeds r_fifo
+        self.xoff = Signal() # high while the host is paused (XOFF sent, XON pending)
 
         # data coming into the fifo_uart from the host
         #   -- TODO use r_port record in the future
@@ -31,12 +49,19 @@ class UART_FIFO(Elaboratable):
 
         # internal
         if not self.sim:
-            self.uart = UART(clk, board_uart)
-        else:
+            self.uart = UART(clk, board_uart, divisor)
+        elif self.sim_tx_cycles is None:
             self.uart = UART_SIM()
+        else:
+            self.uart = UART_SIM(cycles=self.sim_tx_cycles)
 
         self.r_fifo = SyncFIFOBuffered(width=width, depth=depth)
-        self.w_fifo = SyncFIFOBuffered(width=width, depth=depth)
+        if backlog is None:
+            self.w_fifo = SyncFIFOBuffered(width=width, depth=depth)
+        else:
+            # a w_fifo of 'backlog' bytes in SPRAM instead of block RAM,
+            # e.g. 32768 to keep the records of a slow host
+            self.w_fifo = SPRAMFIFO(width=width, depth=backlog)
 
     def elaborate(self, platform):
         m = Module()
@@ -63,13 +88,14 @@ class UART_FIFO(Elaboratable):
         ]
         # host to device loop
         with m.FSM(reset='AWAIT_UART_DATA') as fsm_rd_from_host:
+            self.fsm_rd_from_host = fsm_rd_from_host # for sim_trace.EventLog
             with m.State('AWAIT_UART_DATA'):
-                # TODO send backpresure to host if r_fifo is close to full:
-                # [Use the fifo's .level signal to gauge 'close to full'
-                # and pause the sender ahead of the overrun!]
-                # Use SW flow control (send XOFF/XON)
+                # backpressure to the host is sent by fsm_wr_to_host (XOFF/XON
+                # based on r_fifo.level), the host has to honor it, e.g.
+                # pyserial's xonxoff=True or miniterm's --xonxoff.
                 # See https://pyserial.readthedocs.io/en/latest/pyserial_api.html
-                # and https://en.wikipedia.org/wiki/Software_flow_control
+                # A byte that arrives while r_fifo is full (the host ignored
+                # our XOFF) is dropped.
                 with m.If(self.uart.rx_rdy & self.r_fifo.w_rdy):
                     m.d.comb += [
                         self.r_fifo.w_data.eq(self.uart.rx_data),
@@ -78,9 +104,29 @@ class UART_FIFO(Elaboratable):
                     m.next = 'AWAIT_UART_DATA' # LOOP
         # device to host loop
         with m.FSM(reset='AWAIT_FIFO_DATA') as fsm_wr_to_host:
+            self.fsm_wr_to_host = fsm_wr_to_host # for sim_trace.EventLog
             with m.State('AWAIT_FIFO_DATA'):
+                # flow control characters go out ahead of any w_fifo data
+                with m.If(~self.xoff & (self.r_fifo.level >= self.xoff_level) & ~self.uart.tx_active):
+                    m.d.comb += [
+                        self.uart.tx_data.eq(XOFF),
+                        self.uart.tx_rdy.eq(1),
+                    ]
+                    m.d.sync += [
+                        self.xoff.eq(1)
+                    ]
+                    m.next = 'AWAIT_FIFO_DATA_COMPLETE'
+                with m.Elif(self.xoff & (self.r_fifo.level <= self.xon_level) & ~self.uart.tx_active):
+                    m.d.comb += [
+                        self.uart.tx_data.eq(XON),
+                        self.uart.tx_rdy.eq(1),
+                    ]
+                    m.d.sync += [
+                        self.xoff.eq(0)
+                    ]
+                    m.next = 'AWAIT_FIFO_DATA_COMPLETE'
                 # checks to see if uart is ready to transmit data
-                with m.If(self.w_fifo.r_rdy & ~self.uart.tx_active):
+                with m.Elif(self.w_fifo.r_rdy & ~self.uart.tx_active):
                     m.d.comb += [
                         self.uart.tx_data.eq(self.w_fifo.r_data),
                         self.uart.tx_rdy.eq(1),
@@ -98,6 +144,10 @@ class UART_FIFO(Elaboratable):
                             self.w_fifo.r_en.eq(1)
                         ]
                     m.next = 'AWAIT_FIFO_DATA_COMPLETE'
+                # UART_SIM(cycles=1) strobes tx_done in the same cycle, keep
+                # going without the detour through AWAIT_FIFO_DATA_COMPLETE
+                with m.If(self.uart.tx_done):
+                    m.next = 'AWAIT_FIFO_DATA'
             with m.State('AWAIT_FIFO_DATA_COMPLETE'):
                 # wait until uart is done transmitting data
                 with m.If(self.uart.tx_done):
@@ -117,3 +167,6 @@ class UART_FIFO(Elaboratable):
 #                |       (wr port)    |
 #                +--------------------+
 #
+#     fsm_wr_to_host also injects XOFF/XON into tx, ahead of the w_fifo data,
+#     when r_fifo.level crosses xoff_level/xon_level.
+#
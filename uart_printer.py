@@ -1,14 +1,14 @@
 from nmigen import *
-from nmigen.back import pysim, verilog
-from nmigen.cli import main
 from nmigen.lib.fifo import *
-from nmigen_boards.icebreaker import ICEBreakerPlatform
 
 from bcd import BCD1_32
 
 import argparse
+import contextlib
+import sys
 
 maxn = len(Const(9999999999)) # single digit billions, needs 34 bits
+INPUT_FIFO_DEPTH = 128 # commands, see UART_Printer.writable
 
 class Hex8Decoder(Elaboratable):
     def __init__(self):
@@ -33,7 +33,7 @@ class Hex8Decoder(Elaboratable):
         return m
 
 class UART_Printer(Elaboratable):
-    def __init__(self, uartfifo):
+    def __init__(self, uartfifo, depth=INPUT_FIFO_DEPTH):
         # write interface
         self.we = Signal()
         self.din = Signal(3+maxn)
@@ -42,7 +42,7 @@ class UART_Printer(Elaboratable):
         self.uartfifo = uartfifo # uart to host fifo
 
         # internal state
-        self.inputfifo = SyncFIFOBuffered(width=3+maxn, depth=128)
+        self.inputfifo = SyncFIFOBuffered(width=3+maxn, depth=depth)
         # helpers
         self.cmd  = Signal(3)
         self.data = Signal(maxn)
@@ -84,6 +84,7 @@ class UART_Printer(Elaboratable):
             self.writable.eq(self.inputfifo.w_rdy)
         ]
         with m.FSM(reset='READY') as fsm:
+            self.fsm = fsm # for sim_trace.EventLog
             with m.State('READY'):
                 with m.If( (self.inputfifo.r_rdy) & (self.uartfifo.w_rdy) ):
                     m.d.comb += [
@@ -432,21 +433,27 @@ class Top(Elaboratable):
         return m
 
 def p():
+    from nmigen_boards.icebreaker import ICEBreakerPlatform
     # depth >4 leads to use of memory (4k primitive, see build/top.rpt)
     top = Top(sim=False)
     platform = ICEBreakerPlatform()
     platform.build(top, do_program=True)
 
 def g():
+    from nmigen_boards.icebreaker import ICEBreakerPlatform
+    from nmigen.back import verilog
     top = Top(sim=False)
     platform = ICEBreakerPlatform()
     print(verilog.convert(top, ports=[], platform=platform))
 
 def s():
+    from nmigen.back import pysim
+    from transcript import Transcript
     # Note: direct_mode true/false -> exact same vcd!
     top = Top(sim=True)
     platform = None
     fragment = Fragment.get(top, platform=platform)
+    transcript = Transcript()
     with open("top.vcd", "w") as vcd_file:
         with pysim.Simulator(fragment, vcd_file=vcd_file) as sim:
             sim.add_clock(83e-9)
@@ -538,22 +545,37 @@ def s():
                     while not (yield top.b_fifo.readable):
                         yield
                     v = yield from top.b_fifo.read()
-                    print(v)
+                    transcript.feed([v])
 
             sim.add_sync_process(driver_proc())
             sim.add_sync_process(rcv_proc())
             sim.run_until(10e-6, run_passive=True)
+    for line in transcript.lines:
+        print(repr(line))
+    print(repr(transcript.partial()))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true",
+                        help="report the elaboration time per submodule, lowering, compilation and peak memory on stderr")
     p_action = parser.add_subparsers(dest="action")
     p_action.add_parser("simulate")
     p_action.add_parser("generate")
     p_action.add_parser("program")
+    p_action.add_parser("test", help="check the printed bytes of all commands (see regression.py)")
     args = parser.parse_args()
-    if args.action == "generate":
-        g()
-    elif args.action == "simulate":
-        s()
-    elif args.action == "program":
-        p()
+    if args.profile:
+        import elab_profile
+        profile = elab_profile.Profile()
+    else:
+        profile = contextlib.nullcontext()
+    with profile:
+        if args.action == "generate":
+            g()
+        elif args.action == "simulate":
+            s()
+        elif args.action == "program":
+            p()
+        elif args.action == "test":
+            import regression
+            sys.exit(1 if regression.main(['printer'], workers=0) else 0)
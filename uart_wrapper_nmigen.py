@@ -2,10 +2,13 @@ from nmigen import *
 
 from uart_nmigen import UART_NMIGEN
 
+DIVISOR = 4 # 12MHz / 3000000 baud = 4, see the alternatives in UART.elaborate
+
 class UART(Elaboratable):
-    def __init__(self, clk12, board_uart):
+    def __init__(self, clk12, board_uart, divisor=DIVISOR):
         self.clk     = clk12
         self.board_uart = board_uart
+        self.divisor = divisor # clock cycles per bit
 
         self.tx      = Signal()
         self.tx_data = Signal(8)
@@ -26,7 +29,7 @@ class UART(Elaboratable):
         # uart_nmigen = UART_NMIGEN(104) # 12MHz / 115200 baud = 104
         # uart_nmigen = UART_NMIGEN(26) # 12MHz / 460800 baud = 26
         # uart_nmigen = UART_NMIGEN(10) # 12MHz / 1228800 baud = 10 (9.7), ~122kB/s [8+start+stop bits)
-        uart_nmigen = UART_NMIGEN(4) # 12MHz / 3000000 baud = 4, ~300kB/s [8+start+stop bits)
+        uart_nmigen = UART_NMIGEN(self.divisor) # DIVISOR: 12MHz / 3000000 baud = 4, ~300kB/s [8+start+stop bits)
         m.d.sync += [
             self.tx_ack_old.eq(uart_nmigen.tx_ack),
             self.rx_rdy_old.eq(uart_nmigen.rx_rdy)
@@ -27,8 +27,22 @@ class Counter(Elaboratable):
                 m.d.sync += self.v.eq(self.v + 1)
         return m
 
+def nmigen_cycles(divisor, data_bits=8):
+    # cycles per byte of UART_NMIGEN(divisor) behind the UART wrapper, from
+    # tx_rdy to the tx_done strobe (inclusive): start + data + stop bits at
+    # 'divisor' cycles each, plus the load cycle and the tx_done edge detect.
+    return (1 + data_bits + 1) * divisor + 2
+
 class UART_SIM(Elaboratable):
-    def __init__(self):
+    # Transaction level UART model. A byte takes 'cycles' cycles from tx_rdy
+    # to the tx_done strobe (inclusive), down to 1 where tx_done is strobed
+    # in the same cycle as tx_rdy. Use nmigen_cycles(divisor) to match the
+    # bit timing of UART_NMIGEN exactly. The default (107) is the original
+    # 115200 baud approximation.
+    def __init__(self, cycles=107):
+        assert cycles >= 1
+        self.cycles = cycles
+
         self.tx        = Signal()
         self.tx_active = Signal()
         self.tx_done   = Signal()
@@ -39,12 +53,16 @@ class UART_SIM(Elaboratable):
         self.rx_data   = Signal(8)
         self.rx_rdy    = Signal() # was nandland rx_dv
 
-        # FIXME: make 104 configurable
-        self.cnt       = Counter(Const(104)) # floor(12MHz / 115200) = 104
+        if cycles >= 3:
+            # tx_rdy cycle, rr+1 active cycles, tx_done cycle
+            self.cnt   = Counter(Const(cycles - 3))
+        else:
+            self.cnt   = None
 
     def elaborate(self, platform):
         m = Module()
-        m.submodules.cnt = self.cnt
+        if self.cnt:
+            m.submodules.cnt = self.cnt
         # simulate tx somewhat realistically in term of
         # active and done signals, which are needed
         # for proper flow control with sending
@@ -58,24 +76,32 @@ class UART_SIM(Elaboratable):
         with m.FSM(reset='TX_AWAIT_START') as fsm:
             with m.State('TX_AWAIT_START'):
                 with m.If(self.tx_rdy):
-                    m.d.comb += [
-                        self.cnt.start.eq(1)
-                    ]
-                    m.d.sync += [
-                        self.tx_active.eq(1)  # assert tx_active
-                    ]
-                    m.next = 'TX_SEND_ACTIVE'
-            with m.State('TX_SEND_ACTIVE'):
-                with m.If(~self.cnt.done):
-                    m.d.comb += [
-                        self.cnt.inc.eq(1),
-                    ]
-                    m.next = 'TX_SEND_ACTIVE'
-                with m.Else():
-                    m.d.sync += [
-                        self.tx_active.eq(0)
-                    ]
-                    m.next = 'TX_DONE'
+                    if self.cycles == 1:
+                        m.d.comb += [
+                            self.tx_done.eq(1) # strobe, same cycle
+                        ]
+                    elif self.cycles == 2:
+                        m.next = 'TX_DONE'
+                    else:
+                        m.d.comb += [
+                            self.cnt.start.eq(1)
+                        ]
+                        m.d.sync += [
+                            self.tx_active.eq(1)  # assert tx_active
+                        ]
+                        m.next = 'TX_SEND_ACTIVE'
+            if self.cnt:
+                with m.State('TX_SEND_ACTIVE'):
+                    with m.If(~self.cnt.done):
+                        m.d.comb += [
+                            self.cnt.inc.eq(1),
+                        ]
+                        m.next = 'TX_SEND_ACTIVE'
+                    with m.Else():
+                        m.d.sync += [
+                            self.tx_active.eq(0)
+                        ]
+                        m.next = 'TX_DONE'
             with m.State('TX_DONE'):
                 m.d.comb += [
                     self.tx_done.eq(1) # strobe
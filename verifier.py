@@ -0,0 +1,133 @@
+import concurrent.futures
+import random
+
+from collatz_ref import delay
+
+# Background check of what the board reports, against collatz_ref (Python
+# integers, so exact at any seed) in a pool of worker processes.
+#
+# Every record (and glide record) is checked, N/X errors and Q replies only with probability
+# 'fraction'. submit() only appends to a batch; full batches go to the pool
+# and results are picked up by poll(), so the caller (e.g. record_log's
+# ingest loop) never waits for a check. If more than max_batches batches
+# are outstanding, sampled events are skipped (counted in self.skipped)
+# rather than slowing the caller down; records are always queued.
+#
+# With the fallback unit (collatz_driver.FALLBACK, None: a board without
+# one) F records and the N/X errors are those of the fallback's widths.
+
+def _expected(ev, xwidth, nwidth, fallback=None, glide=False):
+    # the event as the board should have reported it
+    # (the N/X of a glide scan are checked as full delays: the glide is a
+    # prefix of the trajectory, it fails the same way or not at all)
+    if fallback and ev[0] in ('F', 'N', 'X'):
+        (xwidth, nwidth) = fallback
+    (out, err_x, err_n, _) = delay(ev[-1] if ev[0] != 'Q' else ev[2], xwidth, nwidth,
+                                   glide=ev[0] == 'G' or (ev[0] == 'F' and glide))
+    if ev[0] in ('R', 'G', 'F'):
+        return (ev[0], ev[1], out, ev[3]) if not (err_x or err_n) else (('N' if err_n else 'X'), out, ev[3])
+    if ev[0] in ('N', 'X'):
+        if err_n or err_x:
+            return ('N' if err_n else 'X', out, ev[2])
+        return ('ok', out, ev[2])
+    return ('Q', out, ev[2], err_n | err_x << 1)
+
+def _check(batch, xwidth, nwidth, fallback=None, glide=False):
+    # worker: [(observed, expected)] of the events in batch that differ
+    bad = []
+    for ev in batch:
+        exp = _expected(ev, xwidth, nwidth, fallback, glide)
+        if exp != ev:
+            bad.append((ev, exp))
+    return bad
+
+class Verifier:
+    def __init__(self, xwidth=34, nwidth=12, fraction=0.01, workers=None,
+                 batch=256, max_batches=64, seed=None, fallback=(64, 16)):
+        self.xwidth = xwidth
+        self.nwidth = nwidth
+        self.fallback = fallback
+        self.fraction = fraction
+        self.batch_size = batch
+        self.max_batches = max_batches
+        self.random = random.Random(seed)
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        self.batch = []
+        self.outstanding = []
+        self.checked = 0
+        self.skipped = 0
+        self.mismatches = [] # (observed event, expected event)
+        self.new = [] # mismatches not returned by poll() yet
+        self.nmax = 0 # the records' lengths have to grow
+        self.gmax = 0 # and those of the glide records
+        self.glide = False # a G record was seen, F records are glides
+
+    def submit(self, ev):
+        # ev: a transcript.parse_line() result ('R', 'G', 'F', 'N', 'X' or 'Q')
+        if ev[0] == 'R':
+            if ev[2] <= self.nmax:
+                self.new.append((ev, ('R', ev[1], '> %d' % self.nmax, ev[3])))
+            self.nmax = max(self.nmax, ev[2])
+        elif ev[0] == 'G':
+            if ev[2] <= self.gmax:
+                self.new.append((ev, ('G', ev[1], '> %d' % self.gmax, ev[3])))
+            self.gmax = max(self.gmax, ev[2])
+            if not self.glide:
+                # the batch so far was checked as a delay scan
+                self.flush()
+                self.glide = True
+        elif ev[0] == 'F':
+            # late, it only has to beat the seeds before it (see
+            # collatz_ref.in_order); the records after it have to beat it
+            if self.glide:
+                self.gmax = max(self.gmax, ev[2])
+            else:
+                self.nmax = max(self.nmax, ev[2])
+        elif ev[0] not in ('N', 'X', 'Q') or self.random.random() >= self.fraction:
+            return
+        elif len(self.outstanding) >= self.max_batches:
+            self.skipped += 1
+            return
+        self.batch.append(ev)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.outstanding.append((len(self.batch), self.pool.submit(
+                _check, self.batch, self.xwidth, self.nwidth, self.fallback, self.glide)))
+            self.batch = []
+
+    def poll(self):
+        # mismatches found since the last poll(); a partial batch is sent
+        # off when the pool is idle
+        if not self.outstanding:
+            self.flush()
+        keep = []
+        for (n, fut) in self.outstanding:
+            if fut.done():
+                self.checked += n
+                self.new.extend(fut.result())
+            else:
+                keep.append((n, fut))
+        self.outstanding = keep
+        (new, self.new) = (self.new, [])
+        self.mismatches.extend(new)
+        return new
+
+    def close(self):
+        # waits for the remaining checks, returns their mismatches like poll()
+        self.flush()
+        for (n, fut) in self.outstanding:
+            self.checked += n
+            self.new.extend(fut.result())
+        self.outstanding = []
+        self.pool.shutdown()
+        (new, self.new) = (self.new, [])
+        self.mismatches.extend(new)
+        return new
+
+def format_mismatch(m):
+    (ev, exp) = m
+    return 'seed %d: board %s, expected %s' % (ev[-1] if ev[0] != 'Q' else ev[2],
+                                               ' '.join(map(str, ev)), ' '.join(map(str, exp)))
@@ -0,0 +1,132 @@
+import os
+import select
+import sys
+import time
+import tty
+
+from soft_board import SoftBoard
+
+# A pseudo-terminal that behaves like the board's serial port, for miniterm,
+# record_log.py, collatz_client.py etc. without hardware.
+#
+# soft: soft_board.SoftBoard answers; replies are held back for the cycles
+#       the board would compute at 'clock' and leave at the link rate
+#       (10 bits per byte at 'baud').
+# sim:  the pysim simulation of collatz_driver.Top; host bytes are driven
+#       into uart.rx_data/rx_rdy, whatever the UART model takes from w_fifo
+#       (XON/XOFF included) goes back. Much slower than the board.
+
+def open_pty(link=None):
+    # (master fd, slave path); link: also make a symlink to the slave there
+    (master, slave) = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if link:
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(path, link)
+    return (master, slave, path)
+
+def read_available(fd):
+    # whatever the host wrote, b'' if nothing
+    if not select.select([fd], [], [], 0)[0]:
+        return b''
+    try:
+        return os.read(fd, 1 << 16)
+    except OSError: # EIO while no one has the slave open
+        return b''
+
+def run_soft(master, baud=3000000, clock=12e6, xwidth=34, nwidth=12):
+    board = SoftBoard(xwidth, nwidth)
+    rate = baud / 10 # bytes/s
+    pending = [] # [ready time, bytes]: replies not yet (fully) sent
+    busy = time.time() # until when the board computes
+    last = time.time()
+    while True:
+        timeout = 0.001 if pending or board.scanning else 0.1
+        if select.select([master], [], [], timeout)[0]:
+            for (reply, cycles) in board.feed(read_available(master)):
+                busy = max(busy, time.time()) + cycles / clock
+                pending.append([busy, reply])
+        if board.scanning and len(pending) < 4:
+            (reply, cycles) = board.scan(1 << 10)
+            busy = max(busy, time.time()) + cycles / clock
+            pending.append([busy, reply])
+        now = time.time()
+        budget = int((now - last) * rate)
+        if budget == 0:
+            continue
+        last = now
+        while pending and pending[0][0] <= now and budget > 0:
+            data = pending[0][1][:budget]
+            os.write(master, data)
+            budget -= len(data)
+            pending[0][1] = pending[0][1][len(data):]
+            if not pending[0][1]:
+                pending.pop(0)
+
+def run_sim(master, model=False, latency=None, tx_cycles=1):
+    from nmigen import Fragment
+    from nmigen.back import pysim
+    from collatz_driver import Top, xwidth, nwidth
+    from collatz_model import CollatzModel
+    from sim_trace import deep_memories
+
+    collatz = CollatzModel(xwidth, nwidth, latency=latency) if model else None
+    top = Top(sim=True, sim_tx_cycle_accurate=True, xwidth=xwidth, nwidth=nwidth,
+              sim_tx_cycles=tx_cycles, collatz=collatz)
+    fragment = Fragment.get(top, platform=None)
+    uart = top.uartfifo.uart
+    deep_memories()
+    with pysim.Simulator(fragment) as sim:
+        sim.add_clock(83e-9)
+        def host_proc():
+            # polls the pty every 64 cycles, one host byte per cycle
+            while True:
+                for b in read_available(master):
+                    yield uart.rx_data.eq(b)
+                    yield uart.rx_rdy.eq(1)
+                    yield
+                yield uart.rx_rdy.eq(0)
+                for _ in range(64):
+                    yield
+        def board_proc():
+            while True:
+                if (yield uart.tx_rdy):
+                    os.write(master, bytes([(yield uart.tx_data)]))
+                yield
+        sim.add_sync_process(host_proc())
+        sim.add_sync_process(board_proc())
+        if model:
+            sim.add_sync_process(collatz.process())
+        sim.run()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["soft", "sim"], default="soft")
+    parser.add_argument("--link", default=None,
+                        help="also reach the pty under this name, e.g. /tmp/ttyCOLLATZ")
+    parser.add_argument("--baud", type=int, default=3000000,
+                        help="soft: link rate (default: %(default)s)")
+    parser.add_argument("--clock", type=float, default=12e6,
+                        help="soft: board clock (default: %(default)s)")
+    parser.add_argument("--model", action="store_true",
+                        help="sim: replace the Collatz core by its Python functional model")
+    parser.add_argument("--latency", type=int, default=None,
+                        help="sim --model: cycles per seed (default: as many as the core)")
+    parser.add_argument("--tx-cycles", type=int, default=1,
+                        help="sim: cycles per UART byte (default: %(default)s)")
+    args = parser.parse_args()
+    (master, slave, path) = open_pty(args.link)
+    print('board on %s%s' % (path, ' (%s)' % args.link if args.link else ''), file=sys.stderr, flush=True)
+    try:
+        if args.backend == "soft":
+            run_soft(master, args.baud, args.clock)
+        else:
+            run_sim(master, args.model, args.latency, args.tx_cycles)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)